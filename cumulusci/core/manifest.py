@@ -0,0 +1,167 @@
+''' An in memory model of the types and members of a package.xml
+
+PackageManifest keeps the members of each metadata type in a set so
+membership checks and diffs stay linear for packages with tens of
+thousands of members.
+
+    old = PackageManifest.parse('org/package.xml')
+    new = PackageManifest.parse('src/package.xml')
+    diff = old.diff(new)
+    destructive_changes = diff.render_destructive_changes()
+'''
+
+import urllib
+from xml.sax.saxutils import escape
+import xml.etree.ElementTree as ET
+
+NAMESPACE = 'http://soap.sforce.com/2006/04/metadata'
+
+
+def _tag(name):
+    return '{%s}%s' % (NAMESPACE, name)
+
+
+class PackageManifest(object):
+    ''' The metadata types and members of a package.xml '''
+
+    def __init__(self, types=None, api_version=None, package_name=None,
+                 install_class=None, uninstall_class=None):
+        self.types = {}
+        self.api_version = api_version
+        self.package_name = package_name
+        self.install_class = install_class
+        self.uninstall_class = uninstall_class
+        if types:
+            for metadata_type, members in types.items():
+                self.add(metadata_type, members)
+
+    @classmethod
+    def parse(cls, source):
+        ''' Parses a package.xml from a path or file object
+
+        Each <types> element is discarded once read so large manifests are
+        never held as a full element tree.
+        '''
+        manifest = cls()
+        for event, elem in ET.iterparse(source):
+            if elem.tag == _tag('types'):
+                name = elem.find(_tag('name'))
+                if name is not None and name.text:
+                    manifest.add(name.text, [
+                        member.text for member in elem.findall(_tag('members'))
+                        if member.text
+                    ])
+                elem.clear()
+            elif elem.tag == _tag('version'):
+                manifest.api_version = elem.text
+            elif elem.tag == _tag('fullName'):
+                if elem.text:
+                    manifest.package_name = urllib.unquote(elem.text)
+            elif elem.tag == _tag('postInstallClass'):
+                manifest.install_class = elem.text
+            elif elem.tag == _tag('uninstallClass'):
+                manifest.uninstall_class = elem.text
+        return manifest
+
+    def __contains__(self, item):
+        metadata_type, member = item
+        return member in self.types.get(metadata_type, ())
+
+    def __nonzero__(self):
+        return bool(self.types)
+
+    def add(self, metadata_type, members=None):
+        self.types.setdefault(metadata_type, set()).update(members or ())
+
+    def get_members(self, metadata_type):
+        return self.types.get(metadata_type, set())
+
+    def difference(self, other):
+        ''' Returns a manifest of the members not in other '''
+        manifest = self._copy_header()
+        for metadata_type, members in self.types.items():
+            members = members.difference(other.get_members(metadata_type))
+            if members:
+                manifest.types[metadata_type] = members
+        return manifest
+
+    def intersection(self, other):
+        ''' Returns a manifest of the members also in other '''
+        manifest = self._copy_header()
+        for metadata_type, members in self.types.items():
+            members = members.intersection(other.get_members(metadata_type))
+            if members:
+                manifest.types[metadata_type] = members
+        return manifest
+
+    def diff(self, other):
+        ''' Returns a ManifestDiff of the changes from self to other '''
+        return ManifestDiff(self, other)
+
+    def _copy_header(self):
+        return PackageManifest(
+            api_version=self.api_version,
+            package_name=self.package_name,
+            install_class=self.install_class,
+            uninstall_class=self.uninstall_class,
+        )
+
+    def render(self, api_version=None, type_key=None, member_key=None):
+        ''' Returns the package.xml
+
+        Types are sorted by type_key and members by member_key, both default
+        to sorting by name.
+        '''
+        if api_version is None:
+            api_version = self.api_version
+
+        lines = []
+
+        # Print header
+        lines.append(u'<?xml version="1.0" encoding="UTF-8"?>')
+        lines.append(u'<Package xmlns="{}">'.format(NAMESPACE))
+        if self.package_name:
+            package_name_encoded = urllib.quote(self.package_name, safe=' ')
+            lines.append(u'    <fullName>{0}</fullName>'.format(package_name_encoded))
+
+        if self.install_class:
+            lines.append(u'    <postInstallClass>{0}</postInstallClass>'.format(self.install_class))
+
+        if self.uninstall_class:
+            lines.append(u'    <uninstallClass>{0}</uninstallClass>'.format(self.uninstall_class))
+
+        # Print types sections
+        for metadata_type in sorted(self.types, key=type_key):
+            lines.append(u'    <types>')
+            for member in sorted(self.types[metadata_type], key=member_key):
+                lines.append(u'        <members>{0}</members>'.format(escape(member)))
+            lines.append(u'        <name>{0}</name>'.format(metadata_type))
+            lines.append(u'    </types>')
+
+        # Print footer
+        lines.append(u'    <version>{0}</version>'.format(api_version))
+        lines.append(u'</Package>')
+
+        return u'\n'.join(lines)
+
+
+class ManifestDiff(object):
+    ''' The members added, removed and unchanged between two manifests '''
+
+    def __init__(self, old, new):
+        self.old = old
+        self.new = new
+        self.added = new.difference(old)
+        self.removed = old.difference(new)
+        self.unchanged = old.intersection(new)
+
+    def __nonzero__(self):
+        return bool(self.added or self.removed)
+
+    def render_destructive_changes(self, api_version=None):
+        ''' Returns a destructiveChanges.xml for the removed members or None '''
+        if not self.removed:
+            return
+        if api_version is None:
+            api_version = self.new.api_version or self.old.api_version
+        return PackageManifest(self.removed.types).render(api_version)
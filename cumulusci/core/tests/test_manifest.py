@@ -0,0 +1,82 @@
+import io
+import unittest
+
+from cumulusci.core.manifest import PackageManifest
+from cumulusci.utils import package_xml_from_dict
+
+PACKAGE_XML = '''<?xml version="1.0" encoding="UTF-8"?>
+<Package xmlns="http://soap.sforce.com/2006/04/metadata">
+    <fullName>Test %26 Package</fullName>
+    <types>
+        <members>Foo</members>
+        <members>Bar</members>
+        <name>ApexClass</name>
+    </types>
+    <types>
+        <members>Account.Field__c</members>
+        <name>CustomField</name>
+    </types>
+    <types>
+        <name>Empty</name>
+    </types>
+    <version>36.0</version>
+</Package>'''
+
+
+class TestPackageManifest(unittest.TestCase):
+
+    def test_parse(self):
+        manifest = PackageManifest.parse(io.BytesIO(PACKAGE_XML))
+        self.assertEquals(manifest.package_name, 'Test & Package')
+        self.assertEquals(manifest.api_version, '36.0')
+        self.assertEquals(manifest.get_members('ApexClass'), set(['Foo', 'Bar']))
+        self.assertIn(('CustomField', 'Account.Field__c'), manifest)
+        self.assertNotIn(('CustomField', 'Foo'), manifest)
+        self.assertEquals(manifest.get_members('Empty'), set())
+
+    def test_render_round_trip(self):
+        manifest = PackageManifest.parse(io.BytesIO(PACKAGE_XML))
+        rendered = manifest.render()
+        self.assertEquals(
+            rendered,
+            PACKAGE_XML.replace(
+                '        <members>Foo</members>\n        <members>Bar</members>',
+                '        <members>Bar</members>\n        <members>Foo</members>',
+            ),
+        )
+
+    def test_diff(self):
+        old = PackageManifest({
+            'ApexClass': ['Foo', 'Bar'],
+            'ApexPage': ['Page'],
+        })
+        new = PackageManifest({
+            'ApexClass': ['Foo', 'Baz'],
+            'CustomObject': ['Object__c'],
+        })
+        diff = old.diff(new)
+        self.assertEquals(diff.added.types, {
+            'ApexClass': set(['Baz']),
+            'CustomObject': set(['Object__c']),
+        })
+        self.assertEquals(diff.removed.types, {
+            'ApexClass': set(['Bar']),
+            'ApexPage': set(['Page']),
+        })
+        self.assertEquals(diff.unchanged.types, {'ApexClass': set(['Foo'])})
+
+        destructive_changes = diff.render_destructive_changes('36.0')
+        self.assertEquals(destructive_changes, package_xml_from_dict(
+            {'ApexClass': ['Bar'], 'ApexPage': ['Page']},
+            '36.0',
+        ))
+
+    def test_diff_no_removed(self):
+        manifest = PackageManifest({'ApexClass': ['Foo']})
+        diff = manifest.diff(manifest)
+        self.assertFalse(diff)
+        self.assertIsNone(diff.render_destructive_changes('36.0'))
+
+    def test_render_escapes_members(self):
+        manifest = PackageManifest({'Report': ['Folder/R&D']}, '36.0')
+        self.assertIn('<members>Folder/R&amp;D</members>', manifest.render())
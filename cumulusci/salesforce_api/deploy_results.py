@@ -0,0 +1,171 @@
+''' Typed records extracted from the details of a deploy result
+
+The records of a checkDeployStatus response are handed over one at a time
+by the streaming SOAP parser as soon as each element is closed.  A
+DeployResultCollector converts them into typed records, optionally writes
+each one as a line of JSON to an output file and keeps only counts and a
+bounded number of formatted messages in memory, so a deploy result with
+thousands of failures or a full runTestResult never sits in memory at once.
+
+    collector = DeployResultCollector(output_file)
+    handler = SoapResponseHandler(collector.record_tags, collector.on_record)
+
+The records written to a results file can be read back with read_results().
+'''
+
+from collections import namedtuple
+import json
+
+ComponentFailure = namedtuple('ComponentFailure', [
+    'component_type',
+    'file_name',
+    'line_num',
+    'column_num',
+    'problem',
+    'problem_type',
+    'action',
+])
+
+TestFailure = namedtuple('TestFailure', [
+    'class_name',
+    'method_name',
+    'namespace',
+    'message',
+    'stack_trace',
+    'time',
+])
+
+CodeCoverageWarning = namedtuple('CodeCoverageWarning', [
+    'name',
+    'namespace',
+    'message',
+])
+
+RECORD_TYPES = dict(
+    (record_type.__name__, record_type)
+    for record_type in (ComponentFailure, TestFailure, CodeCoverageWarning)
+)
+
+
+def parse_component_failure(record):
+    file_name = record.get('fullName') or record.get('fileName')
+    if record.get('deleted') == 'true':
+        action = 'Delete'
+    elif record.get('created') == 'true':
+        action = 'Create'
+    else:
+        action = 'Update'
+    return ComponentFailure(
+        component_type=record.get('componentType'),
+        file_name=file_name,
+        line_num=record.get('lineNumber'),
+        column_num=record.get('columnNumber'),
+        problem=record.get('problem'),
+        problem_type=record.get('problemType'),
+        action=action,
+    )
+
+
+def parse_test_failure(record):
+    return TestFailure(
+        class_name=record.get('name'),
+        method_name=record.get('methodName'),
+        namespace=record.get('namespace'),
+        message=record.get('message'),
+        stack_trace=record.get('stackTrace'),
+        time=record.get('time'),
+    )
+
+
+def parse_code_coverage_warning(record):
+    return CodeCoverageWarning(
+        name=record.get('name'),
+        namespace=record.get('namespace'),
+        message=record.get('message'),
+    )
+
+
+def format_record(record):
+    ''' Returns the log message for a typed record '''
+    if isinstance(record, ComponentFailure):
+        info = record._asdict()
+        if record.file_name and record.line_num:
+            return '{action} of {component_type} {file_name}: {problem_type} on line {line_num}, col {column_num}: {problem}'.format(**info)
+        elif record.file_name:
+            return '{action} of {component_type} {file_name}: {problem_type}: {problem}'.format(**info)
+        return '{action} of {problem_type}: {problem}'.format(**info)
+
+    if isinstance(record, TestFailure):
+        message = ['Apex Test Failure: ', ]
+        if record.namespace:
+            message.append('from namespace %s: ' % record.namespace)
+        if record.stack_trace:
+            message.append(record.stack_trace)
+        return ''.join(message)
+
+    if record.name:
+        return 'Code Coverage Warning: {}: {}'.format(record.name, record.message)
+    return 'Code Coverage Warning: {}'.format(record.message)
+
+
+def read_results(fileobj):
+    ''' Yields the typed records from a JSON lines results file '''
+    for line in fileobj:
+        if not line.strip():
+            continue
+        data = json.loads(line)
+        record_type = RECORD_TYPES[data.pop('record_type')]
+        yield record_type(**data)
+
+
+class DeployResultCollector(object):
+    ''' Collects the failures of a deploy result as they are parsed
+
+    Only the first max_messages formatted messages of each kind are kept for
+    the log.  Every record is written to output, a file object opened for
+    writing, if one is provided.
+    '''
+    max_messages = 100
+    parsers = {
+        'componentFailures': parse_component_failure,
+        'failures': parse_test_failure,
+        'codeCoverageWarnings': parse_code_coverage_warning,
+    }
+    record_tags = tuple(sorted(parsers))
+
+    def __init__(self, output=None, max_messages=None):
+        self.output = output
+        if max_messages is not None:
+            self.max_messages = max_messages
+        self.counts = {}
+        self.messages = {}
+
+    def on_record(self, tag, record):
+        parser = self.parsers.get(tag)
+        if parser is None:
+            return
+        self.add(parser(record))
+
+    def add(self, record):
+        record_type = type(record).__name__
+        count = self.counts.get(record_type, 0)
+        self.counts[record_type] = count + 1
+        if count < self.max_messages:
+            self.messages.setdefault(record_type, []).append(
+                format_record(record)
+            )
+        if self.output is not None:
+            data = record._asdict()
+            data['record_type'] = record_type
+            self.output.write(json.dumps(data) + '\n')
+
+    def get_count(self, record_type):
+        return self.counts.get(record_type.__name__, 0)
+
+    def get_log(self, record_type):
+        ''' Returns the messages for record_type joined for logging '''
+        messages = list(self.messages.get(record_type.__name__, []))
+        remaining = self.get_count(record_type) - len(messages)
+        if remaining > 0:
+            messages.append('... and {} more'.format(remaining))
+        return '\n\n'.join(messages)
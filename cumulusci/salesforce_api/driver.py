@@ -0,0 +1,220 @@
+''' Runs many Metadata API operations against an org at the same time
+
+Calling a BaseMetadataApiCall blocks until its async operation is done.  The
+MetadataApiDriver instead starts up to concurrency operations and polls all
+of the outstanding operations from a single scheduler loop, sending each
+status check when that operation's polling strategy says it is due.
+
+The start, status and result calls themselves are sent from a thread pool
+so the scheduler never waits on one slow call.  Callbacks are always run in
+the thread which called the driver.
+
+    driver = MetadataApiDriver(task, concurrency=4)
+    driver.add(ApiDeploy(task, pre_zip), name='pre')
+    driver.add(ApiDeploy(task, main_zip), name='main', depends_on=['pre'])
+    results = driver()
+'''
+
+import Queue
+import sys
+import time
+from multiprocessing.pool import ThreadPool
+
+from cumulusci.core.exceptions import CumulusCIException
+from cumulusci.salesforce_api.session import get_session
+
+
+class MetadataApiOperation(object):
+    ''' A Metadata API call scheduled by a MetadataApiDriver '''
+
+    def __init__(self, api, name, depends_on=None, callback=None):
+        self.api = api
+        self.name = name
+        self.depends_on = list(depends_on or [])
+        self.callback = callback
+        self.started = False
+        self.done = False
+        self.in_flight = False
+        self.next_check = None
+        self.result = None
+
+
+class MetadataApiDriver(object):
+    ''' Schedules Metadata API calls concurrently against one org
+
+    concurrency is the maximum number of operations running in the org at
+    once.  Operations are started in the order they were added once all of
+    the operations named in their depends_on have finished.
+
+    If any call raises an exception, no further operations are started and
+    the exception is raised once the calls already in flight return.
+    '''
+
+    def __init__(self, task, concurrency=None):
+        if not concurrency:
+            concurrency = 1
+        self.task = task
+        self.concurrency = int(concurrency)
+        self.operations = []
+        self._names = set()
+
+    def add(self, api, name=None, depends_on=None, callback=None):
+        ''' Adds an api call to be run, returning its operation name
+
+        callback, if provided, is called with the operation's name and the
+        result of the api call once it finishes.
+        '''
+        if name is None:
+            name = str(len(self.operations))
+        if name in self._names:
+            raise CumulusCIException(
+                'Duplicate Metadata API operation name {}'.format(name)
+            )
+        self._names.add(name)
+        self.operations.append(
+            MetadataApiOperation(api, name, depends_on, callback)
+        )
+        return name
+
+    def __call__(self):
+        ''' Runs all operations and returns a dict of results by name '''
+        self._validate_dependencies()
+        if not self.operations:
+            return {}
+
+        # Make sure the shared session can hold a connection per worker
+        get_session(self.task.org_config, self.concurrency)
+
+        self._queue = Queue.Queue()
+        self._error = None
+        self._pool = ThreadPool(self.concurrency)
+        try:
+            self._run()
+        finally:
+            self._pool.close()
+            self._pool.join()
+
+        if self._error:
+            raise self._error[0], self._error[1], self._error[2]
+        return dict((op.name, op.result) for op in self.operations)
+
+    def _validate_dependencies(self):
+        for op in self.operations:
+            for dependency in op.depends_on:
+                if dependency not in self._names:
+                    raise CumulusCIException(
+                        'Metadata API operation {} depends on unknown '
+                        'operation {}'.format(op.name, dependency)
+                    )
+        # Dependencies must be added before their dependents, which also
+        # rules out cycles
+        seen = set()
+        for op in self.operations:
+            for dependency in op.depends_on:
+                if dependency not in seen:
+                    raise CumulusCIException(
+                        'Metadata API operation {} must be added after its '
+                        'dependency {}'.format(op.name, dependency)
+                    )
+            seen.add(op.name)
+
+    def _run(self):
+        finished = set()
+        while True:
+            self._start_ready(finished)
+            self._check_due()
+
+            in_flight = [op for op in self.operations if op.in_flight]
+            waiting = [
+                op for op in self.operations
+                if op.started and not op.done and not op.in_flight
+            ]
+            if not in_flight:
+                if self._error or not waiting:
+                    return
+
+            timeout = None
+            if waiting and not self._error:
+                next_check = min(op.next_check for op in waiting)
+                timeout = max(next_check - time.time(), 0)
+            if not in_flight:
+                time.sleep(timeout)
+                continue
+            try:
+                op, exc_info = self._queue.get(timeout=timeout)
+            except Queue.Empty:
+                continue
+            self._step_finished(op, exc_info, finished)
+
+            # Drain any other steps which finished in the meantime
+            while True:
+                try:
+                    op, exc_info = self._queue.get_nowait()
+                except Queue.Empty:
+                    break
+                self._step_finished(op, exc_info, finished)
+
+    def _start_ready(self, finished):
+        if self._error:
+            return
+        running = len([
+            op for op in self.operations if op.started and not op.done
+        ])
+        for op in self.operations:
+            if running >= self.concurrency:
+                return
+            if op.started:
+                continue
+            if not all(name in finished for name in op.depends_on):
+                continue
+            op.started = True
+            running += 1
+            self.task.logger.info(
+                'Starting Metadata API operation {}'.format(op.name)
+            )
+            self._submit(op, op.api._start_operation)
+
+    def _check_due(self):
+        if self._error:
+            return
+        now = time.time()
+        for op in self.operations:
+            if op.started and not op.done and not op.in_flight:
+                if op.next_check <= now:
+                    self._submit(op, op.api._check_operation)
+
+    def _submit(self, op, step):
+        op.in_flight = True
+        self._pool.apply_async(_run_step, (self._queue, op, step))
+
+    def _step_finished(self, op, exc_info, finished):
+        op.in_flight = False
+        if exc_info:
+            if not self._error:
+                self._error = exc_info
+            op.done = True
+            return
+        if not op.api.done:
+            op.next_check = time.time() + op.api.check_delay
+            return
+        op.done = True
+        op.api._log_connection_stats()
+        finished.add(op.name)
+        self.task.logger.info(
+            'Finished Metadata API operation {}'.format(op.name)
+        )
+        if op.callback:
+            op.callback(op.name, op.result)
+
+
+def _run_step(queue, op, step):
+    exc_info = None
+    try:
+        step()
+        if op.api.done:
+            # Process the final response, e.g. extracting a retrieved zip,
+            # in the worker thread rather than the scheduler
+            op.result = op.api._get_result()
+    except Exception:
+        exc_info = sys.exc_info()
+    queue.put((op, exc_info))
@@ -0,0 +1,222 @@
+''' Compiled SOAP envelope templates which render to streamed request bodies
+
+A SoapEnvelope splits its template once into fixed byte segments around the
+###SESSION_ID### marker and the %(name)s placeholders.  Rendering an
+envelope never copies or scans the values filled in: the request body is a
+list of buffers which is read sequentially while the request is being sent.
+
+Values can be strings, which are used as is (unicode is encoded as utf-8),
+or file-like objects wrapped in a FileStream or Base64Stream which are read
+from disk as the body is sent.  This allows a multi-MB deploy zip to be
+sent without ever holding its base64 encoding in memory.
+
+    DEPLOY = SoapEnvelope(template)
+    message = DEPLOY(package_zip=Base64Stream(zip_file), purge_on_delete='true')
+    body = message.render(session_id)
+    requests.post(url, data=body)
+'''
+
+import base64
+import os
+import re
+
+SESSION_ID = '###SESSION_ID###'
+CHUNK_SIZE = 64 * 1024
+
+_placeholder_re = re.compile(r'(###SESSION_ID###|%\((\w+)\)s)')
+
+
+class _Field(object):
+    ''' A named placeholder in a compiled envelope '''
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return '<Field {}>'.format(self.name)
+
+
+_SESSION = _Field(SESSION_ID)
+
+
+class SoapEnvelope(object):
+    ''' A SOAP envelope template compiled into fixed byte segments '''
+
+    def __init__(self, template):
+        if isinstance(template, unicode):
+            template = template.encode('utf-8')
+        self.template = template
+        self.segments = []
+        self.fields = set()
+        pos = 0
+        for match in _placeholder_re.finditer(template):
+            if match.start() > pos:
+                self.segments.append(template[pos:match.start()])
+            if match.group(2):
+                self.segments.append(_Field(match.group(2)))
+                self.fields.add(match.group(2))
+            else:
+                self.segments.append(_SESSION)
+            pos = match.end()
+        if pos < len(template):
+            self.segments.append(template[pos:])
+
+    def __call__(self, **values):
+        ''' Returns a SoapMessage with the placeholders filled in '''
+        missing = self.fields.difference(values)
+        if missing:
+            raise KeyError(
+                'Missing envelope values: {}'.format(', '.join(sorted(missing)))
+            )
+        return SoapMessage(self, values)
+
+    def __str__(self):
+        return self.template
+
+
+class SoapMessage(object):
+    ''' A SoapEnvelope with its values bound, waiting for a session id
+
+    A message can be rendered more than once, e.g. to resend it after
+    refreshing an expired session.
+    '''
+
+    def __init__(self, envelope, values):
+        self.envelope = envelope
+        self.values = {}
+        for name, value in values.items():
+            if isinstance(value, unicode):
+                value = value.encode('utf-8')
+            elif value is None:
+                value = ''
+            elif not isinstance(value, (str, FileStream)):
+                value = str(value)
+            self.values[name] = value
+
+    def render(self, session_id):
+        ''' Returns a SoapBody with the session id filled in '''
+        if isinstance(session_id, unicode):
+            session_id = session_id.encode('utf-8')
+        parts = []
+        for segment in self.envelope.segments:
+            if segment is _SESSION:
+                parts.append(session_id)
+            elif isinstance(segment, _Field):
+                parts.append(self.values[segment.name])
+            else:
+                parts.append(segment)
+        return SoapBody(parts)
+
+
+class SoapBody(object):
+    ''' A request body made up of byte strings and FileStreams
+
+    requests uses __len__ for the Content-Length header and streams the body
+    by calling read() so the parts are never joined in memory.
+    '''
+
+    def __init__(self, parts):
+        self.parts = [part for part in parts if len(part)]
+        for part in self.parts:
+            if isinstance(part, FileStream):
+                part.reset()
+        self.length = sum(len(part) for part in self.parts)
+        self._index = 0
+        self._offset = 0
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.length
+        chunks = []
+        while size > 0 and self._index < len(self.parts):
+            part = self.parts[self._index]
+            if isinstance(part, FileStream):
+                chunk = part.read(size)
+            else:
+                chunk = part[self._offset:self._offset + size]
+                self._offset += len(chunk)
+            if not chunk:
+                self._index += 1
+                self._offset = 0
+                continue
+            chunks.append(chunk)
+            size -= len(chunk)
+        return ''.join(chunks)
+
+    def getvalue(self):
+        ''' Returns the whole body as a string, mostly useful in tests '''
+        return ''.join(
+            part.getvalue() if isinstance(part, FileStream) else part
+            for part in self.parts
+        )
+
+
+class FileStream(object):
+    ''' Streams the contents of a file object from its current position '''
+
+    def __init__(self, fileobj, size=None):
+        self.fileobj = fileobj
+        self.start = fileobj.tell()
+        if size is None:
+            fileobj.seek(0, os.SEEK_END)
+            size = fileobj.tell() - self.start
+            fileobj.seek(self.start)
+        self.size = size
+        self._remaining = size
+
+    def __len__(self):
+        return self.size
+
+    def reset(self):
+        self.fileobj.seek(self.start)
+        self._remaining = self.size
+
+    def read(self, size):
+        chunk = self.fileobj.read(min(size, self._remaining))
+        self._remaining -= len(chunk)
+        return chunk
+
+    def getvalue(self):
+        self.reset()
+        return self.read(self.size)
+
+
+class Base64Stream(FileStream):
+    ''' Streams the base64 encoding of a file object's contents '''
+
+    def __init__(self, fileobj, size=None):
+        super(Base64Stream, self).__init__(fileobj, size)
+        self._pending = ''
+
+    def __len__(self):
+        return 4 * ((self.size + 2) / 3)
+
+    def reset(self):
+        super(Base64Stream, self).reset()
+        self._pending = ''
+
+    def read(self, size):
+        while len(self._pending) < size and self._remaining:
+            # Encode in multiples of 3 bytes so no padding is added midway
+            raw_size = max(3, (size - len(self._pending)) / 4 * 3)
+            raw = super(Base64Stream, self).read(raw_size)
+            if not raw:
+                break
+            self._pending += base64.b64encode(raw)
+        chunk = self._pending[:size]
+        self._pending = self._pending[size:]
+        return chunk
+
+    def getvalue(self):
+        self.reset()
+        return self.read(len(self))
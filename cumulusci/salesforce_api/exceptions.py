@@ -10,6 +10,9 @@ class MetadataApiError(CumulusCIException):
 class MetadataComponentFailure(MetadataApiError):
     pass
 
+class MetadataApiTimeoutError(MetadataApiError):
+    pass
+
 class MissingOAuthError(CumulusCIException):
     pass
 
@@ -12,15 +12,34 @@ import base64
 # import dateutil.parser
 import httplib
 import re
+import shutil
+import tempfile
+import threading
 import time
-from xml.dom.minidom import parseString
+from xml.sax.saxutils import escape
+import xml.etree.ElementTree as ET
 from zipfile import ZipFile
 import StringIO
 
 import requests
 
 from cumulusci.salesforce_api import soap_envelopes
+from cumulusci.salesforce_api.deploy_results import CodeCoverageWarning
+from cumulusci.salesforce_api.deploy_results import ComponentFailure
+from cumulusci.salesforce_api.deploy_results import DeployResultCollector
+from cumulusci.salesforce_api.deploy_results import TestFailure
+from cumulusci.salesforce_api.driver import MetadataApiDriver
+from cumulusci.salesforce_api.envelope_builder import Base64Stream
+from cumulusci.salesforce_api.envelope_builder import SoapEnvelope
+from cumulusci.salesforce_api.polling import ProgressivePolling
+from cumulusci.salesforce_api.retrieve_cache import get_retrieve_cache
+from cumulusci.salesforce_api.session import get_session
+from cumulusci.salesforce_api.soap_parser import SoapResponseHandler
+from cumulusci.salesforce_api.soap_parser import parse_response
 from cumulusci.core.exceptions import ApexTestException
+from cumulusci.core.utils import import_class
+from cumulusci.utils import ZIP_SPOOL_SIZE
+from cumulusci.utils import extract_zip
 from cumulusci.utils import zip_subfolder
 from cumulusci.salesforce_api.exceptions import MetadataComponentFailure
 from cumulusci.salesforce_api.exceptions import MetadataApiError
@@ -28,6 +47,9 @@ from cumulusci.salesforce_api.exceptions import MetadataApiError
 
 class BaseMetadataApiCall(object):
     check_interval = 1
+    polling_strategy = None
+    pool_maxsize = None
+    record_tags = ()
     soap_envelope_start = None
     soap_envelope_status = None
     soap_envelope_result = None
@@ -39,13 +61,27 @@ class BaseMetadataApiCall(object):
         # the cumulucci context object contains logger, oauth, ID, secret, etc
         self.task = task
         self.status = None
-        self.check_num = 1
+        self.polling = None
+        self.done = False
+        self.check_delay = None
+        self.response = None
+        self.connection_stats = {
+            'calls': 0,
+            'new_connections': 0,
+            'reused_connections': 0,
+        }
 
     def __call__(self):
         self.task.logger.info('Pending')
-        response = self._get_response()
+        try:
+            self._get_response()
+        finally:
+            self._log_connection_stats()
+        return self._get_result()
+
+    def _get_result(self):
         if self.status != 'Failed':
-            return self._process_response(response)
+            return self._process_response(self.response)
 
     def _build_endpoint_url(self):
         # Parse org id from id which ends in /ORGID/USERID
@@ -66,15 +102,15 @@ class BaseMetadataApiCall(object):
 
     def _build_envelope_result(self):
         if self.soap_envelope_result:
-            return self.soap_envelope_result % {'process_id': self.process_id}
+            return self.soap_envelope_result(process_id=self.process_id)
 
     def _build_envelope_start(self):
         if self.soap_envelope_start:
-            return self.soap_envelope_start
+            return self.soap_envelope_start()
 
     def _build_envelope_status(self):
         if self.soap_envelope_status:
-            return self.soap_envelope_status % {'process_id': self.process_id}
+            return self.soap_envelope_status(process_id=self.process_id)
 
     def _build_headers(self, action, message):
         return {
@@ -83,109 +119,155 @@ class BaseMetadataApiCall(object):
             'SOAPAction': action,
         }
 
-    def _call_mdapi(self, headers, envelope, refresh=None):
-        # Insert the session id
+    def _get_message(self, envelope):
+        # Envelopes built as strings are compiled on the fly
+        if isinstance(envelope, basestring):
+            envelope = SoapEnvelope(envelope)()
+        return envelope
+
+    def _call_mdapi(self, action, message, refresh=None):
+        # Render the message with the session id into a streamed body
         session_id = self.task.org_config.access_token
-        auth_envelope = envelope.replace('###SESSION_ID###', session_id)
-        response = requests.post(self._build_endpoint_url(
-        ), headers=headers, data=auth_envelope)
-        faultcode = parseString(
-            response.content).getElementsByTagName('faultcode')
+        body = message.render(session_id)
+        headers = self._build_headers(action, body)
+        response = self._post(headers, body)
+        response = parse_response(response, self._get_response_handler())
         # refresh = False can be passed to prevent a loop if refresh fails
         if refresh is None:
             refresh = True
-        if faultcode:
-            return self._handle_soap_error(headers, envelope, refresh, response)
+        if response.get('faultcode'):
+            return self._handle_soap_error(action, message, refresh, response)
         return response
 
-    def _get_element_value(self, dom, tag):
-        result = dom.getElementsByTagName(tag)
-        if result and result[0].firstChild:
-            return result[0].firstChild.nodeValue
+    def _get_response_handler(self):
+        return SoapResponseHandler(record_tags=self.record_tags)
+
+    def _get_session(self):
+        pool_maxsize = self.pool_maxsize
+        if pool_maxsize is None:
+            pool_maxsize = self.task.project_config.cumulusci__metadata_api__pool_maxsize
+        return get_session(self.task.org_config, pool_maxsize)
+
+    def _post(self, headers, data):
+        response, new_connection = self._get_session().post(
+            self._build_endpoint_url(),
+            headers=headers,
+            data=data,
+            stream=True,
+        )
+        self.connection_stats['calls'] += 1
+        if new_connection:
+            self.connection_stats['new_connections'] += 1
+        else:
+            self.connection_stats['reused_connections'] += 1
+        return response
+
+    def _log_connection_stats(self):
+        self.task.logger.debug(
+            'Metadata API calls: {calls}  Reused connections: '
+            '{reused_connections}  New connections: {new_connections}'.format(
+                **self.connection_stats
+            )
+        )
+
+    def _get_polling_strategy(self):
+        if self.polling_strategy:
+            return self.polling_strategy
+        config = self.task.project_config.cumulusci__metadata_api__polling
+        if not config or not config.get('class_path'):
+            return ProgressivePolling(self.check_interval)
+        polling_class = import_class(config['class_path'])
+        return polling_class(**(config.get('options') or {}))
 
     def _get_check_interval(self):
-        return self.check_interval * ((self.check_num / 3) + 1)
+        if self.polling.interval is None:
+            self.polling.update()
+        return self.polling.interval
 
     def _get_response(self):
+        self._start_operation()
+        while not self.done:
+            time.sleep(self.check_delay)
+            self._check_operation()
+        return self.response
+
+    def _set_done(self, response):
+        self.done = True
+        self.check_delay = None
+        self.response = response
+
+    def _start_operation(self):
+        """ Sends the start call of the operation
+
+        Afterwards either self.done is True and self.response holds the
+        response, or _check_operation should be called after waiting
+        self.check_delay seconds.
+        """
         if not self.soap_envelope_start:
             # where is this from?
             raise NotImplemented('No soap_start template was provided')
+        self.done = False
+        self.response = None
         # Start the call
         envelope = self._build_envelope_start()
         if not envelope:
-            return
-        envelope = envelope.encode('utf-8')
-        headers = self._build_headers(self.soap_action_start, envelope)
-        response = self._call_mdapi(headers, envelope)
+            return self._set_done(None)
+        message = self._get_message(envelope)
+        response = self._call_mdapi(self.soap_action_start, message)
         # If no status or result calls are configured, return the result
         if not self.soap_envelope_status and not self.soap_envelope_result:
-            return response
+            return self._set_done(response)
         # Process the response to set self.process_id with the process id
         # started
-        response = self._process_response_start(response)
-        # Check the status if configured
+        self.response = self._process_response_start(response)
+        self.polling = self._get_polling_strategy()
+        self.polling.start()
         if self.soap_envelope_status:
-            while self.status not in ['Done', 'Failed']:
-                # Check status in a loop until done
-                envelope = self._build_envelope_status()
-                if not envelope:
-                    return
-                envelope = envelope.encode('utf-8')
-                headers = self._build_headers(
-                    self.soap_action_status, envelope)
-                response = self._call_mdapi(headers, envelope)
-                response = self._process_response_status(response)
-
-                # start increasing the check interval progressively to handle long pending jobs
-                check_interval = self._get_check_interval()
-                self.check_num += 1
-
-                time.sleep(check_interval)
+            # Check the status right away
+            self.check_delay = 0
+        else:
+            self.check_delay = self.polling.update()
+
+    def _check_operation(self):
+        """ Sends a single status check of a started operation """
+        if self.soap_envelope_status:
+            envelope = self._build_envelope_status()
+            if not envelope:
+                return self._set_done(None)
+            message = self._get_message(envelope)
+            response = self._call_mdapi(self.soap_action_status, message)
+            response = self._process_response_status(response)
+            if self.status not in ['Done', 'Failed']:
+                # the polling strategy picks the wait from the status response
+                self.check_delay = self._get_check_interval()
+                self.response = response
+                return
             # Fetch the final result and return
             if self.soap_envelope_result:
                 envelope = self._build_envelope_result()
                 if not envelope:
-                    return
-                envelope = envelope.encode('utf-8')
-                headers = self._build_headers(
-                    self.soap_action_result, envelope)
-                response = self._call_mdapi(headers, envelope)
-            else:
-                return response
-        else:
-            # Check the result and return when done
-            while self.status not in ['Succeeded', 'Failed', 'Cancelled']:
-                # start increasing the check interval progressively to handle long pending jobs
-                check_interval = self._get_check_interval()
-                self.check_num += 1
-                time.sleep(check_interval)
-
-                envelope = self._build_envelope_result()
-                envelope = envelope.encode('utf-8')
-                headers = self._build_headers(
-                    self.soap_action_result, envelope)
-                response = self._call_mdapi(headers, envelope)
-                response = _process_response_result(response)
-        return response
-
-    def _handle_soap_error(self, headers, envelope, refresh, response):
-        faultcode = parseString(
-            response.content).getElementsByTagName('faultcode')
-        if faultcode:
-            faultcode = faultcode[0].firstChild.nodeValue
-        else:
-            faultcode = ''
-        faultstring = parseString(
-            response.content).getElementsByTagName('faultstring')
-        if faultstring:
-            faultstring = faultstring[0].firstChild.nodeValue
-        else:
-            faultstring = response.content
+                    return self._set_done(None)
+                message = self._get_message(envelope)
+                response = self._call_mdapi(self.soap_action_result, message)
+            return self._set_done(response)
+
+        # Check the result and return when done
+        message = self._get_message(self._build_envelope_result())
+        response = self._call_mdapi(self.soap_action_result, message)
+        response = self._process_response_result(response)
+        if self.status in ['Succeeded', 'Failed', 'Cancelled']:
+            return self._set_done(response)
+        self.check_delay = self.polling.update()
+        self.response = response
+
+    def _handle_soap_error(self, action, message, refresh, response):
+        faultcode = response.get('faultcode') or ''
+        faultstring = response.get('faultstring') or response.content
         if faultcode == 'sf:INVALID_SESSION_ID' and self.task.org_config and self.task.org_config.refresh_token:
             # Attempt to refresh token and recall request
             if refresh:
                 self.org_config.refresh_oauth_token()
-                return self._call_mdapi(headers, envelope, refresh=False)
+                return self._call_mdapi(action, message, refresh=False)
         # Log the error
         message = '{}: {}'.format(faultcode, faultstring)
         self._set_status('Failed', message)
@@ -201,28 +283,26 @@ class BaseMetadataApiCall(object):
     def _process_response_start(self, response):
         if response.status_code == httplib.INTERNAL_SERVER_ERROR:
             return response
-        ids = parseString(response.content).getElementsByTagName('id')
-        if ids:
-            self.process_id = ids[0].firstChild.nodeValue
+        process_id = response.get('id')
+        if process_id:
+            self.process_id = process_id
         return response
 
     def _process_response_status(self, response):
-        resp_xml = parseString(response.content)
-        done = resp_xml.getElementsByTagName('done')
+        done = response.get('done')
         if done:
-            if done[0].firstChild.nodeValue == 'true':
+            if done == 'true':
                 self._set_status('Done')
             else:
-                state_detail = resp_xml.getElementsByTagName('stateDetail')
+                self.polling.update(response)
+                state_detail = response.get('stateDetail')
                 if state_detail:
-                    log = state_detail[0].firstChild.nodeValue
+                    log = state_detail
                     self._set_status('InProgress', log)
-                    self.check_num = 1
                 elif self.status == 'InProgress':
-                    self.check_num = 1
-                    self._set_status('InProgress', 'next check in {} seconds'.format(self._get_check_interval()))
+                    self._set_status('InProgress', 'next check in {:.1f} seconds'.format(self._get_check_interval()))
                 else:
-                    self._set_status('Pending', 'next check in {} seconds'.format(self._get_check_interval()))
+                    self._set_status('Pending', 'next check in {:.1f} seconds'.format(self._get_check_interval()))
         else:
             # If no done element was in the xml, fail logging the entire SOAP
             # envelope as the log
@@ -242,7 +322,57 @@ class BaseMetadataApiCall(object):
             logger('[{}]'.format(status))
 
 
-class ApiRetrieveUnpackaged(BaseMetadataApiCall):
+class BaseRetrieveMetadataApiCall(BaseMetadataApiCall):
+    """ A retrieve whose zip file can be answered from a RetrieveCache """
+
+    def __init__(self, task, api_version, extract_path=None, cache=None):
+        super(BaseRetrieveMetadataApiCall, self).__init__(task)
+        self.api_version = api_version
+        self.extract_path = extract_path
+        self.cache = cache
+
+    def __call__(self):
+        cached = self._get_cached_zip()
+        if cached:
+            self.task.logger.info('Using cached retrieve result')
+            with cached:
+                zip_file = cached
+                if not self.extract_path:
+                    # The returned zip may outlive the cache file handle
+                    zip_file = tempfile.SpooledTemporaryFile(
+                        max_size=ZIP_SPOOL_SIZE)
+                    shutil.copyfileobj(cached, zip_file)
+                    zip_file.seek(0)
+                return self._process_zip(ZipFile(zip_file, 'r'))
+        return super(BaseRetrieveMetadataApiCall, self).__call__()
+
+    def _get_cache_key(self):
+        raise NotImplementedError('Subclasses should provide their own implementation')
+
+    def _get_cached_zip(self):
+        if self.cache:
+            return self.cache.get(
+                self.task.org_config.org_id,
+                self._get_cache_key(),
+            )
+
+    def _process_response(self, response):
+        # The metadata zip file was decoded to disk while parsing the response
+        if not response.zip_file:
+            return
+        if self.cache:
+            self.cache.set(
+                self.task.org_config.org_id,
+                self._get_cache_key(),
+                response.zip_file,
+            )
+        return self._process_zip(ZipFile(response.zip_file, 'r'))
+
+    def _process_zip(self, zipfile):
+        return zipfile
+
+
+class ApiRetrieveUnpackaged(BaseRetrieveMetadataApiCall):
     check_interval = 1
     soap_envelope_start = soap_envelopes.RETRIEVE_UNPACKAGED
     soap_envelope_status = soap_envelopes.CHECK_STATUS
@@ -251,10 +381,15 @@ class ApiRetrieveUnpackaged(BaseMetadataApiCall):
     soap_action_status = 'checkStatus'
     soap_action_result = 'checkRetrieveStatus'
 
-    def __init__(self, task, package_xml, api_version):
-        super(ApiRetrieveUnpackaged, self).__init__(task)
+    def __init__(self, task, package_xml, api_version, extract_path=None,
+                 cache=None):
+        super(ApiRetrieveUnpackaged, self).__init__(
+            task,
+            api_version,
+            extract_path=extract_path,
+            cache=cache,
+        )
         self.package_xml = package_xml
-        self.api_version = api_version
         self._clean_package_xml()
 
     def _clean_package_xml(self):
@@ -265,20 +400,21 @@ class ApiRetrieveUnpackaged(BaseMetadataApiCall):
         self.package_xml = re.sub(' *', '', self.package_xml)
 
     def _build_envelope_start(self):
-        return self.soap_envelope_start.format(
-            self.api_version,
-            self.package_xml,
+        return self.soap_envelope_start(
+            api_version=self.api_version,
+            package_xml=self.package_xml,
         )
 
-    def _process_response(self, response):
-        # Parse the metadata zip file from the response
-        zipstr = parseString(response.content).getElementsByTagName('zipFile')
-        if zipstr:
-            zipstr = zipstr[0].firstChild.nodeValue
-        else:
-            return self.packages
-        zipstringio = StringIO.StringIO(base64.b64decode(zipstr))
-        zipfile = ZipFile(zipstringio, 'r')
+    def _get_cache_key(self):
+        # The cleaned package.xml has no whitespace left to tell apart
+        return self.cache.get_key('unpackaged', self.api_version, self.package_xml)
+
+    def _process_zip(self, zipfile):
+        if self.extract_path:
+            # Write the members straight to disk rather than building a
+            # second in memory zip of the unpackaged subfolder
+            extract_zip(zipfile, self.extract_path, 'unpackaged')
+            return self.extract_path
         zipfile = zip_subfolder(zipfile, 'unpackaged')
         return zipfile
 
@@ -296,14 +432,10 @@ class ApiRetrieveInstalledPackages(BaseMetadataApiCall):
         self.packages = []
 
     def _process_response(self, response):
-        # Parse the metadata zip file from the response
-        zipstr = parseString(response.content).getElementsByTagName('zipFile')
-        if zipstr:
-            zipstr = zipstr[0].firstChild.nodeValue
-        else:
+        # The metadata zip file was decoded to disk while parsing the response
+        if not response.zip_file:
             return self.packages
-        zipstringio = StringIO.StringIO(base64.b64decode(zipstr))
-        zipfile = ZipFile(zipstringio, 'r')
+        zipfile = ZipFile(response.zip_file, 'r')
         packages = {}
         # Loop through all files in the zip skipping anything other than
         # InstalledPackages
@@ -311,16 +443,16 @@ class ApiRetrieveInstalledPackages(BaseMetadataApiCall):
             if not path.endswith('.installedPackage'):
                 continue
             namespace = path.split('/')[-1].split('.')[0]
-            version = parseString(zipfile.open(
-                path).read()).getElementsByTagName('versionNumber')
-            if version:
-                version = version[0].firstChild.nodeValue
+            version = ET.fromstring(zipfile.read(path)).find(
+                '{http://soap.sforce.com/2006/04/metadata}versionNumber')
+            if version is not None:
+                version = version.text
             packages[namespace] = version
         self.packages = packages
         return self.packages
 
 
-class ApiRetrievePackaged(BaseMetadataApiCall):
+class ApiRetrievePackaged(BaseRetrieveMetadataApiCall):
     check_interval = 1
     soap_envelope_start = soap_envelopes.RETRIEVE_PACKAGED
     soap_envelope_status = soap_envelopes.CHECK_STATUS
@@ -329,41 +461,53 @@ class ApiRetrievePackaged(BaseMetadataApiCall):
     soap_action_status = 'checkStatus'
     soap_action_result = 'checkRetrieveStatus'
 
-    def __init__(self, task, package_name, api_version):
-        super(ApiRetrievePackaged, self).__init__(task)
+    def __init__(self, task, package_name, api_version, extract_path=None,
+                 cache=None):
+        super(ApiRetrievePackaged, self).__init__(
+            task,
+            api_version,
+            extract_path=extract_path,
+            cache=cache,
+        )
         self.package_name = package_name
-        self.api_version = api_version
 
     def _build_envelope_start(self):
-        return self.soap_envelope_start.format(
-            self.api_version,
-            self.package_name,
+        return self.soap_envelope_start(
+            api_version=self.api_version,
+            package_name=self.package_name,
         )
 
-    def _process_response(self, response):
-        # Parse the metadata zip file from the response
-        zipstr = parseString(response.content).getElementsByTagName('zipFile')
-        if zipstr:
-            zipstr = zipstr[0].firstChild.nodeValue
-        else:
-            return self.packages
-        zipstringio = StringIO.StringIO(base64.b64decode(zipstr))
-        zipfile = ZipFile(zipstringio, 'r')
+    def _get_cache_key(self):
+        return self.cache.get_key('packaged', self.api_version, self.package_name)
+
+    def _process_zip(self, zipfile):
+        if self.extract_path:
+            extract_zip(zipfile, self.extract_path, self.package_name)
+            return self.extract_path
         return zipfile
 
 
 class ApiDeploy(BaseMetadataApiCall):
+    record_tags = DeployResultCollector.record_tags
     soap_envelope_start = soap_envelopes.DEPLOY
     soap_envelope_status = soap_envelopes.CHECK_DEPLOY_STATUS
+    soap_envelope_result = soap_envelopes.CHECK_DEPLOY_STATUS
     soap_action_start = 'deploy'
     soap_action_status = 'checkDeployStatus'
+    soap_action_result = 'checkDeployStatus'
 
-    def __init__(self, task, package_zip, purge_on_delete=None):
+    def __init__(self, task, package_zip, purge_on_delete=None,
+                 results_output=None):
+        # package_zip is either a file object containing the zip or a string
+        # with the zip already base64 encoded
         super(ApiDeploy, self).__init__(task)
         if purge_on_delete is None:
             purge_on_delete = True
         self._set_purge_on_delete(purge_on_delete)
         self.package_zip = package_zip
+        # Path of a file to write the failures of the result to as JSON lines
+        self.results_output = results_output
+        self.results = None
 
     def _set_purge_on_delete(self, purge_on_delete):
         if purge_on_delete == False or purge_on_delete == 'false':
@@ -379,16 +523,73 @@ class ApiDeploy(BaseMetadataApiCall):
 
     def _build_envelope_start(self):
         if self.package_zip:
-            return self.soap_envelope_start % {
-                'package_zip': self.package_zip,
-                'purge_on_delete': self.purge_on_delete,
-            }
+            package_zip = self.package_zip
+            if hasattr(package_zip, 'read'):
+                # Base64 encode a zip file while the request is sent
+                package_zip = Base64Stream(package_zip)
+            return self.soap_envelope_start(
+                package_zip=package_zip,
+                purge_on_delete=self.purge_on_delete,
+            )
+
+    def _start_operation(self):
+        self._invalidate_retrieve_cache()
+        return super(ApiDeploy, self)._start_operation()
+
+    def _invalidate_retrieve_cache(self):
+        # Retrieves cached for the org no longer reflect its metadata
+        cache = get_retrieve_cache(self.task.project_config)
+        if cache:
+            cache.invalidate(self.task.org_config.org_id)
+
+    def _build_envelope_status(self):
+        # Status checks only need the progress counts, the details are
+        # fetched once with the result
+        return self.soap_envelope_status(
+            process_id=self.process_id,
+            include_details='false',
+        )
+
+    def _build_envelope_result(self):
+        self.results = DeployResultCollector()
+        return self.soap_envelope_result(
+            process_id=self.process_id,
+            include_details='true',
+        )
+
+    def _call_mdapi(self, action, message, refresh=None):
+        if (self.results is None or not self.results_output
+                or self.results.output is not None):
+            return super(ApiDeploy, self)._call_mdapi(action, message, refresh)
+        # The results file is only open while the result call is parsed
+        with open(self.results_output, 'w') as output:
+            self.results.output = output
+            try:
+                return super(ApiDeploy, self)._call_mdapi(
+                    action, message, refresh)
+            finally:
+                self.results.output = None
+
+    def _get_response_handler(self):
+        if self.results is None:
+            return super(ApiDeploy, self)._get_response_handler()
+        # Failures are collected as they are parsed rather than kept as
+        # records on the response
+        return SoapResponseHandler(
+            record_tags=self.results.record_tags,
+            on_record=self.results.on_record,
+        )
 
     def _process_response(self, response):
-        status = parseString(response.content).getElementsByTagName('status')
-        if status:
-            status = status[0].firstChild.nodeValue
-        else:
+        # A retrieve run while the deploy was in progress may have cached
+        # metadata from before it
+        self._invalidate_retrieve_cache()
+        results = self.results
+        if results is None:
+            results = DeployResultCollector()
+
+        status = response.get('status')
+        if not status:
             # If no status element is in the result xml, return fail and log
             # the entire SOAP envelope in the log
             self._set_status('Failed', response.content)
@@ -397,101 +598,23 @@ class ApiDeploy(BaseMetadataApiCall):
         # related to done
         if status in ['Succeeded', 'SucceededPartial']:
             self._set_status('Success', status)
+            if results.get_count(CodeCoverageWarning):
+                self.task.logger.warning(results.get_log(CodeCoverageWarning))
         else:
-            # If failed, parse out the problem text and raise appropriate exception
-            messages = []
-            resp_xml = parseString(response.content)
-
-            component_failures = resp_xml.getElementsByTagName('componentFailures')
-            for component_failure in component_failures:
-                failure_info = {
-                    'component_type': None,
-                    'file_name': None,
-                    'line_num': None,
-                    'column_num': None,
-                    'problem': component_failure.getElementsByTagName('problem')[0].firstChild.nodeValue,
-                    'problem_type': component_failure.getElementsByTagName('problemType')[0].firstChild.nodeValue,
-                }
-                component_type = component_failure.getElementsByTagName('componentType')
-                if component_type and component_type[0].firstChild:
-                    failure_info['component_type'] = component_type[0].firstChild.nodeValue
-                file_name = component_failure.getElementsByTagName('fullName')
-                if file_name and file_name[0].firstChild:
-                    failure_info['file_name'] = file_name[0].firstChild.nodeValue
-                if not failure_info['file_name']:
-                    file_name = component_failure.getElementsByTagName('fileName')
-                    if file_name and file_name[0].firstChild:
-                        failure_info['file_name'] = file_name[0].firstChild.nodeValue
-        
-                line_num = component_failure.getElementsByTagName('lineNumber')
-                if line_num and line_num[0].firstChild:
-                    failure_info['line_num'] = line_num[0].firstChild.nodeValue
-                
-                column_num = component_failure.getElementsByTagName('columnNumber')
-                if column_num and column_num[0].firstChild:
-                    failure_info['column_num'] = column_num[0].firstChild.nodeValue
-                
-                created = component_failure.getElementsByTagName('created')[0].firstChild.nodeValue == 'true'
-                deleted = component_failure.getElementsByTagName('deleted')[0].firstChild.nodeValue == 'true'
-                if deleted: 
-                    failure_info['action'] = 'Delete'
-                elif created:
-                    failure_info['action'] = 'Create'
-                else:
-                    failure_info['action'] = 'Update'
-  
-                if failure_info['file_name'] and failure_info['line_num']: 
-                    messages.append('{action} of {component_type} {file_name}: {problem_type} on line {line_num}, col {column_num}: {problem}'.format(**failure_info))
-                elif failure_info['file_name']:
-                    messages.append('{action} of {component_type} {file_name}: {problem_type}: {problem}'.format(**failure_info))
-                else:
-                    messages.append('{action} of {problem_type}: {problem}'.format(**failure_info))
-
-            if messages:
+            # If failed, raise the appropriate exception for the failures
+            if results.get_count(ComponentFailure):
                 # Deploy failures due to a component failure should raise MetadataComponentFailure
-                log = '\n\n'.join(messages)
+                log = results.get_log(ComponentFailure)
                 self._set_status('Failed', log)
                 raise MetadataComponentFailure(log, response)
-                
-            else:
-                problems = parseString(
-                    response.content).getElementsByTagName('problem')
-                for problem in problems:
-                    messages.append(problem.firstChild.nodeValue)
-
-            # Parse out any failure text (from test failures in production
-            # deployments) and add to log
-            failures = parseString(
-                response.content).getElementsByTagName('failures')
-            for failure in failures:
-                # Get needed values from subelements
-                namespace = failure.getElementsByTagName('namespace')
-                if namespace and namespace[0].firstChild:
-                    namespace = namespace[0].firstChild.nodeValue
-                else:
-                    namespace = None
-                stacktrace = failure.getElementsByTagName('stackTrace')
-                if stacktrace and stacktrace[0].firstChild:
-                    stacktrace = stacktrace[0].firstChild.nodeValue
-                else:
-                    stacktrace = None
-                message = ['Apex Test Failure: ', ]
-                if namespace:
-                    message.append('from namespace %s: ' % namespace)
-                if stacktrace:
-                    message.append(stacktrace)
-                messages.append(''.join(message))
-            if messages:
-                log = '\n\n'.join(messages)
-            else:
-                log = response.content
 
-            if messages:
-                # Deploy failures due to a component failure should raise MetadataComponentFailure
-                log = '\n\n'.join(messages)
+            # Test failures happen in production deployments
+            if results.get_count(TestFailure):
+                log = results.get_log(TestFailure)
                 self._set_status('Failed', log)
                 raise ApexTestException(log)
 
+            log = results.get_log(CodeCoverageWarning) or response.content
             self._set_status('Failed', log)
             raise MetadataApiError(log, response)
 
@@ -562,22 +685,73 @@ class ApiUninstallVersion(ApiDeploy):
 
 
 class ApiListMetadata(BaseMetadataApiCall):
+    record_tags = ('result',)
     soap_envelope_start = soap_envelopes.LIST_METADATA
     soap_action_start = 'listMetadata'
+    # The Metadata API accepts at most 3 queries per listMetadata call
+    max_queries = 3
+    # Calls for batches of queries run in threads and share one dict
+    _metadata_lock = threading.Lock()
 
-    def __init__(self, task, metadata_type, metadata=None, folder=None):
+    def __init__(self, task, metadata_type=None, metadata=None, folder=None,
+                 queries=None, concurrency=None):
         super(ApiListMetadata, self).__init__(task)
-        self.metadata_type = metadata_type
         self.metadata = metadata
-        self.folder = folder
         if self.metadata is None:
             self.metadata = {}
+        if queries is None:
+            queries = [(metadata_type, folder)]
+        self.queries = list(queries)
+        self.concurrency = concurrency
+
+    def _get_batches(self):
+        # The results of a call cannot be matched to the query that returned
+        # them, so each call only queries one metadata type and its results
+        # are stored under that type
+        batches = []
+        by_type = {}
+        for metadata_type, folder in self.queries:
+            if metadata_type not in by_type:
+                by_type[metadata_type] = []
+                batches.append(by_type[metadata_type])
+            by_type[metadata_type].append((metadata_type, folder))
+        return [
+            queries[i:i + self.max_queries]
+            for queries in batches
+            for i in range(0, len(queries), self.max_queries)
+        ]
+
+    def __call__(self):
+        batches = self._get_batches()
+        if len(batches) <= 1:
+            return super(ApiListMetadata, self).__call__()
+
+        # Run a call per batch of queries concurrently, merging their
+        # results into self.metadata
+        driver = MetadataApiDriver(self.task, self.concurrency)
+        for i, queries in enumerate(batches):
+            api = ApiListMetadata(
+                self.task,
+                metadata=self.metadata,
+                queries=queries,
+            )
+            driver.add(api, name='listMetadata {}'.format(i + 1))
+        driver()
+        return self.metadata
 
     def _build_envelope_start(self):
-        folder = self.folder
-        if folder is None:
-            folder = ''
-        return self.soap_envelope_start % {'metadata_type': self.metadata_type, 'folder': self.folder}
+        queries = []
+        for metadata_type, folder in self.queries:
+            folder_xml = ''
+            if folder:
+                folder_xml = soap_envelopes.LIST_METADATA_FOLDER % {
+                    'folder': escape(folder),
+                }
+            queries.append(soap_envelopes.LIST_METADATA_QUERY % {
+                'metadata_type': escape(metadata_type),
+                'folder': folder_xml,
+            })
+        return self.soap_envelope_start(queries='\n'.join(queries))
 
     def _process_response(self, response):
         metadata = []
@@ -600,19 +774,19 @@ class ApiListMetadata(BaseMetadataApiCall):
             'createdDate',
             'lastModifiedDate',
         ]
-        for result in parseString(response.content).getElementsByTagName('result'):
+        for result in response.get_records('result'):
             result_data = {}
             # Parse fields
             for tag in tags:
-                result_data[tag] = self._get_element_value(result, tag)
+                result_data[tag] = result.get(tag)
             # Parse dates
             # FIXME: This was breaking things
             # for key in parse_dates:
             #    if result_data[key]:
             #        result_data[key] = dateutil.parser.parse(result_data[key])
             metadata.append(result_data)
-        if self.metadata_type in self.metadata:
-            self.metadata[self.metadata_type].extend(metadata)
-        else:
-            self.metadata[self.metadata_type] = metadata
+        # All queries of a call are for the same type, see _get_batches
+        metadata_type = self.queries[0][0]
+        with self._metadata_lock:
+            self.metadata.setdefault(metadata_type, []).extend(metadata)
         return self.metadata
@@ -1,6 +1,18 @@
-from base64 import b64encode
-from zipfile import ZipFile
+import hashlib
+import multiprocessing
+import os
+import struct
+import threading
+import time
+import zlib
+from binascii import crc32
+from multiprocessing.pool import ThreadPool
 from tempfile import TemporaryFile
+from zipfile import LargeZipFile
+from zipfile import ZIP64_LIMIT
+from zipfile import ZIP_DEFLATED
+from zipfile import ZipFile
+from zipfile import ZipInfo
 
 INSTALLED_PACKAGE_PACKAGE_XML = """<?xml version="1.0" encoding="utf-8"?>
 <Package xmlns="http://soap.sforce.com/2006/04/metadata">
@@ -32,7 +44,7 @@ class BasePackageZipBuilder(object):
     def __call__(self):
         self._open_zip()
         self._populate_zip()
-        return self._encode_zip()
+        return self._close_zip()
 
     def _open_zip(self):
         self.zip_file = TemporaryFile()
@@ -47,10 +59,11 @@ class BasePackageZipBuilder(object):
     def _write_file(self, path, content):
         self.zip.writestr(path, content)
 
-    def _encode_zip(self):
+    def _close_zip(self):
+        # Return the zip file itself, ApiDeploy streams it base64 encoded
         self.zip.close()
         self.zip_file.seek(0)
-        return b64encode(self.zip_file.read())
+        return self.zip_file
 
 class CreatePackageZipBuilder(BasePackageZipBuilder):
 
@@ -102,3 +115,199 @@ class UninstallPackageZipBuilder(DestructiveChangesZipBuilder):
             raise ValueError('You must provide a namespace to install a package')
         self.namespace = namespace
         self.destructive_changes = INSTALLED_PACKAGE_PACKAGE_XML.format(self.namespace)
+
+
+class CompressedZipFile(ZipFile):
+    ''' A ZipFile which can also add members that are already deflated '''
+
+    def write_compressed(self, zinfo, data):
+        ''' Writes raw deflate data as a member described by zinfo
+
+        zinfo must have CRC and file_size set for the uncompressed content.
+        This follows ZipFile.writestr but skips the compression step.
+        '''
+        zinfo.compress_type = ZIP_DEFLATED
+        zinfo.compress_size = len(data)
+        zinfo.header_offset = self.fp.tell()
+        self._writecheck(zinfo)
+        self._didModify = True
+        zip64 = zinfo.file_size > ZIP64_LIMIT or \
+                zinfo.compress_size > ZIP64_LIMIT
+        if zip64 and not self._allowZip64:
+            raise LargeZipFile('Filesize would require ZIP64 extensions')
+        self.fp.write(zinfo.FileHeader(zip64))
+        self.fp.write(data)
+        self.fp.flush()
+        self.filelist.append(zinfo)
+        self.NameToInfo[zinfo.filename] = zinfo
+
+
+class ZipCompressionCache(object):
+    ''' A directory of deflated file contents keyed by content hash
+
+    Entries which have not been used for max_age days are removed, checking
+    at most once a day.
+    '''
+    header = struct.Struct('<LL')
+
+    def __init__(self, path, max_age=7):
+        self.path = path
+        self.max_age = max_age
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def _get_path(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, key):
+        ''' Returns a tuple of (crc, size, data) or None '''
+        path = self._get_path(key)
+        try:
+            with open(path, 'rb') as f:
+                crc, size = self.header.unpack(f.read(self.header.size))
+                data = f.read()
+        except (IOError, OSError, struct.error):
+            return
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return crc, size, data
+
+    def set(self, key, crc, size, data):
+        path = self._get_path(key)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Created by another worker
+                pass
+        # Write to a temporary file first so a reader never sees a partial
+        # entry, even when several builds share the cache
+        tmp_path = '{}.{}.{}.tmp'.format(
+            path, os.getpid(), threading.current_thread().ident
+        )
+        with open(tmp_path, 'wb') as f:
+            f.write(self.header.pack(crc, size))
+            f.write(data)
+        os.rename(tmp_path, path)
+
+    def prune(self):
+        marker = os.path.join(self.path, '.pruned')
+        now = time.time()
+        if os.path.isfile(marker) and os.path.getmtime(marker) > now - 86400:
+            return
+        cutoff = now - self.max_age * 86400
+        for root, dirs, files in os.walk(self.path):
+            for filename in files:
+                path = os.path.join(root, filename)
+                if path == marker:
+                    continue
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                except OSError:
+                    pass
+        with open(marker, 'w'):
+            pass
+
+
+class MetadataZipBuilder(object):
+    ''' Builds a deploy zip from a metadata directory
+
+    Files are read and compressed on a pool of worker threads (zlib releases
+    the GIL while compressing) and written to the zip in sorted order.  If
+    a cache is provided, each member's compressed bytes are stored keyed by
+    a hash of the file content and the replacements, so unchanged files are
+    not compressed again on the next deploy.
+
+    content_replacements and filename_replacements are lists of
+    (old, new) string pairs applied to each file's content and to each
+    file's name (not its directories).
+
+    The directory is walked using absolute paths, never changing the
+    process's working directory, so builders can run in threads.
+    '''
+
+    def __init__(self, path, cache=None, workers=None,
+                 content_replacements=None, filename_replacements=None):
+        self.path = os.path.abspath(path)
+        self.cache = cache
+        if not workers:
+            workers = multiprocessing.cpu_count()
+        self.workers = workers
+        self.content_replacements = list(content_replacements or [])
+        self.filename_replacements = list(filename_replacements or [])
+        self._replacements_key = hashlib.sha1(repr((
+            self.content_replacements,
+            self.filename_replacements,
+        ))).hexdigest()
+
+    def __call__(self):
+        ''' Returns a temporary file containing the zip '''
+        paths = self._get_paths()
+        zip_file = TemporaryFile()
+        zipf = CompressedZipFile(zip_file, 'w', ZIP_DEFLATED)
+        if self.cache:
+            self.cache.prune()
+        pool = ThreadPool(self.workers)
+        try:
+            for zinfo, data in pool.imap(self._compress, paths):
+                zipf.write_compressed(zinfo, data)
+        finally:
+            pool.close()
+            pool.join()
+        zipf.close()
+        zip_file.seek(0)
+        return zip_file
+
+    def _get_paths(self):
+        paths = []
+        for root, dirs, files in os.walk(self.path):
+            for filename in files:
+                paths.append(os.path.join(root, filename))
+        paths.sort()
+        return paths
+
+    def _get_arcname(self, path):
+        directory, filename = os.path.split(
+            os.path.relpath(path, self.path)
+        )
+        for old, new in self.filename_replacements:
+            filename = filename.replace(old, new)
+        if directory:
+            filename = os.path.join(directory, filename)
+        return filename.replace(os.sep, '/')
+
+    def _compress(self, path):
+        with open(path, 'rb') as f:
+            content = f.read()
+        zinfo = ZipInfo(
+            self._get_arcname(path),
+            time.localtime(os.path.getmtime(path))[:6],
+        )
+        zinfo.external_attr = (os.stat(path).st_mode & 0xFFFF) << 16
+
+        key = None
+        if self.cache:
+            key = '{}-{}'.format(
+                hashlib.sha1(content).hexdigest(),
+                self._replacements_key,
+            )
+            cached = self.cache.get(key)
+            if cached:
+                zinfo.CRC, zinfo.file_size, data = cached
+                return zinfo, data
+
+        for old, new in self.content_replacements:
+            content = content.replace(old, new)
+        zinfo.CRC = crc32(content) & 0xffffffff
+        zinfo.file_size = len(content)
+        compressor = zlib.compressobj(
+            zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15
+        )
+        data = compressor.compress(content) + compressor.flush()
+        if key:
+            self.cache.set(key, zinfo.CRC, zinfo.file_size, data)
+        return zinfo, data
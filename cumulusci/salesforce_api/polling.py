@@ -0,0 +1,182 @@
+''' Polling strategies for long running Metadata API operations
+
+A Metadata API call polls checkStatus, checkDeployStatus or
+checkRetrieveStatus until the async operation is done.  A polling strategy
+is fed each status response through update() and decides how long to wait
+before the next check.  The wait is available as strategy.interval until the
+next update.
+
+Strategies are configured under cumulusci__metadata_api__polling with a
+class_path and options which are passed as keyword arguments to the class.
+'''
+
+import random
+import time
+
+from cumulusci.salesforce_api.exceptions import MetadataApiTimeoutError
+
+
+class BasePollingStrategy(object):
+    ''' Base class for polling strategies
+
+    If timeout is set, MetadataApiTimeoutError is raised once the operation
+    has run longer than timeout seconds and the interval is shortened so
+    the last check happens right at the deadline.
+    '''
+
+    def __init__(self, timeout=None, clock=None):
+        if clock is None:
+            clock = time.time
+        self.timeout = float(timeout) if timeout else None
+        self.clock = clock
+        self.start_time = None
+        self.check_num = 0
+        self.interval = None
+
+    def start(self):
+        self.start_time = self.clock()
+        self.check_num = 0
+        self.interval = None
+
+    @property
+    def elapsed(self):
+        if self.start_time is None:
+            return 0
+        return self.clock() - self.start_time
+
+    def update(self, response=None):
+        ''' Records a status response and returns the next check interval '''
+        if self.start_time is None:
+            self.start()
+        self.check_num += 1
+        elapsed = self.elapsed
+        if self.timeout and elapsed >= self.timeout:
+            raise MetadataApiTimeoutError(
+                'Operation did not complete within {} seconds'.format(
+                    int(self.timeout)
+                ),
+                response,
+            )
+        interval = self._get_interval(response, elapsed)
+        if self.timeout:
+            interval = min(interval, self.timeout - elapsed)
+        self.interval = interval
+        return interval
+
+    def _get_interval(self, response, elapsed):
+        raise NotImplementedError('Subclasses should provide their own implementation')
+
+
+class ProgressivePolling(BasePollingStrategy):
+    ''' Slowly increases the interval by check_interval every third check
+
+    This is the original CumulusCI polling behavior.
+    '''
+
+    def __init__(self, check_interval=1, timeout=None, clock=None):
+        super(ProgressivePolling, self).__init__(timeout=timeout, clock=clock)
+        self.check_interval = check_interval
+
+    def _get_interval(self, response, elapsed):
+        return self.check_interval * ((self.check_num / 3) + 1)
+
+
+class AdaptivePolling(BasePollingStrategy):
+    ''' Chooses the interval from the progress reported by the server
+
+    checkDeployStatus reports how many components and tests have been
+    processed out of their totals.  Once two samples of a phase have been
+    seen, the time left is estimated from the observed rate and the next
+    check is scheduled after estimate_fraction of that time.
+
+    Without progress information the interval grows with the time the
+    operation has been running, so the delay in noticing completion is at
+    most elapsed_fraction of the total run time.
+
+    The interval is always kept between min_interval and max_interval.
+    min_interval caps the rate of API calls.  Random jitter of +/- jitter
+    (a fraction of the interval) spreads out concurrent pollers.
+    '''
+
+    def __init__(self, min_interval=1, max_interval=30, jitter=0.1,
+                 elapsed_fraction=0.2, estimate_fraction=0.5, timeout=None,
+                 clock=None):
+        super(AdaptivePolling, self).__init__(timeout=timeout, clock=clock)
+        self.min_interval = float(min_interval)
+        self.max_interval = float(max(max_interval, min_interval))
+        self.jitter = jitter
+        self.elapsed_fraction = elapsed_fraction
+        self.estimate_fraction = estimate_fraction
+        self._phase = None
+        self._phase_start = None
+
+    def start(self):
+        super(AdaptivePolling, self).start()
+        self._phase = None
+        self._phase_start = None
+
+    def _get_interval(self, response, elapsed):
+        remaining = self._estimate_remaining(response, elapsed)
+        if remaining is None:
+            interval = elapsed * self.elapsed_fraction
+        else:
+            interval = remaining * self.estimate_fraction
+        if self.jitter:
+            interval *= 1 + random.uniform(-self.jitter, self.jitter)
+        return max(self.min_interval, min(interval, self.max_interval))
+
+    def _get_progress(self, response):
+        ''' Returns a tuple of (phase, completed, total) or None '''
+        if response is None:
+            return
+        components = _get_counts(
+            response,
+            'numberComponentsDeployed',
+            'numberComponentErrors',
+            'numberComponentsTotal',
+        )
+        tests = _get_counts(
+            response,
+            'numberTestsCompleted',
+            'numberTestErrors',
+            'numberTestsTotal',
+        )
+        if components and components[0] < components[1]:
+            return ('components',) + components
+        if tests and tests[0] < tests[1]:
+            return ('tests',) + tests
+
+    def _estimate_remaining(self, response, elapsed):
+        progress = self._get_progress(response)
+        if progress is None:
+            self._phase = None
+            return
+        phase, completed, total = progress
+        if phase != self._phase or completed < self._phase_start[1]:
+            self._phase = phase
+            self._phase_start = (elapsed, completed)
+            return
+        start_elapsed, start_completed = self._phase_start
+        if completed == start_completed or elapsed <= start_elapsed:
+            return
+        rate = (completed - start_completed) / (elapsed - start_elapsed)
+        return (total - completed) / rate
+
+
+def _get_counts(response, completed_tag, errors_tag, total_tag):
+    total = _get_int(response, total_tag)
+    if not total:
+        return
+    completed = _get_int(response, completed_tag) or 0
+    completed += _get_int(response, errors_tag) or 0
+    return float(completed), float(total)
+
+
+def _get_int(response, tag):
+    value = response.get(tag)
+    if value is None:
+        return
+    try:
+        return int(value)
+    except ValueError:
+        return
@@ -0,0 +1,97 @@
+''' On disk cache of Metadata API retrieve results
+
+The zip file of a retrieve is stored per org, keyed by the api version and
+the normalized package.xml or package name retrieved.  Entries expire after
+max_age seconds and all entries for an org are removed whenever a deploy
+runs against it, so repeated retrieves within a flow or across back to back
+flows are answered locally.
+
+Only deploys run through ApiDeploy invalidate the cache.  Changes made to
+the org any other way, such as edits in Setup, package installs or another
+process deploying to the same org, are not seen until the entries expire.
+The cache is therefore disabled by default and is enabled under
+cumulusci -> metadata_api -> retrieve_cache:
+
+    retrieve_cache:
+        enabled: True
+        max_age: 3600
+'''
+
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+CHUNK_SIZE = 64 * 1024
+
+
+def get_retrieve_cache(project_config):
+    ''' Returns the project's RetrieveCache or None if it is disabled '''
+    config = project_config.cumulusci__metadata_api__retrieve_cache
+    if not isinstance(config, dict):
+        return
+    if config.get('enabled') not in [True, 'True', 'true']:
+        return
+    project_local_dir = project_config.project_local_dir
+    if not project_local_dir:
+        return
+    kwargs = {}
+    if config.get('max_age') is not None:
+        kwargs['max_age'] = int(config['max_age'])
+    return RetrieveCache(os.path.join(project_local_dir, 'retrieve_cache'), **kwargs)
+
+
+class RetrieveCache(object):
+    ''' A directory of retrieved zip files for each org '''
+
+    def __init__(self, path, max_age=3600):
+        self.path = path
+        self.max_age = max_age
+
+    @staticmethod
+    def get_key(*parts):
+        key = hashlib.sha1()
+        for part in parts:
+            if isinstance(part, unicode):
+                part = part.encode('utf-8')
+            key.update(str(part))
+            key.update('\0')
+        return key.hexdigest()
+
+    def _get_path(self, org_id, key):
+        return os.path.join(self.path, org_id, '{}.zip'.format(key))
+
+    def get(self, org_id, key):
+        ''' Returns the cached zip opened for reading or None '''
+        path = self._get_path(org_id, key)
+        try:
+            if os.path.getmtime(path) < time.time() - self.max_age:
+                os.remove(path)
+                return
+            return open(path, 'rb')
+        except (IOError, OSError):
+            return
+
+    def set(self, org_id, key, zip_file):
+        ''' Copies the zip file object into the cache and rewinds it '''
+        path = self._get_path(org_id, key)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Created by another retrieve
+                pass
+        tmp_path = '{}.{}.{}.tmp'.format(
+            path, os.getpid(), threading.current_thread().ident
+        )
+        zip_file.seek(0)
+        with open(tmp_path, 'wb') as f:
+            shutil.copyfileobj(zip_file, f, CHUNK_SIZE)
+        os.rename(tmp_path, path)
+        zip_file.seek(0)
+
+    def invalidate(self, org_id):
+        ''' Removes all cached retrieves for the org '''
+        shutil.rmtree(os.path.join(self.path, org_id), ignore_errors=True)
@@ -0,0 +1,133 @@
+''' Shared, connection pooled HTTP sessions for Salesforce API calls
+
+A Metadata API operation is made up of a start call followed by many status
+polls and a final result call.  Rather than opening a new TLS connection for
+every call, each org gets a single requests.Session with a keep-alive
+connection pool which is reused by every call made against that org for the
+life of the process, i.e. across all tasks in a flow.
+'''
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.connectionpool import HTTPConnectionPool
+from requests.packages.urllib3.connectionpool import HTTPSConnectionPool
+
+DEFAULT_POOL_MAXSIZE = 10
+
+_local = threading.local()
+
+
+def _track_connection(conn):
+    # A connection without a socket has either never been opened or was
+    # dropped by the pool, either way the request will do a new handshake
+    _local.new_connection = conn.sock is None
+    return conn
+
+
+class TrackingHTTPConnectionPool(HTTPConnectionPool):
+
+    def _get_conn(self, timeout=None):
+        return _track_connection(
+            super(TrackingHTTPConnectionPool, self)._get_conn(timeout)
+        )
+
+
+class TrackingHTTPSConnectionPool(HTTPSConnectionPool):
+
+    def _get_conn(self, timeout=None):
+        return _track_connection(
+            super(TrackingHTTPSConnectionPool, self)._get_conn(timeout)
+        )
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    ''' An HTTPAdapter whose pools record whether a connection was reused '''
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(PooledHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TrackingHTTPConnectionPool,
+            'https': TrackingHTTPSConnectionPool,
+        }
+
+
+class OrgSession(object):
+    ''' A keep-alive requests.Session shared by all API calls to one org '''
+
+    def __init__(self, pool_maxsize=None):
+        if pool_maxsize is None:
+            pool_maxsize = DEFAULT_POOL_MAXSIZE
+        self.session = requests.Session()
+        self.pool_maxsize = None
+        self.stats = {
+            'requests': 0,
+            'new_connections': 0,
+            'reused_connections': 0,
+        }
+        self._lock = threading.Lock()
+        self.set_pool_maxsize(pool_maxsize)
+
+    def set_pool_maxsize(self, pool_maxsize):
+        ''' Remount the adapters if a larger pool is requested '''
+        if self.pool_maxsize and pool_maxsize <= self.pool_maxsize:
+            return
+        self.pool_maxsize = pool_maxsize
+        for prefix in ('https://', 'http://'):
+            previous = self.session.adapters.get(prefix)
+            self.session.mount(prefix, PooledHTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=pool_maxsize,
+            ))
+            # Release the sockets of the smaller pool
+            if previous is not None:
+                previous.close()
+
+    def request(self, method, url, **kwargs):
+        ''' Sends a request and returns a tuple of (response, new_connection)
+
+        new_connection is True if the request required opening a new
+        connection (and TLS handshake) rather than reusing a pooled one.
+        '''
+        _local.new_connection = None
+        response = self.session.request(method, url, **kwargs)
+        new_connection = bool(_local.new_connection)
+        with self._lock:
+            self.stats['requests'] += 1
+            if new_connection:
+                self.stats['new_connections'] += 1
+            else:
+                self.stats['reused_connections'] += 1
+        return response, new_connection
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(org_config, pool_maxsize=None):
+    ''' Returns the shared OrgSession for an org, creating it if needed '''
+    key = org_config.org_id
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = OrgSession(pool_maxsize)
+            _sessions[key] = session
+        elif pool_maxsize:
+            session.set_pool_maxsize(pool_maxsize)
+    return session
+
+
+def close_sessions():
+    ''' Closes and forgets all shared sessions '''
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.session.close()
+        _sessions.clear()
@@ -1,4 +1,6 @@
-DEPLOY = '''<?xml version="1.0" encoding="utf-8"?>
+from cumulusci.salesforce_api.envelope_builder import SoapEnvelope
+
+DEPLOY = SoapEnvelope('''<?xml version="1.0" encoding="utf-8"?>
 <soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema">
   <soap:Header>
     <SessionHeader xmlns="http://soap.sforce.com/2006/04/metadata">
@@ -21,9 +23,9 @@ DEPLOY = '''<?xml version="1.0" encoding="utf-8"?>
       </DeployOptions>
     </deploy>
   </soap:Body>
-</soap:Envelope>'''
+</soap:Envelope>''')
 
-CHECK_DEPLOY_STATUS = '''<?xml version="1.0" encoding="utf-8"?>
+CHECK_DEPLOY_STATUS = SoapEnvelope('''<?xml version="1.0" encoding="utf-8"?>
 <soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema">
   <soap:Header>
     <SessionHeader xmlns="http://soap.sforce.com/2006/04/metadata">
@@ -33,12 +35,12 @@ CHECK_DEPLOY_STATUS = '''<?xml version="1.0" encoding="utf-8"?>
   <soap:Body>
     <checkDeployStatus xmlns="http://soap.sforce.com/2006/04/metadata">
       <asyncProcessId>%(process_id)s</asyncProcessId>
-      <includeDetails>true</includeDetails>
+      <includeDetails>%(include_details)s</includeDetails>
     </checkDeployStatus>
   </soap:Body>
-</soap:Envelope>'''
+</soap:Envelope>''')
 
-RETRIEVE_INSTALLEDPACKAGE = '''<?xml version="1.0" encoding="utf-8"?>
+RETRIEVE_INSTALLEDPACKAGE = SoapEnvelope('''<?xml version="1.0" encoding="utf-8"?>
 <soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema">
   <soap:Header>
     <SessionHeader xmlns="http://soap.sforce.com/2006/04/metadata">
@@ -59,9 +61,9 @@ RETRIEVE_INSTALLEDPACKAGE = '''<?xml version="1.0" encoding="utf-8"?>
       </retrieveRequest>
     </retrieve>
   </soap:Body>
-</soap:Envelope>'''
+</soap:Envelope>''')
 
-RETRIEVE_PACKAGED = '''<?xml version="1.0" encoding="utf-8"?>
+RETRIEVE_PACKAGED = SoapEnvelope('''<?xml version="1.0" encoding="utf-8"?>
 <soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema">
   <soap:Header>
     <SessionHeader xmlns="http://soap.sforce.com/2006/04/metadata">
@@ -71,14 +73,14 @@ RETRIEVE_PACKAGED = '''<?xml version="1.0" encoding="utf-8"?>
   <soap:Body>
     <retrieve xmlns="http://soap.sforce.com/2006/04/metadata">
       <retrieveRequest>
-        <apiVersion>{}</apiVersion>
-        <packageNames>{}</packageNames>
+        <apiVersion>%(api_version)s</apiVersion>
+        <packageNames>%(package_name)s</packageNames>
       </retrieveRequest>
     </retrieve>
   </soap:Body>
-</soap:Envelope>'''
+</soap:Envelope>''')
 
-RETRIEVE_UNPACKAGED = '''<?xml version="1.0" encoding="utf-8"?>
+RETRIEVE_UNPACKAGED = SoapEnvelope('''<?xml version="1.0" encoding="utf-8"?>
 <soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema">
   <soap:Header>
     <SessionHeader xmlns="http://soap.sforce.com/2006/04/metadata">
@@ -88,16 +90,16 @@ RETRIEVE_UNPACKAGED = '''<?xml version="1.0" encoding="utf-8"?>
   <soap:Body>
     <retrieve xmlns="http://soap.sforce.com/2006/04/metadata">
       <retrieveRequest>
-        <apiVersion>{}</apiVersion>
+        <apiVersion>%(api_version)s</apiVersion>
         <unpackaged>
-          {} 
+          %(package_xml)s 
         </unpackaged>
       </retrieveRequest>
     </retrieve>
   </soap:Body>
-</soap:Envelope>'''
+</soap:Envelope>''')
 
-LIST_METADATA = '''<?xml version="1.0" encoding="utf-8"?>
+LIST_METADATA = SoapEnvelope('''<?xml version="1.0" encoding="utf-8"?>
 <soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema">
   <soap:Header>
     <SessionHeader xmlns="http://soap.sforce.com/2006/04/metadata">
@@ -106,15 +108,20 @@ LIST_METADATA = '''<?xml version="1.0" encoding="utf-8"?>
   </soap:Header>
   <soap:Body>
     <listMetadata xmlns="http://soap.sforce.com/2006/04/metadata">
-      <queries>
-        <type>%(metadata_type)s</type>
-        <folder>%(folder)s</folder>
-      </queries>
+%(queries)s
     </listMetadata>
   </soap:Body>
-</soap:Envelope>'''
+</soap:Envelope>''')
+
+# Fragments rendered into LIST_METADATA's queries placeholder
+LIST_METADATA_QUERY = '''      <queries>
+        <type>%(metadata_type)s</type>%(folder)s
+      </queries>'''
+
+LIST_METADATA_FOLDER = '''
+        <folder>%(folder)s</folder>'''
 
-CHECK_STATUS = '''<?xml version="1.0" encoding="utf-8"?>
+CHECK_STATUS = SoapEnvelope('''<?xml version="1.0" encoding="utf-8"?>
 <soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema">
   <soap:Header>
     <SessionHeader xmlns="http://soap.sforce.com/2006/04/metadata">
@@ -126,9 +133,9 @@ CHECK_STATUS = '''<?xml version="1.0" encoding="utf-8"?>
       <asyncProcessId>%(process_id)s</asyncProcessId>
     </checkStatus>
   </soap:Body>
-</soap:Envelope>'''
+</soap:Envelope>''')
 
-CHECK_RETRIEVE_STATUS = '''<?xml version="1.0" encoding="utf-8"?>
+CHECK_RETRIEVE_STATUS = SoapEnvelope('''<?xml version="1.0" encoding="utf-8"?>
 <soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema">
   <soap:Header>
     <SessionHeader xmlns="http://soap.sforce.com/2006/04/metadata">
@@ -140,4 +147,4 @@ CHECK_RETRIEVE_STATUS = '''<?xml version="1.0" encoding="utf-8"?>
       <asyncProcessId>%(process_id)s</asyncProcessId>
     </checkRetrieveStatus>
   </soap:Body>
-</soap:Envelope>'''
+</soap:Envelope>''')
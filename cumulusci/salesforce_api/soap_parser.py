@@ -0,0 +1,194 @@
+''' Streaming parser for Metadata API SOAP responses
+
+Responses are parsed incrementally as they are read off the wire with a SAX
+handler which pulls out everything the Metadata API client needs in a single
+pass:
+
+  * scalar fields: the text of leaf elements directly under the <result> or
+    <Fault> element, e.g. faultcode, id, done, status and stateDetail
+  * records: a dict of leaf values for each occurrence of a configured
+    element, e.g. componentFailures or the <result> items of listMetadata
+  * zipFile: base64 text is decoded incrementally into a spooled temporary
+    file which rolls over to disk once it grows past ZIP_SPOOL_SIZE
+'''
+
+import base64
+import tempfile
+import xml.sax
+from xml.sax.handler import ContentHandler
+from xml.sax.handler import feature_external_ges
+from xml.sax.handler import feature_namespaces
+
+from cumulusci.salesforce_api.exceptions import MetadataApiError
+from cumulusci.utils import ZIP_SPOOL_SIZE
+
+CHUNK_SIZE = 64 * 1024
+CONTENT_LIMIT = 100 * 1024
+
+
+class Base64Decoder(object):
+    ''' Decodes base64 text written in arbitrary pieces into a file object '''
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self._pending = ''
+
+    def write(self, text):
+        data = self._pending + ''.join(text.split()).encode('ascii')
+        usable = len(data) - len(data) % 4
+        if usable:
+            self.fileobj.write(base64.b64decode(data[:usable]))
+        self._pending = data[usable:]
+
+    def close(self):
+        if self._pending:
+            self.fileobj.write(base64.b64decode(self._pending))
+            self._pending = ''
+        self.fileobj.seek(0)
+
+
+class SoapResponseHandler(ContentHandler):
+    ''' SAX handler collecting fields, records and the zipFile of a response
+
+    record_tags is a list of element names to collect as records.  Each
+    record is passed to on_record(tag, record) as soon as its element is
+    closed.  If no on_record callback is provided, records are collected in
+    self.records keyed by tag.
+    '''
+    scalar_parents = ('result', 'Fault')
+    zip_tag = 'zipFile'
+
+    def __init__(self, record_tags=None, on_record=None):
+        ContentHandler.__init__(self)
+        self.fields = {}
+        self.records = {}
+        self.record_tags = frozenset(record_tags or ())
+        if on_record is None:
+            on_record = self._append_record
+        self.on_record = on_record
+        self.zip_file = None
+        self._stack = []
+        self._text = None
+        self._leaf_depth = None
+        self._record = None
+        self._record_depth = None
+        self._zip_decoder = None
+
+    def _append_record(self, tag, record):
+        self.records.setdefault(tag, []).append(record)
+
+    def _create_zip_file(self):
+        return tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_SIZE)
+
+    def startElementNS(self, name, qname, attrs):
+        tag = name[1]
+        parent = self._stack[-1] if self._stack else None
+        self._stack.append(tag)
+        depth = len(self._stack)
+
+        if tag == self.zip_tag and parent == 'result':
+            self.zip_file = self._create_zip_file()
+            self._zip_decoder = Base64Decoder(self.zip_file)
+            self._text = None
+            self._leaf_depth = None
+            return
+
+        if self._record is None and tag in self.record_tags:
+            self._record = {}
+            self._record_depth = depth
+
+        self._leaf_depth = depth
+        if self._record is not None or parent in self.scalar_parents:
+            self._text = []
+        else:
+            self._text = None
+
+    def endElementNS(self, name, qname):
+        tag = name[1]
+        depth = len(self._stack)
+        self._stack.pop()
+        parent = self._stack[-1] if self._stack else None
+
+        if self._zip_decoder is not None:
+            self._zip_decoder.close()
+            self._zip_decoder = None
+            return
+
+        if self._leaf_depth == depth and self._text is not None:
+            value = u''.join(self._text) or None
+            if self._record is not None:
+                if depth != self._record_depth:
+                    self._record.setdefault(tag, value)
+            elif parent in self.scalar_parents:
+                self.fields.setdefault(tag, value)
+        self._text = None
+        self._leaf_depth = None
+
+        if self._record is not None and depth == self._record_depth:
+            record = self._record
+            self._record = None
+            self._record_depth = None
+            self.on_record(tag, record)
+
+    def characters(self, content):
+        if self._zip_decoder is not None:
+            self._zip_decoder.write(content)
+        elif self._text is not None:
+            self._text.append(content)
+
+
+class SoapResponse(object):
+    ''' The parsed result of a Metadata API SOAP call
+
+    content holds the raw response body, truncated to CONTENT_LIMIT bytes,
+    for use in error messages.
+    '''
+
+    def __init__(self, response, handler, content):
+        self.response = response
+        self.status_code = response.status_code
+        self.content = content
+        self.fields = handler.fields
+        self.records = handler.records
+        self.zip_file = handler.zip_file
+
+    def get(self, tag):
+        return self.fields.get(tag)
+
+    def get_records(self, tag):
+        return self.records.get(tag, [])
+
+
+def parse_response(response, handler=None, content_limit=None):
+    ''' Parses a streamed requests.Response with a SoapResponseHandler '''
+    if handler is None:
+        handler = SoapResponseHandler()
+    if content_limit is None:
+        content_limit = CONTENT_LIMIT
+
+    parser = xml.sax.make_parser()
+    parser.setFeature(feature_namespaces, True)
+    parser.setFeature(feature_external_ges, False)
+    parser.setContentHandler(handler)
+
+    content = []
+    content_size = 0
+    try:
+        for chunk in response.iter_content(CHUNK_SIZE):
+            if content_size < content_limit:
+                chunk_head = chunk[:content_limit - content_size]
+                content.append(chunk_head)
+                content_size += len(chunk_head)
+            parser.feed(chunk)
+        parser.close()
+    except xml.sax.SAXParseException as e:
+        raise MetadataApiError(
+            'Could not parse Metadata API response: {}\n{}'.format(
+                e, ''.join(content)
+            ),
+            response,
+        )
+    finally:
+        # Return the connection to the session's pool even if parsing failed
+        response.close()
+    return SoapResponse(response, handler, ''.join(content))
@@ -0,0 +1,81 @@
+import io
+import unittest
+
+from cumulusci.salesforce_api.deploy_results import CodeCoverageWarning
+from cumulusci.salesforce_api.deploy_results import ComponentFailure
+from cumulusci.salesforce_api.deploy_results import DeployResultCollector
+from cumulusci.salesforce_api.deploy_results import TestFailure
+from cumulusci.salesforce_api.deploy_results import read_results
+
+
+class TestDeployResultCollector(unittest.TestCase):
+
+    def test_component_failure(self):
+        collector = DeployResultCollector()
+        collector.on_record('componentFailures', {
+            'componentType': 'ApexClass',
+            'fileName': 'classes/Foo.cls',
+            'lineNumber': '3',
+            'columnNumber': '5',
+            'problem': 'Unexpected token',
+            'problemType': 'Error',
+            'created': 'true',
+        })
+        self.assertEqual(collector.get_count(ComponentFailure), 1)
+        self.assertEqual(
+            collector.get_log(ComponentFailure),
+            'Create of ApexClass classes/Foo.cls: Error on line 3, col 5: '
+            'Unexpected token',
+        )
+
+    def test_bounded_messages(self):
+        collector = DeployResultCollector(max_messages=2)
+        for i in range(5):
+            collector.on_record('failures', {
+                'name': 'FooTest',
+                'methodName': 'test{}'.format(i),
+                'stackTrace': 'line {}'.format(i),
+            })
+        self.assertEqual(collector.get_count(TestFailure), 5)
+        self.assertEqual(
+            collector.get_log(TestFailure),
+            'Apex Test Failure: line 0\n\n'
+            'Apex Test Failure: line 1\n\n'
+            '... and 3 more',
+        )
+
+    def test_ignores_other_tags(self):
+        collector = DeployResultCollector()
+        collector.on_record('componentSuccesses', {'fullName': 'Foo'})
+        self.assertEqual(collector.counts, {})
+
+    def test_output_round_trip(self):
+        output = io.BytesIO()
+        collector = DeployResultCollector(output, max_messages=0)
+        collector.on_record('codeCoverageWarnings', {
+            'name': 'Foo',
+            'message': 'Test coverage of selected Apex Class is 10%',
+        })
+        collector.on_record('failures', {
+            'name': 'FooTest',
+            'methodName': 'testFoo',
+            'message': 'System.AssertException',
+        })
+        output.seek(0)
+        records = list(read_results(output))
+        self.assertEqual(records, [
+            CodeCoverageWarning(
+                name=u'Foo',
+                namespace=None,
+                message=u'Test coverage of selected Apex Class is 10%',
+            ),
+            TestFailure(
+                class_name=u'FooTest',
+                method_name=u'testFoo',
+                namespace=None,
+                message=u'System.AssertException',
+                stack_trace=None,
+                time=None,
+            ),
+        ])
+        self.assertEqual(collector.messages, {})
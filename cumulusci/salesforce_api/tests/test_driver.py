@@ -0,0 +1,114 @@
+import threading
+import unittest
+
+import mock
+
+from cumulusci.core.exceptions import CumulusCIException
+from cumulusci.salesforce_api.driver import MetadataApiDriver
+
+
+class FakeApi(object):
+    ''' Stands in for a BaseMetadataApiCall which needs a number of checks '''
+
+    def __init__(self, log, name, checks=1, error=None):
+        self.log = log
+        self.name = name
+        self.checks = checks
+        self.error = error
+        self.done = False
+        self.check_delay = None
+        self.threads = set()
+
+    def _start_operation(self):
+        self.threads.add(threading.current_thread().name)
+        self.log.append(('start', self.name))
+        self.check_delay = 0
+
+    def _check_operation(self):
+        self.threads.add(threading.current_thread().name)
+        if self.error:
+            raise self.error
+        self.checks -= 1
+        if self.checks <= 0:
+            self.done = True
+            self.log.append(('done', self.name))
+
+    def _get_result(self):
+        return self.name.upper()
+
+    def _log_connection_stats(self):
+        pass
+
+
+@mock.patch('cumulusci.salesforce_api.driver.get_session')
+class TestMetadataApiDriver(unittest.TestCase):
+
+    def setUp(self):
+        self.task = mock.Mock()
+        self.log = []
+
+    def test_results_and_callbacks(self, get_session):
+        driver = MetadataApiDriver(self.task, concurrency=3)
+        callbacks = []
+
+        def callback(name, result):
+            callbacks.append((name, result, threading.current_thread().name))
+
+        for name in ('a', 'b', 'c'):
+            driver.add(FakeApi(self.log, name, checks=2), name, callback=callback)
+        results = driver()
+
+        self.assertEquals(results, {'a': 'A', 'b': 'B', 'c': 'C'})
+        main = threading.current_thread().name
+        self.assertEquals(
+            sorted(callbacks),
+            [('a', 'A', main), ('b', 'B', main), ('c', 'C', main)],
+        )
+        get_session.assert_called_once_with(self.task.org_config, 3)
+
+    def test_concurrency_one_runs_in_order(self, get_session):
+        driver = MetadataApiDriver(self.task)
+        for name in ('a', 'b', 'c'):
+            driver.add(FakeApi(self.log, name, checks=3), name)
+        driver()
+        self.assertEquals(self.log, [
+            ('start', 'a'), ('done', 'a'),
+            ('start', 'b'), ('done', 'b'),
+            ('start', 'c'), ('done', 'c'),
+        ])
+
+    def test_depends_on(self, get_session):
+        driver = MetadataApiDriver(self.task, concurrency=5)
+        driver.add(FakeApi(self.log, 'a', checks=5), 'a')
+        driver.add(FakeApi(self.log, 'b'), 'b', depends_on=['a'])
+        driver()
+        self.assertTrue(
+            self.log.index(('done', 'a')) < self.log.index(('start', 'b'))
+        )
+
+    def test_unknown_dependency(self, get_session):
+        driver = MetadataApiDriver(self.task)
+        driver.add(FakeApi(self.log, 'a'), 'a', depends_on=['b'])
+        with self.assertRaises(CumulusCIException):
+            driver()
+
+    def test_dependency_order(self, get_session):
+        driver = MetadataApiDriver(self.task)
+        driver.add(FakeApi(self.log, 'a'), 'a', depends_on=['b'])
+        driver.add(FakeApi(self.log, 'b'), 'b')
+        with self.assertRaises(CumulusCIException):
+            driver()
+
+    def test_duplicate_name(self, get_session):
+        driver = MetadataApiDriver(self.task)
+        driver.add(FakeApi(self.log, 'a'), 'a')
+        with self.assertRaises(CumulusCIException):
+            driver.add(FakeApi(self.log, 'a'), 'a')
+
+    def test_error_stops_new_operations(self, get_session):
+        driver = MetadataApiDriver(self.task)
+        driver.add(FakeApi(self.log, 'a', error=ValueError('boom')), 'a')
+        driver.add(FakeApi(self.log, 'b'), 'b')
+        with self.assertRaises(ValueError):
+            driver()
+        self.assertEquals(self.log, [('start', 'a')])
@@ -0,0 +1,77 @@
+import base64
+import io
+import unittest
+
+from cumulusci.salesforce_api.envelope_builder import Base64Stream
+from cumulusci.salesforce_api.envelope_builder import FileStream
+from cumulusci.salesforce_api.envelope_builder import SoapBody
+from cumulusci.salesforce_api.envelope_builder import SoapEnvelope
+
+TEMPLATE = '<h>###SESSION_ID###</h><b>%(payload)s</b><o>%(option)s</o>'
+
+
+class TestSoapEnvelope(unittest.TestCase):
+
+    def test_compile(self):
+        envelope = SoapEnvelope(TEMPLATE)
+        self.assertEquals(envelope.fields, set(['payload', 'option']))
+        self.assertEquals(len(envelope.segments), 7)
+
+    def test_render(self):
+        message = SoapEnvelope(TEMPLATE)(payload='data', option=u'\xe9')
+        body = message.render(u'SESSION')
+        self.assertEquals(
+            body.getvalue(),
+            '<h>SESSION</h><b>data</b><o>\xc3\xa9</o>',
+        )
+        self.assertEquals(len(body), len(body.getvalue()))
+
+    def test_render_again(self):
+        stream = FileStream(io.BytesIO('payload'))
+        message = SoapEnvelope(TEMPLATE)(payload=stream, option='x')
+        self.assertEquals(message.render('A').read(), '<h>A</h><b>payload</b><o>x</o>')
+        self.assertEquals(message.render('B').read(), '<h>B</h><b>payload</b><o>x</o>')
+
+    def test_missing_value(self):
+        with self.assertRaises(KeyError):
+            SoapEnvelope(TEMPLATE)(payload='data')
+
+
+class TestSoapBody(unittest.TestCase):
+
+    def test_read_in_pieces(self):
+        body = SoapBody(['abc', FileStream(io.BytesIO('defgh')), '', 'ij'])
+        chunks = []
+        while True:
+            chunk = body.read(2)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        self.assertEquals(chunks, ['ab', 'cd', 'ef', 'gh', 'ij'])
+        self.assertEquals(len(body), 10)
+
+    def test_iter(self):
+        body = SoapBody(['abc', 'def'])
+        self.assertEquals(''.join(body), 'abcdef')
+
+
+class TestBase64Stream(unittest.TestCase):
+
+    def test_encode(self):
+        for size in range(0, 10):
+            data = ''.join(chr(i) for i in range(size))
+            stream = Base64Stream(io.BytesIO(data))
+            encoded = []
+            while True:
+                chunk = stream.read(5)
+                if not chunk:
+                    break
+                encoded.append(chunk)
+            self.assertEquals(''.join(encoded), base64.b64encode(data))
+            self.assertEquals(len(stream), len(base64.b64encode(data)))
+
+    def test_from_position(self):
+        fileobj = io.BytesIO('skip-data')
+        fileobj.seek(5)
+        stream = Base64Stream(fileobj)
+        self.assertEquals(stream.getvalue(), base64.b64encode('data'))
@@ -0,0 +1,227 @@
+import base64
+import io
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+import mock
+import responses
+
+from cumulusci.salesforce_api.deploy_results import read_results
+from cumulusci.salesforce_api.exceptions import MetadataApiError
+from cumulusci.salesforce_api.exceptions import MetadataComponentFailure
+from cumulusci.salesforce_api.metadata import ApiDeploy
+from cumulusci.salesforce_api.metadata import ApiListMetadata
+
+ENDPOINT = 'https://na1.salesforce.com/services/Soap/m/33.0/00D000000000001'
+
+ENVELOPE = '''<?xml version="1.0" encoding="UTF-8"?>
+<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" xmlns="http://soap.sforce.com/2006/04/metadata">
+<soapenv:Body><listMetadataResponse>{}</listMetadataResponse></soapenv:Body>
+</soapenv:Envelope>'''
+
+DEPLOY_ENVELOPE = '''<?xml version="1.0" encoding="UTF-8"?>
+<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" xmlns="http://soap.sforce.com/2006/04/metadata" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+<soapenv:Body><checkDeployStatusResponse><result>{}</result></checkDeployStatusResponse></soapenv:Body>
+</soapenv:Envelope>'''
+
+COMPONENT_FAILURE = (
+    '<componentFailures><columnNumber>2</columnNumber>'
+    '<componentType>ApexClass</componentType><created>false</created>'
+    '<deleted>false</deleted><fullName>{}</fullName>'
+    '<lineNumber>1</lineNumber><problem>Bad</problem>'
+    '<problemType>Error</problemType></componentFailures>'
+)
+
+RESULT = '<result><fullName>{}</fullName><type>{}</type></result>'
+
+
+def create_task():
+    task = mock.Mock()
+    task.org_config.org_id = '00D000000000001'
+    task.org_config.instance_url = 'https://na1.salesforce.com'
+    task.org_config.access_token = 'TOKEN'
+    task.project_config.cumulusci__metadata_api__pool_maxsize = None
+    task.project_config.cumulusci__metadata_api__retrieve_cache = None
+    return task
+
+
+class TestApiListMetadata(unittest.TestCase):
+
+    def test_build_envelope_start(self):
+        api = ApiListMetadata(
+            create_task(),
+            queries=[('Report', 'Folder & Co'), ('CustomObject', None)],
+        )
+        envelope = api._build_envelope_start().render('SID').getvalue()
+        self.assertEquals(envelope.count('<queries>'), 2)
+        self.assertIn('<folder>Folder &amp; Co</folder>', envelope)
+        self.assertEquals(envelope.count('<folder>'), 1)
+
+    @responses.activate
+    def test_single_type(self):
+        responses.add(
+            responses.POST,
+            ENDPOINT,
+            body=ENVELOPE.format(RESULT.format('Account', 'CustomObject')),
+        )
+        api = ApiListMetadata(create_task(), 'CustomObject')
+        metadata = api()
+        self.assertEquals(len(responses.calls), 1)
+        self.assertEquals(
+            [item['fullName'] for item in metadata['CustomObject']],
+            ['Account'],
+        )
+
+    @responses.activate
+    def test_results_keyed_by_requested_type(self):
+        responses.add(
+            responses.POST,
+            ENDPOINT,
+            body=ENVELOPE.format(RESULT.format('Folder/Report', 'Folder')),
+        )
+        api = ApiListMetadata(create_task(), 'Report', folder='Folder')
+        metadata = api()
+        self.assertEquals(metadata.keys(), ['Report'])
+        self.assertEquals(metadata['Report'][0]['fullName'], 'Folder/Report')
+
+    @responses.activate
+    def test_batched_queries(self):
+        def request_callback(request):
+            # Answer with a member per folder queried since the batches are
+            # sent concurrently
+            body = request.body.getvalue()
+            return (200, {}, ENVELOPE.format(''.join(
+                RESULT.format(folder + '/Item', 'Report')
+                for folder in re.findall('<folder>(.*?)</folder>', body)
+            )))
+
+        responses.add_callback(responses.POST, ENDPOINT, callback=request_callback)
+        queries = [('Report', 'Folder{}'.format(i)) for i in range(4)]
+        queries.append(('Dashboard', 'Folder'))
+        api = ApiListMetadata(create_task(), queries=queries, concurrency=2)
+        self.assertEquals(
+            [[query[1] for query in batch] for batch in api._get_batches()],
+            [['Folder0', 'Folder1', 'Folder2'], ['Folder3'], ['Folder']],
+        )
+        metadata = api()
+
+        self.assertEquals(len(responses.calls), 3)
+        self.assertEquals(
+            sorted(item['fullName'] for item in metadata['Report']),
+            ['Folder{}/Item'.format(i) for i in range(4)],
+        )
+        self.assertEquals(
+            [item['fullName'] for item in metadata['Dashboard']],
+            ['Folder/Item'],
+        )
+
+
+class TestApiDeploy(unittest.TestCase):
+
+    def test_build_envelope_start_file(self):
+        zip_file = io.BytesIO('zip content')
+        api = ApiDeploy(create_task(), zip_file)
+        message = api._build_envelope_start()
+        encoded = '<ZipFile>{}</ZipFile>'.format(base64.b64encode('zip content'))
+        # Rendering twice, e.g. after a session refresh, resends the whole zip
+        self.assertIn(encoded, message.render('SID').getvalue())
+        self.assertIn(encoded, message.render('SID').getvalue())
+
+    def test_build_envelope_start_string(self):
+        api = ApiDeploy(create_task(), 'ZW5jb2RlZA==', purge_on_delete=False)
+        envelope = api._build_envelope_start().render('SID').getvalue()
+        self.assertIn('<ZipFile>ZW5jb2RlZA==</ZipFile>', envelope)
+        self.assertIn('<purgeOnDelete>false</purgeOnDelete>', envelope)
+
+    def test_build_envelope_status(self):
+        api = ApiDeploy(create_task(), 'ZW5jb2RlZA==')
+        api.process_id = '0Af000000000001'
+        status = api._build_envelope_status().render('SID').getvalue()
+        self.assertIn('<includeDetails>false</includeDetails>', status)
+        result = api._build_envelope_result().render('SID').getvalue()
+        self.assertIn('<includeDetails>true</includeDetails>', result)
+
+    @responses.activate
+    def test_component_failures(self):
+        responses.add(
+            responses.POST,
+            ENDPOINT,
+            body=DEPLOY_ENVELOPE.format(
+                '<status>Failed</status><details>' +
+                COMPONENT_FAILURE.format('Foo') +
+                COMPONENT_FAILURE.format('Bar') +
+                '</details>'
+            ),
+        )
+        tempdir = tempfile.mkdtemp()
+        try:
+            results_output = os.path.join(tempdir, 'results.json')
+            api = ApiDeploy(
+                create_task(),
+                'ZW5jb2RlZA==',
+                results_output=results_output,
+            )
+            api.process_id = '0Af000000000001'
+            message = api._build_envelope_result()
+            response = api._call_mdapi(api.soap_action_result, message)
+            with self.assertRaises(MetadataComponentFailure) as cm:
+                api._process_response(response)
+            self.assertEqual(
+                cm.exception.message,
+                'Update of ApexClass Foo: Error on line 1, col 2: Bad\n\n'
+                'Update of ApexClass Bar: Error on line 1, col 2: Bad',
+            )
+            with open(results_output, 'r') as f:
+                records = list(read_results(f))
+        finally:
+            shutil.rmtree(tempdir)
+        self.assertEqual(
+            [record.file_name for record in records],
+            ['Foo', 'Bar'],
+        )
+
+    @responses.activate
+    def test_results_output_closed_on_error(self):
+        responses.add(responses.POST, ENDPOINT, body='<html>Server Error')
+        tempdir = tempfile.mkdtemp()
+        try:
+            results_output = os.path.join(tempdir, 'results.json')
+            api = ApiDeploy(
+                create_task(),
+                'ZW5jb2RlZA==',
+                results_output=results_output,
+            )
+            api.process_id = '0Af000000000001'
+            message = api._build_envelope_result()
+            with self.assertRaises(MetadataApiError):
+                api._call_mdapi(api.soap_action_result, message)
+            self.assertIsNone(api.results.output)
+            self.assertTrue(os.path.isfile(results_output))
+        finally:
+            shutil.rmtree(tempdir)
+
+    @responses.activate
+    def test_code_coverage_failure(self):
+        responses.add(
+            responses.POST,
+            ENDPOINT,
+            body=DEPLOY_ENVELOPE.format(
+                '<status>Failed</status><details><runTestResult>'
+                '<codeCoverageWarnings><message>Average test coverage is 50%'
+                '</message><name xsi:nil="true"/></codeCoverageWarnings>'
+                '</runTestResult></details>'
+            ),
+        )
+        api = ApiDeploy(create_task(), 'ZW5jb2RlZA==')
+        api.process_id = '0Af000000000001'
+        message = api._build_envelope_result()
+        response = api._call_mdapi(api.soap_action_result, message)
+        with self.assertRaises(MetadataApiError) as cm:
+            api._process_response(response)
+        self.assertEqual(
+            cm.exception.message,
+            'Code Coverage Warning: Average test coverage is 50%',
+        )
@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import mock
+
+from cumulusci.salesforce_api.package_zip import MetadataZipBuilder
+from cumulusci.salesforce_api.package_zip import ZipCompressionCache
+
+
+class TestMetadataZipBuilder(unittest.TestCase):
+
+    def setUp(self):
+        self.src = tempfile.mkdtemp()
+        self.cache_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.src, 'classes'))
+        self._write('package.xml', '<Package/>')
+        self._write('classes/%%%NAMESPACE%%%Test.cls', 'class %%%NAMESPACE%%%Test {}')
+        self._write('classes/Other.cls', 'x' * 10000)
+
+    def tearDown(self):
+        shutil.rmtree(self.src)
+        shutil.rmtree(self.cache_dir)
+
+    def _write(self, path, content):
+        with open(os.path.join(self.src, path), 'wb') as f:
+            f.write(content)
+
+    def _read_zip(self, zip_file):
+        zipf = zipfile.ZipFile(zip_file)
+        self.assertIsNone(zipf.testzip())
+        return dict((name, zipf.read(name)) for name in zipf.namelist())
+
+    def test_build(self):
+        cwd = os.getcwd()
+        builder = MetadataZipBuilder(self.src, workers=2)
+        contents = self._read_zip(builder())
+        self.assertEquals(os.getcwd(), cwd)
+        self.assertEquals(sorted(contents.keys()), [
+            'classes/%%%NAMESPACE%%%Test.cls',
+            'classes/Other.cls',
+            'package.xml',
+        ])
+        self.assertEquals(contents['classes/Other.cls'], 'x' * 10000)
+
+    def test_replacements(self):
+        builder = MetadataZipBuilder(
+            self.src,
+            content_replacements=[('%%%NAMESPACE%%%', 'ns__')],
+            filename_replacements=[('%%%NAMESPACE%%%', 'ns__')],
+        )
+        contents = self._read_zip(builder())
+        self.assertEquals(contents['classes/ns__Test.cls'], 'class ns__Test {}')
+
+    def test_cache(self):
+        cache = ZipCompressionCache(self.cache_dir)
+        builder = MetadataZipBuilder(self.src, cache=cache)
+        first = self._read_zip(builder())
+
+        with mock.patch('zlib.compressobj') as compressobj:
+            second = self._read_zip(builder())
+            self.assertFalse(compressobj.called)
+        self.assertEquals(first, second)
+
+        # Different replacements don't reuse the cached entries
+        builder = MetadataZipBuilder(
+            self.src,
+            cache=cache,
+            content_replacements=[('%%%NAMESPACE%%%', 'ns__')],
+        )
+        contents = self._read_zip(builder())
+        self.assertEquals(
+            contents['classes/%%%NAMESPACE%%%Test.cls'],
+            'class ns__Test {}',
+        )
+
+    def test_cache_prune(self):
+        cache = ZipCompressionCache(self.cache_dir, max_age=1)
+        cache.set('abcdef', 1, 2, 'data')
+        path = cache._get_path('abcdef')
+        os.utime(path, (0, 0))
+        cache.prune()
+        self.assertFalse(os.path.exists(path))
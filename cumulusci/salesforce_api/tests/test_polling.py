@@ -0,0 +1,108 @@
+import unittest
+
+from cumulusci.salesforce_api.exceptions import MetadataApiTimeoutError
+from cumulusci.salesforce_api.polling import AdaptivePolling
+from cumulusci.salesforce_api.polling import ProgressivePolling
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeResponse(object):
+
+    def __init__(self, **fields):
+        self.fields = dict((k, str(v)) for k, v in fields.items())
+
+    def get(self, tag):
+        return self.fields.get(tag)
+
+
+class TestProgressivePolling(unittest.TestCase):
+
+    def test_intervals(self):
+        polling = ProgressivePolling(check_interval=1)
+        polling.start()
+        intervals = [polling.update() for i in range(7)]
+        self.assertEquals(intervals, [1, 1, 2, 2, 2, 3, 3])
+
+
+class TestAdaptivePolling(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def _polling(self, **kwargs):
+        kwargs.setdefault('jitter', 0)
+        polling = AdaptivePolling(clock=self.clock, **kwargs)
+        polling.start()
+        return polling
+
+    def test_no_progress_grows_with_elapsed(self):
+        polling = self._polling(max_interval=30)
+        self.assertEquals(polling.update(), 1)
+        self.clock.now = 100
+        self.assertEquals(polling.update(), 20)
+        self.clock.now = 1000
+        self.assertEquals(polling.update(), 30)
+
+    def test_progress_estimate(self):
+        polling = self._polling(max_interval=600)
+        self.clock.now = 10
+        polling.update(FakeResponse(
+            numberTestsCompleted=0,
+            numberTestsTotal=100,
+        ))
+        self.clock.now = 110
+        # 10 tests per 100 seconds leaves 900 seconds, checking after half
+        interval = polling.update(FakeResponse(
+            numberTestsCompleted=10,
+            numberTestsTotal=100,
+        ))
+        self.assertEquals(interval, 450)
+
+    def test_progress_does_not_reset_on_state_change(self):
+        polling = self._polling(max_interval=30)
+        self.clock.now = 200
+        interval = polling.update(FakeResponse(stateDetail='Processing'))
+        self.assertEquals(interval, 30)
+
+    def test_components_then_tests(self):
+        polling = self._polling(max_interval=600)
+        polling.update(FakeResponse(
+            numberComponentsDeployed=5,
+            numberComponentsTotal=10,
+            numberTestsTotal=10,
+        ))
+        self.clock.now = 50
+        polling.update(FakeResponse(
+            numberComponentsDeployed=10,
+            numberComponentsTotal=10,
+            numberTestsCompleted=1,
+            numberTestsTotal=10,
+        ))
+        # A new phase has no rate yet so falls back to elapsed time
+        self.assertEquals(polling.interval, 10)
+
+    def test_min_interval(self):
+        polling = self._polling(min_interval=5)
+        self.assertEquals(polling.update(), 5)
+
+    def test_jitter(self):
+        polling = self._polling(jitter=0.5, min_interval=0, max_interval=100)
+        self.clock.now = 100
+        interval = polling.update()
+        self.assertTrue(10 <= interval <= 30)
+
+    def test_timeout(self):
+        polling = self._polling(timeout=60, max_interval=30)
+        self.clock.now = 50
+        self.assertEquals(polling.update(), 10)
+        self.clock.now = 60
+        with self.assertRaises(MetadataApiTimeoutError):
+            polling.update()
@@ -0,0 +1,152 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import zipfile
+
+import mock
+
+from cumulusci.salesforce_api.metadata import ApiDeploy
+from cumulusci.salesforce_api.metadata import ApiRetrievePackaged
+from cumulusci.salesforce_api.retrieve_cache import RetrieveCache
+from cumulusci.salesforce_api.retrieve_cache import get_retrieve_cache
+
+ORG_ID = '00D000000000001'
+
+
+def create_zip():
+    f = io.BytesIO()
+    zf = zipfile.ZipFile(f, 'w')
+    zf.writestr('Test/classes/Foo.cls', 'class Foo {}')
+    zf.close()
+    f.seek(0)
+    return f
+
+
+class TestRetrieveCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cache = RetrieveCache(self.tempdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_set_get(self):
+        key = self.cache.get_key('packaged', '36.0', 'Test')
+        self.assertIsNone(self.cache.get(ORG_ID, key))
+        zip_file = create_zip()
+        self.cache.set(ORG_ID, key, zip_file)
+        self.assertEqual(zip_file.tell(), 0)
+        cached = self.cache.get(ORG_ID, key)
+        self.assertEqual(cached.read(), zip_file.read())
+        cached.close()
+
+    def test_get_key(self):
+        self.assertNotEqual(
+            self.cache.get_key('packaged', '36.0', 'Test'),
+            self.cache.get_key('packaged', '37.0', 'Test'),
+        )
+
+    def test_expired(self):
+        key = self.cache.get_key('packaged', '36.0', 'Test')
+        self.cache.set(ORG_ID, key, create_zip())
+        self.cache.max_age = 60
+        path = self.cache._get_path(ORG_ID, key)
+        os.utime(path, (time.time() - 120, time.time() - 120))
+        self.assertIsNone(self.cache.get(ORG_ID, key))
+        self.assertFalse(os.path.exists(path))
+
+    def test_invalidate(self):
+        key = self.cache.get_key('packaged', '36.0', 'Test')
+        self.cache.set(ORG_ID, key, create_zip())
+        self.cache.set('00D000000000002', key, create_zip())
+        self.cache.invalidate(ORG_ID)
+        self.assertIsNone(self.cache.get(ORG_ID, key))
+        self.assertIsNotNone(self.cache.get('00D000000000002', key))
+
+
+class TestGetRetrieveCache(unittest.TestCase):
+
+    def test_disabled(self):
+        project_config = mock.Mock()
+        project_config.cumulusci__metadata_api__retrieve_cache = {
+            'enabled': False,
+        }
+        self.assertIsNone(get_retrieve_cache(project_config))
+
+    def test_enabled(self):
+        project_config = mock.Mock()
+        project_config.project_local_dir = '/tmp/project'
+        project_config.cumulusci__metadata_api__retrieve_cache = {
+            'enabled': True,
+            'max_age': '60',
+        }
+        cache = get_retrieve_cache(project_config)
+        self.assertEqual(cache.path, '/tmp/project/retrieve_cache')
+        self.assertEqual(cache.max_age, 60)
+
+
+class TestCachedRetrieve(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.task = mock.Mock()
+        self.task.org_config.org_id = ORG_ID
+        self.task.project_config.project_local_dir = self.tempdir
+        self.task.project_config.cumulusci__metadata_api__retrieve_cache = {
+            'enabled': True,
+        }
+        self.cache = get_retrieve_cache(self.task.project_config)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_retrieve_cached(self):
+        response = mock.Mock()
+        response.zip_file = create_zip()
+        extract_path = os.path.join(self.tempdir, 'first')
+        api = ApiRetrievePackaged(
+            self.task, 'Test', '36.0', extract_path=extract_path, cache=self.cache
+        )
+        api._process_response(response)
+        self.assertTrue(
+            os.path.isfile(os.path.join(extract_path, 'classes', 'Foo.cls'))
+        )
+
+        extract_path = os.path.join(self.tempdir, 'second')
+        api = ApiRetrievePackaged(
+            self.task, 'Test', '36.0', extract_path=extract_path, cache=self.cache
+        )
+        with mock.patch.object(ApiRetrievePackaged, '_get_response') as get_response:
+            self.assertEqual(api(), extract_path)
+        self.assertFalse(get_response.called)
+        self.assertTrue(
+            os.path.isfile(os.path.join(extract_path, 'classes', 'Foo.cls'))
+        )
+
+    def test_retrieve_cached_closes_file(self):
+        key = self.cache.get_key('packaged', '36.0', 'Test')
+        self.cache.set(ORG_ID, key, create_zip())
+        opened = []
+        get = self.cache.get
+
+        def get_and_record(*args):
+            cached = get(*args)
+            opened.append(cached)
+            return cached
+
+        self.cache.get = get_and_record
+        api = ApiRetrievePackaged(self.task, 'Test', '36.0', cache=self.cache)
+        zip_file = api()
+        self.assertTrue(opened[0].closed)
+        self.assertEqual(zip_file.read('Test/classes/Foo.cls'), 'class Foo {}')
+
+    def test_deploy_invalidates(self):
+        key = self.cache.get_key('packaged', '36.0', 'Test')
+        self.cache.set(ORG_ID, key, create_zip())
+        api = ApiDeploy(self.task, 'ZW5jb2RlZA==')
+        api._invalidate_retrieve_cache()
+        self.assertIsNone(self.cache.get(ORG_ID, key))
@@ -0,0 +1,72 @@
+import BaseHTTPServer
+import threading
+import unittest
+
+from cumulusci.core.config import OrgConfig
+from cumulusci.salesforce_api.session import close_sessions
+from cumulusci.salesforce_api.session import get_session
+
+
+class KeepAliveHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write('ok')
+
+    def log_message(self, *args):
+        pass
+
+
+class TestOrgSession(unittest.TestCase):
+
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:{}/'.format(self.server.server_port)
+        self.org_config = OrgConfig({'id': 'https://example.com/id/ORGID/USERID'})
+
+    def tearDown(self):
+        close_sessions()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_get_session_shared_per_org(self):
+        session = get_session(self.org_config)
+        self.assertIs(session, get_session(self.org_config))
+        other_org = OrgConfig({'id': 'https://example.com/id/ORGID2/USERID'})
+        self.assertIsNot(session, get_session(other_org))
+
+    def test_get_session_pool_maxsize(self):
+        session = get_session(self.org_config, 2)
+        self.assertEqual(session.pool_maxsize, 2)
+        get_session(self.org_config, 5)
+        self.assertEqual(session.pool_maxsize, 5)
+        get_session(self.org_config, 3)
+        self.assertEqual(session.pool_maxsize, 5)
+
+    def test_set_pool_maxsize_closes_previous_adapter(self):
+        session = get_session(self.org_config, 2)
+        previous = session.session.adapters['http://']
+        session.get(self.url)
+        self.assertEqual(len(previous.poolmanager.pools), 1)
+        session.set_pool_maxsize(5)
+        self.assertEqual(len(previous.poolmanager.pools), 0)
+        self.assertIsNot(session.session.adapters['http://'], previous)
+
+    def test_connection_reuse(self):
+        session = get_session(self.org_config)
+        response, new_connection = session.get(self.url)
+        self.assertEqual(response.content, 'ok')
+        self.assertTrue(new_connection)
+        response, new_connection = session.get(self.url)
+        self.assertFalse(new_connection)
+        self.assertEqual(session.stats, {
+            'requests': 2,
+            'new_connections': 1,
+            'reused_connections': 1,
+        })
@@ -0,0 +1,103 @@
+import base64
+import io
+import unittest
+import zipfile
+
+import mock
+
+from cumulusci.salesforce_api.exceptions import MetadataApiError
+from cumulusci.salesforce_api.soap_parser import Base64Decoder
+from cumulusci.salesforce_api.soap_parser import SoapResponseHandler
+from cumulusci.salesforce_api.soap_parser import parse_response
+
+ENVELOPE = '''<?xml version="1.0" encoding="UTF-8"?>
+<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" xmlns="http://soap.sforce.com/2006/04/metadata">
+<soapenv:Body>{}</soapenv:Body>
+</soapenv:Envelope>'''
+
+
+def mock_response(body, chunk_size=7):
+    response = mock.Mock()
+    response.status_code = 200
+    response.iter_content.return_value = [
+        body[i:i + chunk_size] for i in range(0, len(body), chunk_size)
+    ]
+    return response
+
+
+class TestBase64Decoder(unittest.TestCase):
+
+    def test_write_in_pieces(self):
+        data = 'x' * 1000
+        encoded = base64.encodestring(data)
+        f = io.BytesIO()
+        decoder = Base64Decoder(f)
+        for i in range(0, len(encoded), 5):
+            decoder.write(unicode(encoded[i:i + 5]))
+        decoder.close()
+        self.assertEqual(f.read(), data)
+
+
+class TestParseResponse(unittest.TestCase):
+
+    def test_fault(self):
+        body = ENVELOPE.format(
+            '<soapenv:Fault><faultcode>sf:INVALID_SESSION_ID</faultcode>'
+            '<faultstring>Invalid Session ID</faultstring></soapenv:Fault>'
+        )
+        response = parse_response(mock_response(body))
+        self.assertEqual(response.get('faultcode'), 'sf:INVALID_SESSION_ID')
+        self.assertEqual(response.get('faultstring'), 'Invalid Session ID')
+        self.assertEqual(response.content, body)
+
+    def test_status_fields_ignore_nested(self):
+        body = ENVELOPE.format(
+            '<checkDeployStatusResponse><result>'
+            '<details><componentSuccesses><id>NESTED</id></componentSuccesses></details>'
+            '<done>false</done><id>0Af000000000001</id>'
+            '<stateDetail>Running Test: Foo</stateDetail><status>InProgress</status>'
+            '</result></checkDeployStatusResponse>'
+        )
+        response = parse_response(mock_response(body))
+        self.assertEqual(response.get('id'), '0Af000000000001')
+        self.assertEqual(response.get('done'), 'false')
+        self.assertEqual(response.get('stateDetail'), 'Running Test: Foo')
+        self.assertEqual(response.get('status'), 'InProgress')
+
+    def test_records(self):
+        body = ENVELOPE.format(
+            '<checkDeployStatusResponse><result><details>'
+            '<componentFailures><fullName>Foo</fullName><problem>Bad</problem></componentFailures>'
+            '<componentFailures><fullName>Bar</fullName><problem>Worse</problem></componentFailures>'
+            '</details><status>Failed</status></result></checkDeployStatusResponse>'
+        )
+        handler = SoapResponseHandler(record_tags=['componentFailures'])
+        response = parse_response(mock_response(body), handler)
+        self.assertEqual(response.get_records('componentFailures'), [
+            {'fullName': 'Foo', 'problem': 'Bad'},
+            {'fullName': 'Bar', 'problem': 'Worse'},
+        ])
+        self.assertEqual(response.get('status'), 'Failed')
+
+    def test_zip_file(self):
+        zip_buffer = io.BytesIO()
+        zip_src = zipfile.ZipFile(zip_buffer, 'w')
+        zip_src.writestr('unpackaged/package.xml', '<Package/>')
+        zip_src.close()
+        body = ENVELOPE.format(
+            '<checkRetrieveStatusResponse><result><done>true</done>'
+            '<zipFile>{}</zipFile></result></checkRetrieveStatusResponse>'.format(
+                base64.encodestring(zip_buffer.getvalue())
+            )
+        )
+        response = parse_response(mock_response(body), content_limit=10)
+        self.assertEqual(response.get('done'), 'true')
+        self.assertEqual(len(response.content), 10)
+        zip_dest = zipfile.ZipFile(response.zip_file)
+        self.assertEqual(zip_dest.read('unpackaged/package.xml'), '<Package/>')
+
+    def test_invalid_xml(self):
+        response = mock_response('<html>Server Error')
+        with self.assertRaises(MetadataApiError):
+            parse_response(response)
+        response.close.assert_called_once_with()
@@ -0,0 +1,244 @@
+''' Parser for the debug logs of Apex test classes
+
+A log is read in a single pass.  The event token between the first two
+pipes of each line is looked up in a table of handlers, lines for other
+events are skipped without being decoded or split, and timestamps are
+converted to integer nanoseconds once per line that needs one.
+
+For each test method the parser returns the limit usage and duration as
+stats, and the code units such as triggers run by the method as children:
+
+    {method: {'stats': stats, 'children': children}}
+
+Logs can be downloaded and parsed in pool processes with fetch_log().
+'''
+
+import io
+import re
+
+import requests
+
+CHUNK_SIZE = 64 * 1024
+
+# The number of logs downloaded and parsed at once by default
+DEFAULT_LOG_WORKERS = 10
+
+NS_PER_MS = 10 ** 6
+NS_PER_SECOND = 10 ** 9
+NS_PER_HOUR = 3600 * NS_PER_SECOND
+NS_PER_DAY = 24 * NS_PER_HOUR
+
+MAX_SIZE_MARKER = '* MAXIMUM DEBUG LOG SIZE REACHED *'
+
+TRIGGER_RE = re.compile(r'(.*) on (.*) trigger event (.*) for.*')
+
+
+def decode(content):
+    if content:
+        try:
+            # Try to decode ISO-8859-1 to unicode
+            return content.decode('ISO-8859-1')
+        except UnicodeEncodeError:
+            # Assume content is unicode already
+            return content
+
+
+def parse_timestamp(timestamp):
+    ''' Returns the nanoseconds since midnight of a HH:MM:SS.mmm timestamp '''
+    hours, minutes, seconds = timestamp.split(':')
+    seconds, millis = seconds.split('.')
+    return (
+        ((int(hours) * 60 + int(minutes)) * 60 + int(seconds)) * NS_PER_SECOND
+        + int(millis) * NS_PER_MS
+    )
+
+
+def get_duration(start, end):
+    ''' Returns the seconds between two timestamps in nanoseconds, assuming
+    end is on the next day if its hour is before the start's
+    '''
+    if start // NS_PER_HOUR > end // NS_PER_HOUR:
+        end += NS_PER_DAY
+    return float(end - start) / NS_PER_SECOND
+
+
+class ApexLogParser(object):
+    ''' Parses the stats and children of each test method in a class's log '''
+
+    def __init__(self, class_name):
+        self.class_name = decode(class_name)
+        self.method_prefix = self.class_name + u'.'
+        self.handlers = {
+            'CODE_UNIT_STARTED': self._code_unit_started,
+            'CODE_UNIT_FINISHED': self._code_unit_finished,
+            'CUMULATIVE_LIMIT_USAGE': self._cumulative_limit_usage,
+            'TESTING_LIMITS': self._testing_limits,
+            'LIMIT_USAGE_FOR_NS': self._limit_usage_for_ns,
+        }
+
+    def parse(self, lines):
+        ''' Yields a tuple of (method, stats, children) per test method '''
+        self.stats = {}
+        self.in_limits = False
+        self.in_testing_limits = False
+        self.method = None
+        self.method_start = None
+        self.children = []
+        self.stack = []
+        handlers = self.handlers
+
+        for line in lines:
+            start = line.find('|')
+            if start == -1:
+                line = line.strip()
+                if self.in_limits:
+                    self._limit(line)
+                elif MAX_SIZE_MARKER in line:
+                    # If debug log size limit was reached, fail gracefully
+                    break
+                continue
+            end = line.find('|', start + 1)
+            if end == -1:
+                token = line[start + 1:].strip()
+            else:
+                token = line[start + 1:end]
+            handler = handlers.get(token)
+            if handler is not None:
+                result = handler(line.strip())
+                if result is not None:
+                    yield result
+
+    def _limit(self, line):
+        if ':' not in line:
+            # The end of the limits section
+            self.in_limits = False
+            self.in_testing_limits = False
+            return
+        # Parse the limit name, used, and allowed values
+        limit, value = decode(line).split(': ')
+        if self.in_testing_limits:
+            limit = u'TESTING_LIMITS: ' + limit
+        used, allowed = value.split(' out of ')
+        self.stats[limit] = {'used': used, 'allowed': allowed}
+
+    def _code_unit_started(self, line):
+        parts = line.split('|', 3)
+        if len(parts) < 4 or parts[2] != '[EXTERNAL]':
+            return
+        timestamp = parts[0].split(' ', 1)[0]
+        unit = decode(parts[3].rsplit('|', 1)[-1]) or u''
+        if unit.startswith(self.method_prefix):
+            self.method = unit.split('.')[-1]
+            self.method_start = parse_timestamp(timestamp)
+            self.children = []
+            self.stack = []
+            return
+        unit_type = 'other'
+        unit_info = {}
+        match = TRIGGER_RE.match(unit) if 'trigger event' in unit else None
+        if match:
+            unit_type = 'trigger'
+            unit, obj, event = match.groups()
+            unit_info = {'event': event, 'object': obj}
+        # Add the start timestamp to unit_info
+        unit_info['start_timestamp'] = decode(timestamp)
+        self.stack.append({
+            'unit': unit,
+            'unit_type': unit_type,
+            'unit_info': unit_info,
+            'stats': {},
+            'children': [],
+        })
+
+    def _code_unit_finished(self, line):
+        if self.method_start is None:
+            return
+        parts = line.split('|', 3)
+        self.stats['duration'] = get_duration(
+            self.method_start,
+            parse_timestamp(parts[0].split(' ', 1)[0]),
+        )
+        unit = decode(parts[2]) if len(parts) > 2 else None
+        if unit and unit.startswith(self.method_prefix + self.method):
+            # Handle the finish of test methods
+            result = (self.method, self.stats, self.children)
+            self.stats = {}
+            self.in_limits = False
+            return result
+        # Handle all other code units finishing
+        if not self.stack:
+            # Skip if there was no stack. This seems to have have started
+            # in Spring 16 where the debug log will contain
+            # CODE_UNIT_FINISHED lines which have no matching
+            # CODE_UNIT_STARTED from earlier in the file.
+            return
+        child = self.stack.pop()
+        child['stats'] = self.stats
+        if not self.stack:
+            # Add the child to the main children list
+            self.children.append(child)
+        else:
+            # Add this child to its parent
+            self.stack[-1]['children'].append(child)
+        self.stats = {}
+        self.in_limits = False
+
+    def _cumulative_limit_usage(self, line):
+        self.in_testing_limits = False
+
+    def _testing_limits(self, line):
+        self.in_testing_limits = True
+
+    def _limit_usage_for_ns(self, line):
+        parts = line.split('|', 3)
+        if len(parts) == 4 and parts[2] == '(default)':
+            # The start of the limits section
+            self.in_limits = True
+
+
+def parse_log(class_name, lines):
+    ''' Returns the stats and children of each test method in a log '''
+    methods = {}
+    for method, stats, children in ApexLogParser(class_name).parse(lines):
+        methods[method] = {'stats': stats, 'children': children}
+    return methods
+
+
+def _tee(lines, f):
+    for line in lines:
+        f.write((decode(line) or u'') + u'\n')
+        yield line
+
+
+def read_log(response, class_name, log_file=None):
+    ''' Parses a streamed log body response, copying it to log_file if set '''
+    try:
+        lines = response.iter_lines(CHUNK_SIZE)
+        if not log_file:
+            return parse_log(class_name, lines)
+        with io.open(log_file, mode='w', encoding='utf-8') as f:
+            lines = _tee(lines, f)
+            methods = parse_log(class_name, lines)
+            # Copy the rest of the log if parsing stopped early
+            for line in lines:
+                pass
+        return methods
+    finally:
+        response.close()
+
+
+_session = None
+
+
+def fetch_log(job):
+    ''' Downloads and parses a log in a pool process
+
+    job is a tuple of (url, headers, class_name, log_file).  Each process
+    keeps its own keep-alive session.
+    '''
+    global _session
+    if _session is None:
+        _session = requests.Session()
+    url, headers, class_name, log_file = job
+    response = _session.get(url, headers=headers, stream=True)
+    return read_log(response, class_name, log_file)
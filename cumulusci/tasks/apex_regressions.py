@@ -0,0 +1,199 @@
+''' Duration and governor limit regressions between two Apex test runs
+
+A run is either the json_output file written by RunApexTestsDebug or a run
+stored in the project's test history.  Both are reduced to the measures of
+each test method, its duration and the used amount of each limit:
+
+    {(class_name, method): {'duration': 1.5, 'Number of SOQL queries': 3}}
+
+A measure has regressed when it grew by more than the threshold percentage
+from the base run.
+'''
+
+from collections import namedtuple
+import json
+import os
+
+from cumulusci.core.exceptions import ApexTestException
+from cumulusci.core.exceptions import TaskOptionsError
+from cumulusci.core.tasks import BaseTask
+from cumulusci.tasks.apex_tests import load_history
+
+
+class Regression(namedtuple('Regression', [
+    'class_name',
+    'method',
+    'measure',
+    'base',
+    'value',
+])):
+    __slots__ = ()
+
+    @property
+    def percent(self):
+        ''' The growth from base in percent, or None if base was 0 '''
+        if self.base:
+            return 100.0 * (self.value - self.base) / self.base
+
+    def __str__(self):
+        if self.percent is None:
+            change = 'new'
+        else:
+            change = '+{:.1f}%'.format(self.percent)
+        return '{}.{}: {} {} -> {} ({})'.format(
+            self.class_name,
+            self.method,
+            self.measure,
+            self.base,
+            self.value,
+            change,
+        )
+
+
+def get_results_measures(test_results):
+    ''' Returns the measures of each method in RunApexTestsDebug results '''
+    measures = {}
+    for result in test_results:
+        stats = result.get('Stats') or {}
+        method = {}
+        for name, value in stats.items():
+            if name == 'duration':
+                method[name] = value
+            elif isinstance(value, dict) and 'used' in value:
+                method[name] = int(value['used'])
+        measures[(result['ClassName'], result['Method'])] = method
+    return measures
+
+
+def get_history_measures(run):
+    ''' Returns the measures of each method in a run from the test history '''
+    measures = {}
+    for class_name, test_class in run['classes'].items():
+        for method_name, method in test_class['methods'].items():
+            values = dict(method.get('limits', {}))
+            if 'duration' in method:
+                values['duration'] = method['duration']
+            measures[(class_name, method_name)] = values
+    return measures
+
+
+def find_regressions(base, compare, duration_threshold=20,
+                     limit_threshold=0, limits=None, min_duration=0.1):
+    ''' Returns the Regressions of compare from base, sorted by method
+
+    Methods and measures missing from either run are skipped, as are the
+    durations of methods which took less than min_duration seconds in both
+    runs.  If limits is set only those limits are compared.
+    '''
+    regressions = []
+    for key in sorted(set(base).intersection(compare)):
+        base_values = base[key]
+        values = compare[key]
+        for measure in sorted(set(base_values).intersection(values)):
+            if measure == 'duration':
+                if max(base_values[measure], values[measure]) < min_duration:
+                    continue
+                threshold = duration_threshold
+            elif limits is not None and measure not in limits:
+                continue
+            else:
+                threshold = limit_threshold
+            regression = Regression(
+                key[0], key[1], measure, base_values[measure], values[measure]
+            )
+            if regression.value <= regression.base:
+                continue
+            percent = regression.percent
+            if percent is None or percent > threshold:
+                regressions.append(regression)
+    return regressions
+
+
+class CompareApexTestRuns(BaseTask):
+    """ Reports regressions in test durations and limit usage between runs """
+
+    task_options = {
+        'base': {
+            'description': ('The run to compare against: the path to a ' +
+                            'json_output file of run_tests_debug or the ' +
+                            'commit of a run in the test history'),
+            'required': True,
+        },
+        'compare': {
+            'description': ('The run to check for regressions, as for ' +
+                            'base.  Defaults to test_results.json'),
+        },
+        'duration_threshold': {
+            'description': ('Percentage a test duration may grow before ' +
+                            'it is reported.  Defaults to 20'),
+        },
+        'min_duration': {
+            'description': ('Durations of tests faster than this many ' +
+                            'seconds are not compared.  Defaults to 0.1'),
+        },
+        'limit_threshold': {
+            'description': ('Percentage the usage of a limit may grow ' +
+                            'before it is reported.  Defaults to 0'),
+        },
+        'limits': {
+            'description': ('Comma separated names of the limits to ' +
+                            'compare.  Defaults to all limits'),
+        },
+        'fail_on_regression': {
+            'description': ('If True, fail the task if any regression is ' +
+                            'found.  Defaults to False'),
+        },
+    }
+
+    def _init_options(self, kwargs):
+        super(CompareApexTestRuns, self)._init_options(kwargs)
+        if not self.options.get('compare'):
+            self.options['compare'] = 'test_results.json'
+        self.options['duration_threshold'] = float(
+            self.options.get('duration_threshold', 20))
+        self.options['min_duration'] = float(
+            self.options.get('min_duration', 0.1))
+        self.options['limit_threshold'] = float(
+            self.options.get('limit_threshold', 0))
+        limits = self.options.get('limits')
+        if limits and not isinstance(limits, list):
+            limits = [name.strip() for name in limits.split(',')]
+        self.options['limits'] = limits or None
+        self.options['fail_on_regression'] = self.options.get(
+            'fail_on_regression') in [True, 'True', 'true']
+
+    def _load_measures(self, source):
+        if os.path.isfile(source):
+            with open(source, 'r') as f:
+                return get_results_measures(json.load(f))
+        run = load_history(self.project_config).get_run(source)
+        if run is None:
+            raise TaskOptionsError(
+                '{} is neither a results file nor a commit in the test '
+                'history'.format(source))
+        return get_history_measures(run)
+
+    def _run_task(self):
+        regressions = find_regressions(
+            self._load_measures(self.options['base']),
+            self._load_measures(self.options['compare']),
+            duration_threshold=self.options['duration_threshold'],
+            limit_threshold=self.options['limit_threshold'],
+            limits=self.options['limits'],
+            min_duration=self.options['min_duration'],
+        )
+        self.return_values['regressions'] = [
+            regression._asdict() for regression in regressions
+        ]
+        if not regressions:
+            self.logger.info('No regressions from {}'.format(
+                self.options['base']))
+            return
+        self.logger.warning('{} regressions from {}'.format(
+            len(regressions), self.options['base']))
+        for regression in regressions:
+            self.logger.warning(str(regression))
+        if self.options['fail_on_regression']:
+            raise ApexTestException(
+                '{} test durations or limits regressed'.format(
+                    len(regressions)))
@@ -0,0 +1,86 @@
+''' Results of Apex test methods and the reports written from them
+
+Each test method is kept as a MethodResult, a slotted tuple, rather than a
+dict per method.  The reports are written one result at a time, so no copy
+of the results is built to render them:
+
+    write_junit(results, 'test_results.xml')
+    write_json(results, 'test_results.json')
+
+The json report is a list with a dict per method as returned by as_dict().
+'''
+
+from collections import namedtuple
+import cgi
+import io
+import json
+
+from cumulusci.tasks.apex_tests import FAILING_OUTCOMES
+
+
+class MethodResult(namedtuple('MethodResult', [
+    'class_name',
+    'method',
+    'outcome',
+    'message',
+    'stack_trace',
+    'stats',
+    'children',
+    'timestamp',
+])):
+    __slots__ = ()
+
+    @property
+    def failed(self):
+        return self.outcome in FAILING_OUTCOMES
+
+    @property
+    def duration(self):
+        if self.stats and 'duration' in self.stats:
+            return self.stats['duration']
+
+    def as_dict(self):
+        ''' Returns the result as a dict with the keys of the json report '''
+        return {
+            'Children': self.children,
+            'ClassName': self.class_name,
+            'Method': self.method,
+            'Message': self.message,
+            'Outcome': self.outcome,
+            'StackTrace': self.stack_trace,
+            'Stats': self.stats,
+            'TestTimestamp': self.timestamp,
+        }
+
+
+def write_junit(results, path):
+    ''' Writes a list of results to path as a JUnit report '''
+    with io.open(path, mode='w', encoding='utf-8') as f:
+        f.write(u'<testsuite tests="{}">\n'.format(len(results)))
+        for result in results:
+            s = u'  <testcase classname="{}" name="{}"'.format(
+                result.class_name, result.method)
+            if result.duration is not None:
+                s += u' time="{}"'.format(result.duration)
+            if result.failed:
+                s += u'>\n'
+                s += u'    <failure type="{}">{}</failure>\n'.format(
+                    cgi.escape(result.stack_trace or u''),
+                    cgi.escape(result.message or u''),
+                )
+                s += u'  </testcase>\n'
+            else:
+                s += u' />\n'
+            f.write(s)
+        f.write(u'</testsuite>')
+
+
+def write_json(results, path):
+    ''' Writes results to path as a json list '''
+    with io.open(path, mode='w', encoding='utf-8') as f:
+        f.write(u'[')
+        for i, result in enumerate(results):
+            if i:
+                f.write(u', ')
+            f.write(unicode(json.dumps(result.as_dict())))
+        f.write(u']')
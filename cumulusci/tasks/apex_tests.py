@@ -0,0 +1,297 @@
+''' History and scheduling of Apex test runs
+
+ApexTestHistory keeps the outcome, duration and limit usage of each test
+method from earlier runs in a json file, keyed by the commit each run was
+against.  The history is used to queue test classes in a useful order and
+to estimate how long a run will take.
+
+Test classes are split into shards with the longest processing time first
+rule: classes are taken from slowest to fastest and each one goes to the
+shard with the least total expected duration so far.
+
+ApexTestCoverage maps each Apex class and trigger to the test classes which
+covered it, so a run can be limited to the tests impacted by a change.
+'''
+
+import heapq
+import json
+import os
+import time
+
+import sarge
+
+from cumulusci.core.exceptions import CommandException
+
+FAILING_OUTCOMES = ('Fail', 'CompileFail')
+
+APEX_EXTENSIONS = ('.cls', '.trigger')
+
+TEST_ORDERS = ('slowest', 'failing', 'none')
+
+
+def load_history(project_config):
+    ''' Returns the loaded ApexTestHistory of the project '''
+    history = ApexTestHistory(os.path.join(
+        project_config.project_local_dir,
+        'apex_test_history.json',
+    ))
+    history.load()
+    return history
+
+
+class ApexTestHistory(object):
+    ''' The results of earlier Apex test runs, newest first
+
+    A run against a commit replaces any earlier run against the same commit
+    and only the newest max_runs runs are kept.
+    '''
+    max_runs = 20
+
+    def __init__(self, path, max_runs=None):
+        self.path = path
+        if max_runs is not None:
+            self.max_runs = max_runs
+        self.runs = []
+
+    def load(self):
+        self.runs = []
+        if os.path.isfile(self.path):
+            with open(self.path, 'r') as f:
+                try:
+                    self.runs = json.load(f).get('runs', [])
+                except (ValueError, AttributeError):
+                    self.runs = []
+        return self.runs
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump({'runs': self.runs}, f, indent=2, sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+    def add_run(self, commit, test_results):
+        ''' Adds the MethodResults of a run and saves '''
+        classes = {}
+        for result in test_results:
+            stats = result.stats or {}
+            method = {'outcome': result.outcome}
+            if 'duration' in stats:
+                method['duration'] = stats['duration']
+            limits = {}
+            for name, value in stats.items():
+                if isinstance(value, dict) and 'used' in value:
+                    limits[name] = int(value['used'])
+            if limits:
+                method['limits'] = limits
+            test_class = classes.setdefault(result.class_name, {'methods': {}})
+            test_class['methods'][result.method] = method
+            if 'duration' in method:
+                test_class['duration'] = (
+                    test_class.get('duration', 0) + method['duration']
+                )
+        run = {
+            'classes': classes,
+            'commit': commit,
+            'timestamp': time.time(),
+        }
+        self.runs = [run] + [
+            previous for previous in self.runs
+            if commit is None or previous['commit'] != commit
+        ]
+        del self.runs[self.max_runs:]
+        self.save()
+        return run
+
+    def get_run(self, commit):
+        ''' Returns the newest run against commit, which may be abbreviated '''
+        for run in self.runs:
+            if run['commit'] == commit:
+                return run
+        if not commit:
+            return
+        for run in self.runs:
+            if run['commit'] and run['commit'].startswith(commit):
+                return run
+
+    def get_durations(self):
+        ''' Returns the newest known duration of each class '''
+        durations = {}
+        for run in reversed(self.runs):
+            for class_name, test_class in run['classes'].items():
+                if 'duration' in test_class:
+                    durations[class_name] = test_class['duration']
+        return durations
+
+    def get_failing(self):
+        ''' Returns the names of the classes that failed in their last run '''
+        failing = {}
+        for run in reversed(self.runs):
+            for class_name, test_class in run['classes'].items():
+                failing[class_name] = any(
+                    method['outcome'] in FAILING_OUTCOMES
+                    for method in test_class['methods'].values()
+                )
+        return set(
+            class_name for class_name, failed in failing.items() if failed
+        )
+
+    def order_classes(self, class_names, order='slowest'):
+        ''' Returns class_names in the order to queue them
+
+        slowest puts the slowest classes first so they are not left running
+        on their own at the end, failing puts the classes that failed in
+        their last run before the rest and none keeps the given order.
+        '''
+        if order == 'none':
+            return list(class_names)
+        get_duration = _duration_getter(class_names, self.get_durations())
+        if order == 'failing':
+            failing = self.get_failing()
+        else:
+            failing = ()
+        return sorted(class_names, key=lambda name: (
+            name not in failing,
+            -get_duration(name),
+            name,
+        ))
+
+    def predict_runtime(self, class_names, shards=1):
+        ''' Returns the expected seconds to run class_names one at a time
+        across shards orgs, or None if no durations are known
+        '''
+        durations = self.get_durations()
+        if not any(name in durations for name in class_names):
+            return
+        get_duration = _duration_getter(class_names, durations)
+        return max(
+            sum(get_duration(name) for name in shard)
+            for shard in balance_shards(class_names, durations, shards)
+        )
+
+
+def _duration_getter(class_names, durations):
+    # Classes without a known duration are assumed to take the average of
+    # the known durations, or 1 second if none are known
+    known = [durations[name] for name in class_names if durations.get(name)]
+    default = float(sum(known)) / len(known) if known else 1.0
+
+    def get_duration(name):
+        return durations.get(name) or default
+
+    return get_duration
+
+
+def balance_shards(class_names, durations, shards):
+    ''' Splits class_names into shards lists of about equal total duration '''
+    get_duration = _duration_getter(class_names, durations)
+
+    # Slowest first, ties by name so the split is repeatable
+    ordered = sorted(class_names, key=lambda name: (-get_duration(name), name))
+    heap = [(0.0, i) for i in range(shards)]
+    result = [[] for i in range(shards)]
+    for name in ordered:
+        total, i = heapq.heappop(heap)
+        result[i].append(name)
+        heapq.heappush(heap, (total + get_duration(name), i))
+    return result
+
+
+class ApexTestCoverage(object):
+    ''' The test classes which covered each Apex class and trigger
+
+    Also counts the runs limited to impacted tests since the last full run.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.covered_by = {}
+        self.runs_since_full = 0
+
+    def load(self):
+        self.covered_by = {}
+        self.runs_since_full = 0
+        if os.path.isfile(self.path):
+            with open(self.path, 'r') as f:
+                try:
+                    data = json.load(f)
+                except ValueError:
+                    data = {}
+            self.covered_by = dict(
+                (name, set(tests))
+                for name, tests in data.get('covered_by', {}).items()
+            )
+            self.runs_since_full = data.get('runs_since_full', 0)
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'covered_by': dict(
+                    (name, sorted(tests))
+                    for name, tests in self.covered_by.items()
+                ),
+                'runs_since_full': self.runs_since_full,
+            }, f, indent=2, sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+    def update(self, coverage, full_run):
+        ''' Replaces the coverage of the test classes in coverage and saves
+
+        coverage is a dict of test class name to the names of the classes
+        and triggers it covered.
+        '''
+        for name in list(self.covered_by):
+            self.covered_by[name].difference_update(coverage)
+            if not self.covered_by[name]:
+                del self.covered_by[name]
+        for test_class, names in coverage.items():
+            for name in names:
+                self.covered_by.setdefault(name, set()).add(test_class)
+        if full_run:
+            self.runs_since_full = 0
+        else:
+            self.runs_since_full += 1
+        self.save()
+
+    def get_impacted_tests(self, names):
+        ''' Returns the test classes which covered any of names, or None if
+        one of names has no known coverage
+        '''
+        tests = set()
+        for name in names:
+            if name not in self.covered_by:
+                return
+            tests.update(self.covered_by[name])
+        return tests
+
+
+def get_changed_files(diff_range, cwd=None):
+    ''' Returns the paths changed in diff_range according to git diff '''
+    p = sarge.Command(
+        ['git', 'diff', '--name-only', diff_range],
+        stdout=sarge.Capture(buffer_size=-1),
+        stderr=sarge.Capture(buffer_size=-1),
+        cwd=cwd,
+    )
+    p.run()
+    if p.returncode:
+        raise CommandException(
+            'git diff --name-only {} failed with return code {}: {}'.format(
+                diff_range, p.returncode, p.stderr.text))
+    return [line.strip() for line in p.stdout if line.strip()]
+
+
+def get_apex_names(paths):
+    ''' Returns the names of the Apex classes and triggers in paths '''
+    names = set()
+    for path in paths:
+        name, ext = os.path.splitext(os.path.basename(path))
+        if ext in APEX_EXTENSIONS:
+            names.add(name)
+    return names
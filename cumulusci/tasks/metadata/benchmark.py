@@ -0,0 +1,130 @@
+''' Benchmark of package.xml generation on a synthetic metadata tree
+
+    python -m cumulusci.tasks.metadata.benchmark [members]
+
+Builds a temporary src tree with about the given number of members (50000
+by default) spread over Apex classes and custom objects with fields,
+record types and list views, then times what update_package_xml does:
+generating the package.xml in process, on a process pool, and with a cold
+and warm members cache.
+'''
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from cumulusci.tasks.metadata.package import PackageXmlGenerator
+
+API_VERSION = '36.0'
+
+CLASS_META = '''<?xml version="1.0" encoding="UTF-8"?>
+<ApexClass xmlns="http://soap.sforce.com/2006/04/metadata">
+    <apiVersion>36.0</apiVersion>
+    <status>Active</status>
+</ApexClass>'''
+
+FIELD = '''    <fields>
+        <fullName>Field{0}__c</fullName>
+        <label>Field {0}</label>
+        <length>255</length>
+        <type>Text</type>
+    </fields>
+'''
+
+RECORD_TYPE = '''    <recordTypes>
+        <fullName>RecordType{0}</fullName>
+        <active>true</active>
+        <label>Record Type {0}</label>
+    </recordTypes>
+'''
+
+LIST_VIEW = '''    <listViews>
+        <fullName>ListView{0}</fullName>
+        <filterScope>Everything</filterScope>
+        <label>List View {0}</label>
+    </listViews>
+'''
+
+# Members added by each object: the object, its fields, record types and
+# list views
+FIELDS_PER_OBJECT = 80
+RECORD_TYPES_PER_OBJECT = 10
+LIST_VIEWS_PER_OBJECT = 9
+MEMBERS_PER_OBJECT = 1 + FIELDS_PER_OBJECT + RECORD_TYPES_PER_OBJECT + LIST_VIEWS_PER_OBJECT
+
+
+def build_tree(path, members):
+    ''' Writes a metadata tree of about members members under path '''
+    classes = members / 5
+    objects = (members - classes) / MEMBERS_PER_OBJECT
+
+    os.makedirs(os.path.join(path, 'classes'))
+    for i in range(classes):
+        name = os.path.join(path, 'classes', 'Class{}.cls'.format(i))
+        with open(name, 'w') as f:
+            f.write('public class Class{} {{}}'.format(i))
+        with open(name + '-meta.xml', 'w') as f:
+            f.write(CLASS_META)
+
+    os.makedirs(os.path.join(path, 'objects'))
+    for i in range(objects):
+        name = os.path.join(path, 'objects', 'Object{}__c.object'.format(i))
+        with open(name, 'w') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            f.write('<CustomObject xmlns="http://soap.sforce.com/2006/04/metadata">\n')
+            for j in range(FIELDS_PER_OBJECT):
+                f.write(FIELD.format(j))
+            for j in range(LIST_VIEWS_PER_OBJECT):
+                f.write(LIST_VIEW.format(j))
+            for j in range(RECORD_TYPES_PER_OBJECT):
+                f.write(RECORD_TYPE.format(j))
+            f.write('</CustomObject>\n')
+
+    return classes + objects * MEMBERS_PER_OBJECT
+
+
+def timed(label, func):
+    start = time.time()
+    result = func()
+    print '{:<30} {:8.2f}s'.format(label, time.time() - start)
+    return result
+
+
+def run(members=50000):
+    tempdir = tempfile.mkdtemp()
+    try:
+        src = os.path.join(tempdir, 'src')
+        total = timed('Build tree', lambda: build_tree(src, members))
+        print '{} members'.format(total)
+
+        cache_path = os.path.join(tempdir, 'package_xml_cache.json')
+        expected = timed(
+            'Generate (1 process)',
+            PackageXmlGenerator(src, API_VERSION, processes=1),
+        )
+        package_xml = timed(
+            'Generate (process pool)',
+            PackageXmlGenerator(src, API_VERSION),
+        )
+        assert package_xml == expected
+        package_xml = timed(
+            'Generate (cold cache)',
+            PackageXmlGenerator(src, API_VERSION, cache_path=cache_path),
+        )
+        assert package_xml == expected
+        package_xml = timed(
+            'Generate (warm cache)',
+            PackageXmlGenerator(src, API_VERSION, cache_path=cache_path),
+        )
+        assert package_xml == expected
+    finally:
+        shutil.rmtree(tempdir)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(int(sys.argv[1]))
+    else:
+        run()
@@ -0,0 +1,218 @@
+''' Incremental deployments based on a manifest of previously deployed files
+
+After a successful deployment, a manifest of the sha1 of every deployed file
+is stored in the project's local directory next to the org's keychain file.
+The next incremental deployment to the org compares the source directory to
+the manifest and stages only the components which were added or changed,
+along with a package.xml for them and a destructiveChanges.xml for the
+components which were removed.
+'''
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import urllib
+import xml.etree.ElementTree as ET
+
+from cumulusci.tasks.metadata.package import PackageXmlGenerator
+
+# Metadata directories where each component is a subdirectory of files
+BUNDLE_TYPES = ('aura',)
+# Metadata directories where components live in folders with a -meta.xml
+FOLDER_TYPES = ('dashboards', 'documents', 'email', 'reports')
+
+# Deleted files are recreated with this content so the package.xml parsers
+# can list them for deletion
+PLACEHOLDER_XML = '''<?xml version="1.0" encoding="UTF-8"?>
+<Placeholder xmlns="http://soap.sforce.com/2006/04/metadata"/>'''
+
+
+def get_file_hashes(path):
+    ''' Returns a dict of relative path to sha1 for every file under path '''
+    hashes = {}
+    for root, dirs, files in os.walk(path):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for filename in files:
+            if filename.startswith('.'):
+                continue
+            full_path = os.path.join(root, filename)
+            rel_path = os.path.relpath(full_path, path).replace(os.sep, '/')
+            with open(full_path, 'rb') as f:
+                hashes[rel_path] = hashlib.sha1(f.read()).hexdigest()
+    return hashes
+
+
+def get_component_files(rel_path, files, include_folder=True):
+    ''' Returns the files in files which make up rel_path's component
+
+    For components in folders, the folder's -meta.xml is included unless
+    include_folder is False.
+    '''
+    parts = rel_path.split('/')
+    if len(parts) == 1:
+        # package.xml and any other files at the root are not components
+        return []
+    if parts[0] in BUNDLE_TYPES and len(parts) > 2:
+        prefix = '/'.join(parts[:2]) + '/'
+        return sorted([f for f in files if f.startswith(prefix)])
+
+    main = rel_path
+    if main.endswith('-meta.xml'):
+        main = main[:-len('-meta.xml')]
+    component_files = [f for f in (main, main + '-meta.xml') if f in files]
+    if include_folder and parts[0] in FOLDER_TYPES and len(parts) > 2:
+        folder_meta = '/'.join(parts[:2]) + '-meta.xml'
+        if folder_meta in files:
+            component_files.append(folder_meta)
+    return component_files
+
+
+def get_package_name(path):
+    ''' Returns the fullName from path/package.xml or None '''
+    package_xml = os.path.join(path, 'package.xml')
+    if not os.path.isfile(package_xml):
+        return
+    root = ET.parse(package_xml).getroot()
+    full_name = root.find('{http://soap.sforce.com/2006/04/metadata}fullName')
+    if full_name is not None and full_name.text:
+        return urllib.unquote(full_name.text)
+
+
+class DeployManifest(object):
+    ''' The files deployed from a source directory to an org
+
+    Manifests for all source directories deployed to the org are kept in one
+    json file keyed by the absolute path of the source directory.
+    '''
+
+    def __init__(self, manifest_path, source_path):
+        self.manifest_path = manifest_path
+        self.source_path = os.path.abspath(source_path)
+
+    def _read(self):
+        if not os.path.isfile(self.manifest_path):
+            return {}
+        with open(self.manifest_path, 'r') as f:
+            try:
+                return json.load(f)
+            except ValueError:
+                return {}
+
+    def load(self):
+        ''' Returns the dict of file hashes last deployed or None '''
+        return self._read().get(self.source_path)
+
+    def save(self, hashes):
+        manifests = self._read()
+        manifests[self.source_path] = hashes
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifests, f)
+        os.rename(tmp_path, self.manifest_path)
+
+
+class IncrementalDeployment(object):
+    ''' Compares a source directory to the files last deployed from it '''
+
+    def __init__(self, path, previous, current, api_version, package_name=None):
+        self.path = path
+        self.previous = previous
+        self.current = current
+        self.api_version = api_version
+        self.package_name = package_name
+
+        self.files = set()
+        self.deleted = set()
+        self._compare()
+
+    def __nonzero__(self):
+        return bool(self.files or self.deleted)
+
+    def _compare(self):
+        current_files = set(self.current)
+        for rel_path, sha1 in self.current.items():
+            if self.previous.get(rel_path) != sha1:
+                self.files.update(get_component_files(rel_path, current_files))
+        for rel_path in self.previous:
+            if rel_path in self.current:
+                continue
+            component_files = get_component_files(
+                rel_path,
+                current_files,
+                include_folder=False,
+            )
+            if component_files:
+                # Part of a component which still exists was removed
+                self.files.update(component_files)
+            elif '/' in rel_path:
+                self.deleted.add(rel_path)
+
+    def stage(self, target):
+        ''' Writes the files to deploy with their package.xml into target '''
+        for rel_path in sorted(self.files):
+            self._copy(rel_path, target)
+
+        package_xml = PackageXmlGenerator(
+            directory=target,
+            api_version=self.api_version,
+            package_name=self.package_name,
+        )()
+        with open(os.path.join(target, 'package.xml'), 'w') as f:
+            f.write(package_xml.encode('utf-8'))
+
+        destructive_changes = self._get_destructive_changes()
+        if destructive_changes:
+            with open(os.path.join(target, 'destructiveChanges.xml'), 'w') as f:
+                f.write(destructive_changes.encode('utf-8'))
+
+    def _copy(self, rel_path, target):
+        src = os.path.join(self.path, *rel_path.split('/'))
+        dst = os.path.join(target, *rel_path.split('/'))
+        if not os.path.isdir(os.path.dirname(dst)):
+            os.makedirs(os.path.dirname(dst))
+        shutil.copy2(src, dst)
+        self._create_folder(rel_path, target)
+
+    def _create_folder(self, rel_path, target):
+        # The package.xml parsers list folders from their directory
+        parts = rel_path.split('/')
+        if parts[0] in FOLDER_TYPES and len(parts) == 2:
+            if rel_path.endswith('-meta.xml'):
+                folder = os.path.join(target, parts[0], parts[1][:-len('-meta.xml')])
+                if not os.path.isdir(folder):
+                    os.makedirs(folder)
+
+    def _get_destructive_changes(self):
+        if not self.deleted:
+            return
+
+        placeholders = tempfile.mkdtemp()
+        try:
+            for rel_path in sorted(self.deleted):
+                if rel_path.endswith('-meta.xml'):
+                    self._create_folder(rel_path, placeholders)
+                    continue
+                path = os.path.join(placeholders, *rel_path.split('/'))
+                if not os.path.isdir(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+                with open(path, 'w') as f:
+                    f.write(PLACEHOLDER_XML)
+            deleted = PackageXmlGenerator(
+                directory=placeholders,
+                api_version=self.api_version,
+                delete=True,
+            ).get_manifest()
+        finally:
+            shutil.rmtree(placeholders)
+
+        # Folders and parent components which still exist are kept
+        existing = PackageXmlGenerator(
+            directory=self.path,
+            api_version=self.api_version,
+        ).get_manifest()
+
+        removed = deleted.difference(existing)
+        if removed:
+            return removed.render(self.api_version)
@@ -1,24 +1,41 @@
+import json
+import multiprocessing
 import os
 import re
-import urllib
 
-import xml.etree.ElementTree as ET
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
 
 import yaml
 
 from cumulusci.core.tasks import BaseTask
+from cumulusci.core.manifest import PackageManifest
 
 __location__ = os.path.realpath(
     os.path.join(os.getcwd(), os.path.dirname(__file__)))
 
+_sort_key_split_re = re.compile('[.|-]')
+# Sort keys are memoized since the same names are sorted on every render
+_sort_keys = {}
+SORT_KEY_CACHE_SIZE = 100000
+
 def metadata_sort_key(name):
+    key = _sort_keys.get(name)
+    if key is not None:
+        return key
+
     sections = []
-    for section in re.split('[.|-]', name):
+    for section in _sort_key_split_re.split(name):
         sections.append(metadata_sort_key_section(section))
 
     key = '_'.join(sections)
     key = key.replace('_','Z')
 
+    if len(_sort_keys) >= SORT_KEY_CACHE_SIZE:
+        _sort_keys.clear()
+    _sort_keys[name] = key
     return key
 
 def metadata_sort_key_section(name):
@@ -38,11 +55,145 @@ def metadata_sort_key_section(name):
 class MetadataParserMissingError(Exception):
     pass
 
+_metadata_map = None
+_delete_excludes = None
+
+def get_metadata_map():
+    """ Returns the compiled metadata_map.yml, loaded once per process
+
+    The map is a dict of directory name to a tuple of (parser class name,
+    metadata type, extension, options) for each parser of the directory.
+    Options are a sorted tuple of (name, value) pairs.
+    """
+    global _metadata_map
+    if _metadata_map is None:
+        with open(__location__ + '/metadata_map.yml', 'r') as f_metadata_map:
+            metadata_map = yaml.load(f_metadata_map)
+        _metadata_map = dict(
+            (item, tuple(
+                (
+                    parser_config['class'],
+                    parser_config['type'],
+                    parser_config.get('extension', ''),
+                    tuple(sorted((parser_config.get('options') or {}).items())),
+                )
+                for parser_config in config
+            ))
+            for item, config in metadata_map.items()
+        )
+    return _metadata_map
+
+def get_delete_excludes():
+    """ Returns the names in metadata_whitelist.txt as a frozenset """
+    global _delete_excludes
+    if _delete_excludes is None:
+        filename = os.path.join(__location__, '..', '..', 'files', 'metadata_whitelist.txt')
+        with open(filename, 'r') as f:
+            _delete_excludes = frozenset(line.strip() for line in f)
+    return _delete_excludes
+
+def get_parser(parser_class, metadata_type, directory, extension, delete, options=()):
+    """ Returns a parser from the hashable description used by the workers """
+    return globals()[parser_class](
+        metadata_type,                # Metadata Type
+        directory,                    # Directory
+        extension,                    # Extension
+        delete,                       # Parse for deletion?
+        **dict(options)               # Extra kwargs
+    )
+
+# Parsers built by each worker process, keyed by their description
+_worker_parsers = {}
+
+def _parse_item(job):
+    spec, item = job
+    parser = _worker_parsers.get(spec)
+    if parser is None:
+        parser = get_parser(*spec)
+        _worker_parsers[spec] = parser
+    return parser._parse_item(item) or []
+
+class MembersCache(object):
+    """ The members parsed from each file, stored as json between runs
+
+    Entries are kept per metadata directory and keyed by the parser and the
+    file or folder parsed.  An entry is only used while the mtime and size
+    of the file are unchanged.
+    """
+
+    def __init__(self, path, directory):
+        self.path = path
+        self.directory = os.path.abspath(directory)
+        self.entries = {}
+        self.used = {}
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return
+        with open(self.path, 'r') as f:
+            try:
+                self.entries = json.load(f).get(self.directory, {})
+            except ValueError:
+                self.entries = {}
+
+    def _get_key(self, spec, item):
+        return json.dumps([spec[0], spec[1], os.path.basename(spec[2])] + list(spec[3:]) + [item])
+
+    def _get_stat(self, spec, item):
+        try:
+            stat = os.stat(spec[2] + '/' + item)
+        except OSError:
+            return
+        return [stat.st_mtime, stat.st_size]
+
+    def get(self, spec, item):
+        """ Returns the cached list of members or None """
+        key = self._get_key(spec, item)
+        entry = self.entries.get(key)
+        if entry and entry['stat'] == self._get_stat(spec, item):
+            self.used[key] = entry
+            return entry['members']
+
+    def set(self, spec, item, members):
+        self.used[self._get_key(spec, item)] = {
+            'stat': self._get_stat(spec, item),
+            'members': members,
+        }
+
+    def save(self):
+        """ Saves the entries used in this run, dropping those of removed files """
+        data = {}
+        if os.path.isfile(self.path):
+            with open(self.path, 'r') as f:
+                try:
+                    data = json.load(f)
+                except ValueError:
+                    pass
+        data[self.directory] = self.used
+        if not os.path.isdir(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path))
+        tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.rename(tmp_path, self.path)
+
+
 class PackageXmlGenerator(object):
+    """ Builds a package.xml from a directory of metadata
+
+    Each file or folder of each metadata directory is parsed as a separate
+    job.  When there are at least min_pool_jobs jobs they are spread over a
+    pool of processes, otherwise they run in this process.  The results are
+    merged in job order so the output does not depend on the pool.
+
+    If cache_path is provided, the members parsed from each file are cached
+    there and only files changed since the last run are parsed again.
+    """
+    min_pool_jobs = 100
+
     def __init__(self, directory, api_version, package_name=None, managed=None, delete=None, install_class=None,
-                 uninstall_class=None):
-        with open(__location__ + '/metadata_map.yml', 'r') as f_metadata_map:
-            self.metadata_map = yaml.load(f_metadata_map)
+                 uninstall_class=None, processes=None, cache_path=None):
+        self.metadata_map = get_metadata_map()
         self.directory = directory
         self.api_version = api_version
         self.package_name = package_name
@@ -50,6 +201,10 @@ class PackageXmlGenerator(object):
         self.delete = delete
         self.install_class = install_class
         self.uninstall_class = uninstall_class
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        self.processes = processes
+        self.cache_path = cache_path
         self.types = []
 
 
@@ -58,7 +213,7 @@ class PackageXmlGenerator(object):
         return self.render_xml()
 
     def parse_types(self):
-        for item in os.listdir(self.directory):
+        for item in sorted(os.listdir(self.directory)):
             if item == 'package.xml':
                 continue
             if not os.path.isdir(self.directory + '/' + item):
@@ -69,54 +224,85 @@ class PackageXmlGenerator(object):
             if not config:
                 raise MetadataParserMissingError('No parser configuration found for subdirectory %s' % item)
 
-            for parser_config in config:
-                if parser_config.get('options'):
-                    parser = globals()[parser_config['class']](
-                        parser_config['type'],                # Metadata Type
-                        self.directory + '/' + item,          # Directory
-                        parser_config.get('extension', ''),   # Extension
-                        self.delete,                          # Parse for deletion?
-                        **parser_config.get('options', {})    # Extra kwargs
-                    )
-                else:
-                    parser = globals()[parser_config['class']](
-                        parser_config['type'],                # Metadata Type
-                        self.directory + '/' + item,          # Directory
-                        parser_config.get('extension', ''),   # Extension
-                        self.delete,                          # Parse for deletion?
-                    )
-
+            for parser_class, metadata_type, extension, options in config:
+                spec = (
+                    parser_class,
+                    metadata_type,
+                    self.directory + '/' + item,
+                    extension,
+                    self.delete,
+                    options,
+                )
+                parser = get_parser(*spec)
+                parser.spec = spec
                 self.types.append(parser)
 
-    def render_xml(self):
-        lines = []
-
-
-        # Print header
-        lines.append(u'<?xml version="1.0" encoding="UTF-8"?>')
-        lines.append(u'<Package xmlns="http://soap.sforce.com/2006/04/metadata">')
-        if self.package_name:
-            package_name_encoded = urllib.quote(self.package_name, safe=' ')
-            lines.append(u'    <fullName>{0}</fullName>'.format(package_name_encoded))
-
-        if self.managed and self.install_class:
-            lines.append(u'    <postInstallClass>{0}</postInstallClass>'.format(self.install_class))
-
-        if self.managed and self.uninstall_class:
-            lines.append(u'    <uninstallClass>{0}</uninstallClass>'.format(self.uninstall_class))
-
-        # Print types sections
-        self.types.sort(key=lambda x: x.metadata_type.upper())
+    def parse_items(self):
+        """ Parses the items of all parsers into their members """
+        cache = None
+        if self.cache_path:
+            cache = MembersCache(self.cache_path, self.directory)
+            cache.load()
+
+        parsers = []
+        jobs = []
+        results = {}
         for parser in self.types:
-            type_xml = parser()
-            if type_xml:
-                lines.extend(type_xml)
-
-        # Print footer
-        lines.append(u'    <version>{0}</version>'.format(self.api_version))
-        lines.append(u'</Package>')
+            for item in parser.get_items():
+                parsers.append(parser)
+                jobs.append((parser.spec, item))
+                if cache:
+                    members = cache.get(parser.spec, item)
+                    if members is not None:
+                        results[len(jobs) - 1] = members
+
+        # Only parse the items which are not cached
+        pending = [i for i in range(len(jobs)) if i not in results]
+        if self.processes > 1 and len(pending) >= self.min_pool_jobs:
+            pool = multiprocessing.Pool(self.processes)
+            try:
+                chunksize = max(1, len(pending) / (self.processes * 4))
+                parsed = pool.map(_parse_item, [jobs[i] for i in pending], chunksize)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            parsed = [parsers[i]._parse_item(jobs[i][1]) or [] for i in pending]
+
+        for i, members in zip(pending, parsed):
+            results[i] = members
+            if cache:
+                cache.set(jobs[i][0], jobs[i][1], members)
+
+        for i, parser in enumerate(parsers):
+            parser.members.extend(results[i])
+
+        if cache:
+            cache.save()
+
+    def get_manifest(self):
+        """ Returns a PackageManifest of the parsed types and members """
+        if not self.types:
+            self.parse_types()
+        self.parse_items()
+        manifest = PackageManifest(
+            api_version=self.api_version,
+            package_name=self.package_name,
+        )
+        if self.managed:
+            manifest.install_class = self.install_class
+            manifest.uninstall_class = self.uninstall_class
+        for parser in self.types:
+            if parser.members:
+                manifest.add(parser.metadata_type, parser.members)
+        return manifest
 
-        return u'\n'.join(lines)
+    def render_xml(self):
+        return self.get_manifest().render(
+            type_key=lambda x: x.upper(),
+            # Names with the same sort key are ordered by name
+            member_key=lambda x: (metadata_sort_key(x), x),
+        )
 
 class BaseMetadataParser(object):
 
@@ -135,16 +321,17 @@ class BaseMetadataParser(object):
         return self.render_xml()
 
     def get_delete_excludes(self):
-        filename = os.path.join(__location__, '..', '..', 'files', 'metadata_whitelist.txt')
-        excludes = []
-        with open(filename, 'r') as f:
-            for line in f:
-                excludes.append(line.strip())
-        return excludes
+        return get_delete_excludes()
 
     def parse_items(self):
+        for item in self.get_items():
+            self.parse_item(item)
+
+    def get_items(self):
+        """ Returns the files or folders in the directory to be parsed """
+        items = []
         # Loop through items
-        for item in os.listdir(self.directory):
+        for item in sorted(os.listdir(self.directory)):
             # on Macs this file is generated by the OS. Shouldn't be in the package.xml
             if item.startswith('.'):
                 continue
@@ -158,7 +345,8 @@ class BaseMetadataParser(object):
             if self.check_delete_excludes(item):
                 continue
 
-            self.parse_item(item)
+            items.append(item)
+        return items
 
     def check_delete_excludes(self, item):
         if not self.delete:
@@ -235,6 +423,8 @@ class ParserConfigurationError(Exception):
 class MetadataXmlElementParser(BaseMetadataParser):
 
     namespaces = {'sf': 'http://soap.sforce.com/2006/04/metadata'}
+    # Matches xpaths selecting direct children, which can be streamed
+    child_xpath_re = re.compile(r'^\./sf:(\w+)$')
 
     def __init__(self, metadata_type, directory, extension, delete, item_xpath=None, name_xpath=None):
         super(MetadataXmlElementParser, self).__init__(metadata_type, directory, extension, delete)
@@ -244,18 +434,64 @@ class MetadataXmlElementParser(BaseMetadataParser):
         if not name_xpath:
             name_xpath = './sf:fullName'
         self.name_xpath = name_xpath
+        self.item_tag = self.get_child_tag(item_xpath)
+        self.name_tag = self.get_child_tag(name_xpath)
 
-    def _parse_item(self, item):
-        root = ET.parse(self.directory + '/' + item)
-        members = []
+    def get_child_tag(self, xpath):
+        """ Returns the qualified tag selected by a './sf:tag' xpath or None """
+        match = self.child_xpath_re.match(xpath)
+        if match:
+            return '{%s}%s' % (self.namespaces['sf'], match.group(1))
 
+    def _parse_item(self, item):
+        path = self.directory + '/' + item
         parent = self.strip_extension(item)
 
+        if self.item_tag and self.name_tag:
+            return [
+                self.get_member_name(name, parent)
+                for name in self.iter_item_names(path)
+            ]
+
+        root = ET.parse(path)
+        members = []
+
         for item in self.get_item_elements(root):
             members.append(self.get_item_name(item, parent))
 
         return members
 
+    def iter_item_names(self, path):
+        """ Yields the name of each item element while streaming the file
+
+        Only the item elements' name elements are kept, everything else is
+        cleared as soon as it has been parsed.
+        """
+        root = None
+        depth = 0
+        names = None
+        for event, elem in ET.iterparse(path, events=('start', 'end')):
+            if event == 'start':
+                depth += 1
+                if root is None:
+                    root = elem
+                elif depth == 2 and elem.tag == self.item_tag:
+                    names = []
+                continue
+
+            if depth == 3 and names is not None and elem.tag == self.name_tag:
+                names.append(elem.text)
+            if depth == 2:
+                if names is not None:
+                    if not names:
+                        raise MissingNameElementError
+                    yield names[0]
+                    names = None
+                root.clear()
+            elif depth > 2:
+                elem.clear()
+            depth -= 1
+
     def check_delete_excludes(self, item):
         return False
 
@@ -271,7 +507,9 @@ class MetadataXmlElementParser(BaseMetadataParser):
         if not names:
             raise MissingNameElementError
 
-        name = names[0].text
+        return self.get_member_name(names[0].text, parent)
+
+    def get_member_name(self, name, parent):
         prefix = self.item_name_prefix(parent)
         if prefix:
             name = prefix + name
@@ -362,8 +600,16 @@ class UpdatePackageXml(BaseTask):
             delete = self.options.get('delete', False),
             install_class = self.project_config.project__package__install_class,
             uninstall_class = self.project_config.project__package__uninstall_class,
+            cache_path = self._get_cache_path(),
         )
 
+    def _get_cache_path(self):
+        if self.project_config.project_local_dir:
+            return os.path.join(
+                self.project_config.project_local_dir,
+                'package_xml_cache.json',
+            )
+
     def _run_task(self):
         output = self.options.get('output', '{}/package.xml'.format(self.options.get('path')))
         self.logger.info('Generating {} from metadata in {}'.format(output, self.options.get('path')))
@@ -0,0 +1,141 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from cumulusci.tasks.metadata.incremental import DeployManifest
+from cumulusci.tasks.metadata.incremental import IncrementalDeployment
+from cumulusci.tasks.metadata.incremental import get_component_files
+from cumulusci.tasks.metadata.incremental import get_file_hashes
+from cumulusci.tasks.metadata.incremental import get_package_name
+
+PACKAGE_XML = '''<?xml version="1.0" encoding="UTF-8"?>
+<Package xmlns="http://soap.sforce.com/2006/04/metadata">
+    <fullName>Test %26 Package</fullName>
+    <version>36.0</version>
+</Package>'''
+
+
+class TestIncrementalDeployment(unittest.TestCase):
+
+    def setUp(self):
+        self.src = tempfile.mkdtemp()
+        self.target = tempfile.mkdtemp()
+        self._write('package.xml', PACKAGE_XML)
+        self._write('classes/Foo.cls', 'class Foo {}')
+        self._write('classes/Foo.cls-meta.xml', '<meta/>')
+        self._write('classes/Bar.cls', 'class Bar {}')
+        self._write('classes/Bar.cls-meta.xml', '<meta/>')
+        self._write('aura/Cmp/Cmp.cmp', '<aura:component/>')
+        self._write('aura/Cmp/CmpController.js', '({})')
+        self._write('reports/Folder-meta.xml', '<meta/>')
+        self._write('reports/Folder/Report.report', '<Report/>')
+        self.previous = get_file_hashes(self.src)
+
+    def tearDown(self):
+        shutil.rmtree(self.src)
+        shutil.rmtree(self.target)
+
+    def _write(self, path, content):
+        path = os.path.join(self.src, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def _get_changes(self):
+        return IncrementalDeployment(
+            self.src,
+            self.previous,
+            get_file_hashes(self.src),
+            '36.0',
+            get_package_name(self.src),
+        )
+
+    def _read_target(self, path):
+        with open(os.path.join(self.target, path), 'r') as f:
+            return f.read()
+
+    def test_no_changes(self):
+        self.assertFalse(self._get_changes())
+
+    def test_changed_class(self):
+        self._write('classes/Foo.cls', 'class Foo { }')
+        changes = self._get_changes()
+        self.assertEquals(
+            changes.files,
+            set(['classes/Foo.cls', 'classes/Foo.cls-meta.xml']),
+        )
+        changes.stage(self.target)
+        package_xml = self._read_target('package.xml')
+        self.assertIn('<fullName>Test %26 Package</fullName>', package_xml)
+        self.assertIn('<members>Foo</members>', package_xml)
+        self.assertNotIn('Bar', package_xml)
+        self.assertFalse(
+            os.path.exists(os.path.join(self.target, 'destructiveChanges.xml'))
+        )
+
+    def test_changed_bundle_file(self):
+        self._write('aura/Cmp/CmpController.js', '({ x: 1 })')
+        changes = self._get_changes()
+        self.assertEquals(
+            changes.files,
+            set(['aura/Cmp/Cmp.cmp', 'aura/Cmp/CmpController.js']),
+        )
+
+    def test_deleted_class(self):
+        os.remove(os.path.join(self.src, 'classes', 'Bar.cls'))
+        os.remove(os.path.join(self.src, 'classes', 'Bar.cls-meta.xml'))
+        changes = self._get_changes()
+        self.assertEquals(changes.files, set())
+        changes.stage(self.target)
+        destructive_changes = self._read_target('destructiveChanges.xml')
+        self.assertIn('<members>Bar</members>', destructive_changes)
+        self.assertNotIn('Foo', destructive_changes)
+
+    def test_deleted_report_keeps_folder(self):
+        os.remove(os.path.join(self.src, 'reports', 'Folder', 'Report.report'))
+        changes = self._get_changes()
+        changes.stage(self.target)
+        destructive_changes = self._read_target('destructiveChanges.xml')
+        self.assertIn('<members>Folder/Report</members>', destructive_changes)
+        self.assertNotIn('<members>Folder</members>', destructive_changes)
+
+    def test_deleted_meta_redeploys_component(self):
+        os.remove(os.path.join(self.src, 'classes', 'Foo.cls-meta.xml'))
+        changes = self._get_changes()
+        self.assertEquals(changes.files, set(['classes/Foo.cls']))
+        self.assertEquals(changes.deleted, set())
+
+
+class TestGetComponentFiles(unittest.TestCase):
+
+    def test_folder_component(self):
+        files = set([
+            'reports/Folder-meta.xml',
+            'reports/Folder/Report.report',
+        ])
+        self.assertEquals(
+            get_component_files('reports/Folder/Report.report', files),
+            ['reports/Folder/Report.report', 'reports/Folder-meta.xml'],
+        )
+
+    def test_root_file(self):
+        self.assertEquals(get_component_files('package.xml', set()), [])
+
+
+class TestDeployManifest(unittest.TestCase):
+
+    def test_save_load(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            manifest_path = os.path.join(tempdir, 'manifest.json')
+            manifest = DeployManifest(manifest_path, 'src')
+            self.assertIsNone(manifest.load())
+            manifest.save({'classes/Foo.cls': 'abc'})
+            other = DeployManifest(manifest_path, 'other')
+            other.save({})
+            self.assertEquals(manifest.load(), {'classes/Foo.cls': 'abc'})
+            self.assertEquals(other.load(), {})
+        finally:
+            shutil.rmtree(tempdir)
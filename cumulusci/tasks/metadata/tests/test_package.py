@@ -1,8 +1,16 @@
 import os
+import shutil
 import tempfile
 import unittest
 
+import mock
+
+from cumulusci.tasks.metadata.package import MetadataXmlElementParser
+from cumulusci.tasks.metadata.package import MissingNameElementError
 from cumulusci.tasks.metadata.package import PackageXmlGenerator
+from cumulusci.tasks.metadata.package import get_delete_excludes
+from cumulusci.tasks.metadata.package import get_metadata_map
+from cumulusci.tasks.metadata.package import metadata_sort_key
 
 __location__ = os.path.split(os.path.realpath(__file__))[0]
 
@@ -60,3 +68,147 @@ class TestPackageXmlGenerator(unittest.TestCase):
         package_xml = generator()
 
         self.assertEquals(package_xml, expected_package_xml)
+
+    def test_process_pool(self):
+        api_version = '36.0'
+        path = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(path, 'classes'))
+            for i in range(20):
+                with open(os.path.join(path, 'classes', 'Class{}.cls'.format(i)), 'w') as f:
+                    f.write('class Class{} {{}}'.format(i))
+            os.makedirs(os.path.join(path, 'labels'))
+            with open(os.path.join(path, 'labels', 'CustomLabels.labels'), 'w') as f:
+                f.write(
+                    '<?xml version="1.0" encoding="UTF-8"?>\n'
+                    '<CustomLabels xmlns="http://soap.sforce.com/2006/04/metadata">\n'
+                    '<labels><fullName>Label_B</fullName></labels>\n'
+                    '<labels><fullName>Label_A</fullName></labels>\n'
+                    '</CustomLabels>'
+                )
+
+            generator = PackageXmlGenerator(path, api_version, processes=1)
+            expected = generator()
+
+            generator = PackageXmlGenerator(path, api_version, processes=2)
+            generator.min_pool_jobs = 1
+            package_xml = generator()
+        finally:
+            shutil.rmtree(path)
+
+        self.assertEquals(package_xml, expected)
+        self.assertIn('<members>Class19</members>', package_xml)
+        self.assertIn('<members>Label_A</members>', package_xml)
+
+    def test_members_cache(self):
+        api_version = '36.0'
+        path = tempfile.mkdtemp()
+        try:
+            cache_path = os.path.join(path, 'cache', 'package_xml_cache.json')
+            src = os.path.join(path, 'src')
+            os.makedirs(os.path.join(src, 'labels'))
+            labels = os.path.join(src, 'labels', 'CustomLabels.labels')
+            with open(labels, 'w') as f:
+                f.write(
+                    '<?xml version="1.0" encoding="UTF-8"?>\n'
+                    '<CustomLabels xmlns="http://soap.sforce.com/2006/04/metadata">\n'
+                    '<labels><fullName>Label_A</fullName></labels>\n'
+                    '</CustomLabels>'
+                )
+            generator = PackageXmlGenerator(src, api_version, cache_path=cache_path)
+            expected = generator()
+
+            with mock.patch.object(MetadataXmlElementParser, '_parse_item') as parse_item:
+                generator = PackageXmlGenerator(src, api_version, cache_path=cache_path)
+                self.assertEquals(generator(), expected)
+            self.assertFalse(parse_item.called)
+
+            with open(labels, 'w') as f:
+                f.write(
+                    '<?xml version="1.0" encoding="UTF-8"?>\n'
+                    '<CustomLabels xmlns="http://soap.sforce.com/2006/04/metadata">\n'
+                    '<labels><fullName>Label_A</fullName></labels>\n'
+                    '<labels><fullName>Label_B</fullName></labels>\n'
+                    '</CustomLabels>'
+                )
+            generator = PackageXmlGenerator(src, api_version, cache_path=cache_path)
+            package_xml = generator()
+        finally:
+            shutil.rmtree(path)
+
+        self.assertIn('<members>Label_B</members>', package_xml)
+
+
+OBJECT_XML = '''<?xml version="1.0" encoding="UTF-8"?>
+<CustomObject xmlns="http://soap.sforce.com/2006/04/metadata">
+    <fields>
+        <fullName>Field__c</fullName>
+        <label>Field</label>
+    </fields>
+    <recordTypes>
+        <fullName>RecordType</fullName>
+        <picklistValues>
+            <picklist>Field__c</picklist>
+            <values><fullName>Nested</fullName></values>
+        </picklistValues>
+    </recordTypes>
+    <recordTypes>
+        <fullName>Other</fullName>
+    </recordTypes>
+</CustomObject>'''
+
+
+class TestMetadataXmlElementParser(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        with open(os.path.join(self.path, 'Test__c.object'), 'w') as f:
+            f.write(OBJECT_XML)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _parse(self, item_xpath, name_xpath=None):
+        parser = MetadataXmlElementParser(
+            'RecordType',
+            self.path,
+            'object',
+            False,
+            item_xpath=item_xpath,
+            name_xpath=name_xpath,
+        )
+        return parser._parse_item('Test__c.object')
+
+    def test_streamed(self):
+        self.assertEquals(
+            self._parse('./sf:recordTypes'),
+            ['Test__c.RecordType', 'Test__c.Other'],
+        )
+
+    def test_full_parse_matches(self):
+        # Only xpaths of direct children are streamed
+        self.assertEquals(
+            self._parse('./sf:recordTypes', './/sf:fullName'),
+            self._parse('./sf:recordTypes'),
+        )
+
+    def test_missing_name(self):
+        with self.assertRaises(MissingNameElementError):
+            self._parse('./sf:fields', './sf:description')
+
+
+class TestMetadataRegistry(unittest.TestCase):
+
+    def test_metadata_map_loaded_once(self):
+        self.assertIs(get_metadata_map(), get_metadata_map())
+        self.assertIn(
+            ('MetadataFilenameParser', 'ApexClass', 'cls', ()),
+            get_metadata_map()['classes'],
+        )
+
+    def test_delete_excludes(self):
+        self.assertIsInstance(get_delete_excludes(), frozenset)
+
+    def test_metadata_sort_key(self):
+        self.assertEquals(metadata_sort_key('Account.Field__c'), '5AccountZ5Field__c'.replace('_', 'Z'))
+        self.assertLess(metadata_sort_key('Zeta'), metadata_sort_key('ns__Alpha'))
@@ -1,29 +1,45 @@
-import base64
-import cgi
+import copy
 import datetime
 from distutils.version import LooseVersion
 import errno
-import io
 import json
 import logging
+import multiprocessing
 import os
-import re
 import shutil
 import tempfile
 import time
-import zipfile
+from multiprocessing.pool import ThreadPool
 
 from simple_salesforce import Salesforce
 from simple_salesforce import SalesforceGeneralError
 from salesforce_bulk import SalesforceBulk
-import xmltodict
 
+from cumulusci.core.config import TaskConfig
 from cumulusci.core.exceptions import ApexTestException
 from cumulusci.core.exceptions import SalesforceException
 from cumulusci.core.exceptions import TaskOptionsError
 from cumulusci.core.tasks import BaseTask
+from cumulusci.tasks.apex_log import DEFAULT_LOG_WORKERS
+from cumulusci.tasks.apex_log import fetch_log
+from cumulusci.tasks.apex_log import read_log
+from cumulusci.tasks.apex_results import MethodResult
+from cumulusci.tasks.apex_results import write_json
+from cumulusci.tasks.apex_results import write_junit
+from cumulusci.tasks.apex_tests import ApexTestCoverage
+from cumulusci.tasks.apex_tests import TEST_ORDERS
+from cumulusci.tasks.apex_tests import balance_shards
+from cumulusci.tasks.apex_tests import get_apex_names
+from cumulusci.tasks.apex_tests import get_changed_files
+from cumulusci.tasks.apex_tests import load_history
+from cumulusci.tasks.metadata.incremental import DeployManifest
+from cumulusci.tasks.metadata.incremental import IncrementalDeployment
+from cumulusci.tasks.metadata.incremental import get_file_hashes
+from cumulusci.tasks.metadata.incremental import get_package_name
+from cumulusci.core.manifest import PackageManifest
 from cumulusci.tasks.metadata.package import PackageXmlGenerator
 from cumulusci.salesforce_api.exceptions import MetadataApiError
+from cumulusci.salesforce_api.driver import MetadataApiDriver
 from cumulusci.salesforce_api.metadata import ApiDeploy
 from cumulusci.salesforce_api.metadata import ApiListMetadata
 from cumulusci.salesforce_api.metadata import ApiRetrieveInstalledPackages
@@ -32,11 +48,14 @@ from cumulusci.salesforce_api.metadata import ApiRetrieveUnpackaged
 from cumulusci.salesforce_api.package_zip import CreatePackageZipBuilder
 from cumulusci.salesforce_api.package_zip import DestructiveChangesZipBuilder
 from cumulusci.salesforce_api.package_zip import InstallPackageZipBuilder
+from cumulusci.salesforce_api.package_zip import MetadataZipBuilder
 from cumulusci.salesforce_api.package_zip import UninstallPackageZipBuilder
+from cumulusci.salesforce_api.package_zip import ZipCompressionCache
+from cumulusci.salesforce_api.retrieve_cache import get_retrieve_cache
+from cumulusci.salesforce_api.session import get_session
 from cumulusci.utils import CUMULUSCI_PATH
 from cumulusci.utils import findReplace
 from cumulusci.utils import package_xml_from_dict
-from cumulusci.utils import zip_subfolder
 
 
 class BaseSalesforceTask(BaseTask):
@@ -57,6 +76,9 @@ class BaseSalesforceMetadataApiTask(BaseSalesforceTask):
     def _get_api(self):
         return self.api_class(self)
 
+    def _get_retrieve_cache(self):
+        return get_retrieve_cache(self.project_config)
+
     def _run_task(self):
         api = self._get_api()
         if api:
@@ -125,13 +147,9 @@ class BaseRetrieveMetadata(BaseSalesforceMetadataApiTask):
 
     def _run_task(self):
         api = self._get_api()
-        src_zip = api()
-        self._extract_zip(src_zip)
+        api()
         self.logger.info('Extracted retrieved metadata into {}'.format(self.options['path']))
 
-    def _extract_zip(self, src_zip):
-        src_zip.extractall(self.options['path'])
-
 
 class RetrieveUnpackaged(BaseRetrieveMetadata):
     api_class = ApiRetrieveUnpackaged
@@ -166,6 +184,8 @@ class RetrieveUnpackaged(BaseRetrieveMetadata):
             self,
             self.options['package_xml'],
             self.options['api_version'],
+            extract_path=self.options['path'],
+            cache=self._get_retrieve_cache(),
         )
 
 
@@ -199,12 +219,10 @@ class RetrievePackaged(BaseRetrieveMetadata):
             self,
             self.options['package'],
             self.options['api_version'],
+            extract_path=self.options['path'],
+            cache=self._get_retrieve_cache(),
         )
 
-    def _extract_zip(self, src_zip):
-        src_zip = zip_subfolder(src_zip, self.options.get('package'))
-        super(RetrievePackaged, self)._extract_zip(src_zip)
-
 class RetrieveReportsAndDashboards(BaseRetrieveMetadata):
     api_class = ApiRetrieveUnpackaged
 
@@ -219,23 +237,34 @@ class RetrieveReportsAndDashboards(BaseRetrieveMetadata):
         'dashboard_folders': {
             'description': 'A list of the dashboard folders to retrieve reports.  Separate by commas for multiple folders.',
         },
+        'concurrency': {
+            'description': 'The number of listMetadata calls, each listing up to 3 folders, to run at the same time.  Defaults to 4',
+        },
     }
 
+    def _init_options(self, kwargs):
+        super(RetrieveReportsAndDashboards, self)._init_options(kwargs)
+        self.options['concurrency'] = int(self.options.get('concurrency') or 4)
+
     def _validate_options(self):
         super(RetrieveReportsAndDashboards, self)._validate_options()
         if not 'report_folders' in self.options and not 'dashboard_folders' in self.options:
             raise TaskOptionsError('You must provide at least one folder name for either report_folders or dashboard_folders')
 
     def _get_api(self):
-        metadata = {}
+        queries = []
         if 'report_folders' in self.options:
             for folder in self.options['report_folders']:
-                api_reports = ApiListMetadata(self, 'Report', metadata=metadata, folder=folder)
-                metadata = api_reports()
+                queries.append(('Report', folder))
         if 'dashboard_folders' in self.options:
             for folder in self.options['dashboard_folders']:
-                api_dashboards = ApiListMetadata(self, 'Dashboard', metadata=metadata, folder=folder)
-                metadata = api_dashboards()
+                queries.append(('Dashboard', folder))
+        api_list = ApiListMetadata(
+            self,
+            queries=queries,
+            concurrency=self.options['concurrency'],
+        )
+        metadata = api_list()
 
         items = {}
         if 'Report' in metadata:
@@ -256,6 +285,8 @@ class RetrieveReportsAndDashboards(BaseRetrieveMetadata):
             self,
             package_xml,
             api_version,
+            extract_path=self.options['path'],
+            cache=self._get_retrieve_cache(),
         )
 
 class Deploy(BaseSalesforceMetadataApiTask):
@@ -265,32 +296,98 @@ class Deploy(BaseSalesforceMetadataApiTask):
             'description': 'The path to the metadata source to be deployed',
             'required': True,
         },
+        'incremental': {
+            'description': 'If True, only deploy the components added or changed since the last incremental deployment of path to the org, and delete the components removed since then.  Defaults to False',
+        },
+        'results_output': {
+            'description': 'The path of a file to write the component failures, test failures and code coverage warnings of the deployment to as JSON lines',
+        },
     }
-        
+
+    def _run_task(self):
+        if self.options.get('incremental') in [True, 'True', 'true']:
+            return self._run_incremental()
+        return super(Deploy, self)._run_task()
+
+    def _get_manifest_path(self):
+        return os.path.join(
+            self.project_config.project_local_dir,
+            '{}.deploy_manifest.json'.format(self.org_config.org_id),
+        )
+
+    def _run_incremental(self):
+        path = self.options['path']
+        manifest = DeployManifest(self._get_manifest_path(), path)
+        hashes = get_file_hashes(path)
+        previous = manifest.load()
+
+        if previous is None:
+            self.logger.info('No previous incremental deployment found for this org, deploying all of {}'.format(path))
+            api = self._get_api(path)
+            return self._deploy_and_save_manifest(api, manifest, hashes)
+
+        changes = IncrementalDeployment(
+            path,
+            previous,
+            hashes,
+            self.project_config.project__package__api_version,
+            get_package_name(path),
+        )
+        if not changes:
+            self.logger.info('No changes to deploy since the last deployment')
+            return
+
+        self.logger.info(
+            'Deploying {} changed files and deleting {} removed files'.format(
+                len(changes.files),
+                len(changes.deleted),
+            )
+        )
+        tempdir = tempfile.mkdtemp()
+        try:
+            changes.stage(tempdir)
+            api = self._get_api(tempdir)
+        finally:
+            shutil.rmtree(tempdir)
+        return self._deploy_and_save_manifest(api, manifest, hashes)
+
+    def _deploy_and_save_manifest(self, api, manifest, hashes):
+        result = api()
+        # Failed deployments either raise an exception or return no status
+        if result == 'Success':
+            manifest.save(hashes)
+        return result
+
     def _get_api(self, path=None):
         if not path:
             path = self.task_config.options__path
 
-        # Build the zip file
-        zip_file = tempfile.TemporaryFile()
-        zipf = zipfile.ZipFile(zip_file, 'w', zipfile.ZIP_DEFLATED)
+        # Build the zip file.  ApiDeploy base64 encodes the zip from disk as
+        # the request is sent
+        zip_file = self._get_zip_builder(path)()
 
-        pwd = os.getcwd()
-
-        os.chdir(path)
-        for root, dirs, files in os.walk('.'):
-            for f in files:
-                self._write_zip_file(zipf, root, f)
-        zipf.close()
-        zip_file.seek(0)
-        package_zip = base64.b64encode(zip_file.read())
+        return self.api_class(
+            self,
+            zip_file,
+            purge_on_delete=False,
+            results_output=self._get_results_output(path),
+        )
 
-        os.chdir(pwd)
+    def _get_results_output(self, path):
+        return self.options.get('results_output')
 
-        return self.api_class(self, package_zip, purge_on_delete=False)
+    def _get_zip_builder(self, path, **kwargs):
+        return MetadataZipBuilder(
+            path,
+            cache=self._get_zip_cache(),
+            workers=self.project_config.cumulusci__deploy__zip_workers,
+            **kwargs
+        )
 
-    def _write_zip_file(self, zipf, root, path):
-        zipf.write(os.path.join(root, path))
+    def _get_zip_cache(self):
+        return ZipCompressionCache(
+            os.path.join(self.project_config.project_local_dir, 'zip_cache')
+        )
 
 
 class CreatePackage(Deploy):
@@ -514,14 +611,125 @@ class UpdateDependencies(BaseSalesforceMetadataApiTask):
         api = self.api_class(self, package_zip())
         return api()
 
-class DeployBundles(Deploy):
+class MetadataBundlesMixin(object):
+    """ Runs a Metadata API call per bundle through a MetadataApiDriver """
+
+    bundle_options = {
+        'concurrency': {
+            'description': 'The number of bundles to process at the same time.  Defaults to 1 which processes the bundles one at a time in alphabetical order',
+        },
+        'dependencies': {
+            'description': 'A dictionary of bundle names to a list of the bundle names which must be processed before it, or the same as a JSON string.  Bundles are processed after their dependencies even if they sort before them',
+        },
+        'results_output': {
+            'description': 'The path of a file to write the failures and code coverage warnings of each bundle to as JSON lines.  The bundle name is added before the extension, so results.json becomes results.<bundle>.json',
+        },
+    }
+
+    def _init_bundle_options(self):
+        self.options['concurrency'] = int(self.options.get('concurrency') or 1)
+        dependencies = self.options.get('dependencies') or {}
+        if isinstance(dependencies, basestring):
+            try:
+                dependencies = json.loads(dependencies)
+            except ValueError:
+                raise TaskOptionsError(
+                    'dependencies must be a JSON object of bundle names to ' +
+                    'lists of bundle names: {}'.format(dependencies))
+        if not isinstance(dependencies, dict):
+            raise TaskOptionsError(
+                'dependencies must be a dictionary of bundle names to ' +
+                'lists of bundle names')
+        for item, depends_on in dependencies.items():
+            if isinstance(depends_on, basestring):
+                depends_on = [name.strip() for name in depends_on.split(',')]
+            if not isinstance(depends_on, list):
+                raise TaskOptionsError(
+                    'The dependencies of bundle {} must be a list'.format(item))
+            dependencies[item] = depends_on
+        self.options['dependencies'] = dependencies
+
+    def _get_results_output(self, path):
+        # Each bundle writes its own results file as bundles may be deployed
+        # at the same time
+        results_output = self.options.get('results_output')
+        if results_output:
+            root, ext = os.path.splitext(results_output)
+            return '{}.{}{}'.format(root, os.path.basename(path), ext)
+
+    def _get_bundles(self, path):
+        return sorted([
+            item for item in os.listdir(path)
+            if os.path.isdir(os.path.join(path, item))
+        ])
+
+    def _order_bundles(self, bundles):
+        """ Returns the bundles sorted so each comes after its dependencies
+
+        Bundles are otherwise kept in alphabetical order.
+        """
+        dependencies = self.options['dependencies']
+        for item, depends_on in dependencies.items():
+            for name in [item] + depends_on:
+                if name not in bundles:
+                    raise TaskOptionsError(
+                        'Unknown bundle {} in dependencies'.format(name))
+        ordered = []
+        done = set()
+
+        def visit(item, path):
+            if item in done:
+                return
+            if item in path:
+                raise TaskOptionsError(
+                    'Circular bundle dependencies: {}'.format(
+                        ' -> '.join(path[path.index(item):] + [item])))
+            for name in dependencies.get(item, []):
+                visit(name, path + [item])
+            done.add(item)
+            ordered.append(item)
+
+        for item in bundles:
+            visit(item, [])
+        return ordered
+
+    def _run_bundles(self, path, message):
+        driver = MetadataApiDriver(self, self.options['concurrency'])
+        # The added bundles each bundle must wait for.  A bundle with nothing
+        # to process stands in for its own dependencies so the order still
+        # holds across it.
+        effective = {}
+        for item in self._order_bundles(self._get_bundles(path)):
+            self.logger.info('{}: {}/{}'.format(message, self.options['path'], item))
+            depends_on = []
+            for name in self.options['dependencies'].get(item, []):
+                for dependency in effective[name]:
+                    if dependency not in depends_on:
+                        depends_on.append(dependency)
+            api = self._get_api(os.path.join(path, item))
+            if not api:
+                effective[item] = depends_on
+                continue
+            driver.add(api, name=item, depends_on=depends_on)
+            effective[item] = [item]
+        return driver()
+
+
+class DeployBundles(MetadataBundlesMixin, Deploy):
     task_options = {
         'path': {
             'description': 'The path to the parent directory containing the metadata bundles directories',
             'required': True,
-        }
+        },
+        'concurrency': MetadataBundlesMixin.bundle_options['concurrency'],
+        'dependencies': MetadataBundlesMixin.bundle_options['dependencies'],
+        'results_output': MetadataBundlesMixin.bundle_options['results_output'],
     }
 
+    def _init_options(self, kwargs):
+        super(DeployBundles, self)._init_options(kwargs)
+        self._init_bundle_options()
+
     def _run_task(self):
         path = self.options['path']
         pwd = os.getcwd()
@@ -535,18 +743,7 @@ class DeployBundles(Deploy):
             self.logger.warn('Path {} not found, skipping'.format(path))
             return
 
-        for item in os.listdir(path):
-            item_path = os.path.join(path, item)
-            if not os.path.isdir(item_path):
-                continue
-
-            self.logger.info('Deploying bundle: {}/{}'.format(self.options['path'], item))
-
-            self._deploy_bundle(item_path)
-
-    def _deploy_bundle(self, path):
-        api = self._get_api(path)
-        return api()
+        self._run_bundles(path, 'Deploying bundle')
 
 class DeployNamespacedBundles(DeployBundles):
     name = 'DeployNamespacedBundles'
@@ -570,6 +767,9 @@ class DeployNamespacedBundles(DeployBundles):
             'description': 'The path to the parent directory containing the metadata bundles directories',
             'required': True,
         },
+        'concurrency': MetadataBundlesMixin.bundle_options['concurrency'],
+        'dependencies': MetadataBundlesMixin.bundle_options['dependencies'],
+        'results_output': MetadataBundlesMixin.bundle_options['results_output'],
     }
 
     def _init_options(self, kwargs):
@@ -581,7 +781,7 @@ class DeployNamespacedBundles(DeployBundles):
         if 'namespace' not in self.options:
             self.options['namespace'] = self.project_config.project__package__namespace
 
-    def _write_zip_file(self, zipf, root, path):
+    def _get_zip_builder(self, path, **kwargs):
         if self.options['managed'] in [True, 'True', 'true']:
             namespace = self.options['namespace']
             if namespace:
@@ -589,15 +789,12 @@ class DeployNamespacedBundles(DeployBundles):
         else:
             namespace = ''
 
-        zip_path = path.replace(self.options['filename_token'], namespace)
-        with open(os.path.join(root, path), 'r') as f:
-            content = f.read().replace(self.options['namespace_token'], namespace)
-        if root == '.':
-            zipf.writestr(zip_path, content)
-        else:
-            # strip ./ from the start of root
-            root = root[2:]
-            zipf.writestr(os.path.join(root, zip_path), content)
+        return super(DeployNamespacedBundles, self)._get_zip_builder(
+            path,
+            content_replacements=[(self.options['namespace_token'], namespace)],
+            filename_replacements=[(self.options['filename_token'], namespace)],
+            **kwargs
+        )
 
 class BaseUninstallMetadata(Deploy):
 
@@ -645,22 +842,20 @@ class UninstallPackaged(UninstallLocal):
         if self.options['purge_on_delete'] == 'False':
             self.options['purge_on_delete'] = False
 
-    def _retrieve_packaged(self):
+    def _retrieve_packaged(self, path):
         retrieve_api = ApiRetrievePackaged(
             self,
             self.options['package'],
-            self.project_config.project__package__api_version
+            self.project_config.project__package__api_version,
+            extract_path=path,
+            cache=self._get_retrieve_cache(),
         )
-        packaged = retrieve_api()
-        packaged = zip_subfolder(packaged, self.options['package'])
-        return packaged
+        return retrieve_api()
 
     def _get_destructive_changes(self, path=None):
         self.logger.info('Retrieving metadata in package {} from target org'.format(self.options['package']))
-        packaged = self._retrieve_packaged()
-
         tempdir = tempfile.mkdtemp()
-        packaged.extractall(tempdir)
+        self._retrieve_packaged(tempdir)
 
         destructive_changes = super(UninstallPackaged, self)._get_destructive_changes(tempdir)
 
@@ -698,10 +893,8 @@ class UninstallPackagedIncremental(UninstallPackaged):
 
     def _get_destructive_changes(self, path=None):
         self.logger.info('Retrieving metadata in package {} from target org'.format(self.options['package']))
-        packaged = self._retrieve_packaged()
-
         tempdir = tempfile.mkdtemp()
-        packaged.extractall(tempdir)
+        self._retrieve_packaged(tempdir)
 
         destructive_changes = self._package_xml_diff(
             os.path.join(self.options['path'], 'package.xml'),
@@ -716,60 +909,33 @@ class UninstallPackagedIncremental(UninstallPackaged):
         return destructive_changes
 
     def _package_xml_diff(self, master, compare):
-        master_xml = xmltodict.parse(open(master, 'r'))
-        compare_xml = xmltodict.parse(open(compare, 'r'))
-
-        delete = {}
-
-        master_items = {}
-        compare_items = {}
-
-        for md_type in master_xml['Package'].get('types',[]):
-            master_items[md_type['name']] = []
-            if 'members' not in md_type:
-                continue
-            if isinstance(md_type['members'], unicode):
-                master_items[md_type['name']].append(md_type['members'])
-            else:
-                for item in md_type['members']:
-                    master_items[md_type['name']].append(item)
-
-        for md_type in compare_xml['Package'].get('types',[]):
-            compare_items[md_type['name']] = []
-            if 'members' not in md_type:
-                continue
-            if isinstance(md_type['members'], unicode):
-                compare_items[md_type['name']].append(md_type['members'])
-            else:
-                for item in md_type['members']:
-                    compare_items[md_type['name']].append(item)
+        master = PackageManifest.parse(master)
+        compare = PackageManifest.parse(compare)
 
-        for md_type, members in compare_items.items():
-            if md_type not in master_items:
-                delete[md_type] = members
-                continue
-
-            for member in members:
-                if member not in master_items[md_type]:
-                    if md_type not in delete:
-                        delete[md_type] = []
-                    delete[md_type].append(member)
-
-        if delete:
+        # Anything in the org's package which is no longer in master
+        diff = compare.diff(master)
+        if diff.removed:
             self.logger.info('Deleting metadata:')
-            for md_type, members in delete.items():
-                for member in members:
+            for md_type, members in sorted(diff.removed.types.items()):
+                for member in sorted(members):
                     self.logger.info('    {}: {}'.format(md_type, member))
-            destructive_changes = self._render_xml_from_items_dict(delete)
-            return destructive_changes
+            return diff.render_destructive_changes(
+                self.project_config.project__package__api_version
+            )
 
-    def _render_xml_from_items_dict(self, items):
-        return package_xml_from_dict(
-            items, 
-            api_version = self.project_config.project__package__api_version,
-        )
+class UninstallLocalBundles(MetadataBundlesMixin, UninstallLocal):
+    task_options = {
+        'path': {
+            'description': 'The path to a directory containing the metadata bundles (subdirectories) to uninstall',
+            'required': True,
+        },
+        'concurrency': MetadataBundlesMixin.bundle_options['concurrency'],
+        'dependencies': MetadataBundlesMixin.bundle_options['dependencies'],
+    }
 
-class UninstallLocalBundles(UninstallLocal):
+    def _init_options(self, kwargs):
+        super(UninstallLocalBundles, self)._init_options(kwargs)
+        self._init_bundle_options()
 
     def _run_task(self):
         path = self.options['path']
@@ -779,18 +945,7 @@ class UninstallLocalBundles(UninstallLocal):
 
         self.logger.info('Deleting all metadata from bundles in {} from target org'.format(path))
 
-        for item in os.listdir(path):
-            item_path = os.path.join(path, item)
-            if not os.path.isdir(item_path):
-                continue
-
-            self.logger.info('Deleting bundle: {}/{}'.format(self.options['path'], item))
-
-            self._delete_bundle(item_path)
-
-    def _delete_bundle(self, path=None):
-        api = self._get_api(path)
-        return api()
+        self._run_bundles(path, 'Deleting bundle')
 
 class UninstallLocalNamespacedBundles(UninstallLocalBundles):
 
@@ -813,6 +968,8 @@ class UninstallLocalNamespacedBundles(UninstallLocalBundles):
             'description': 'Sets the purgeOnDelete option for the deployment.  Defaults to True',
             'required': True,
         },
+        'concurrency': MetadataBundlesMixin.bundle_options['concurrency'],
+        'dependencies': MetadataBundlesMixin.bundle_options['dependencies'],
     }
 
     def _init_options(self, kwargs):
@@ -879,9 +1036,10 @@ class UpdateAdminProfile(Deploy):
             self,
             self.options.get('package_xml'),
             self.project_config.project__package__api_version,
+            extract_path=self.tempdir,
+            cache=self._get_retrieve_cache(),
         )
-        unpackaged = api_retrieve()
-        unpackaged.extractall(self.tempdir)
+        api_retrieve()
 
     def _process_metadata(self):
         self.logger.info('Processing retrieved metadata in {}'.format(self.tempdir))
@@ -1052,6 +1210,38 @@ class RunApexTests(BaseSalesforceToolingApiTask):
         'junit_output': {
             'description': 'File name for JUnit output.  Defaults to test_results.xml',
         },
+        'shard_orgs': {
+            'description': ('Comma separated names of keychain orgs to ' +
+                            'split the test classes across along with the ' +
+                            'task org.  Classes are balanced by their ' +
+                            'durations in earlier runs.'),
+        },
+        'test_order': {
+            'description': ('Order to queue test classes in: slowest ' +
+                            'queues the slowest classes in earlier runs ' +
+                            'first, failing queues the classes that failed ' +
+                            'in their last run first and none keeps the ' +
+                            'query order.  Defaults to slowest'),
+        },
+        'changed_since': {
+            'description': ('A git revision or range.  If set, only the ' +
+                            'test classes which covered the Apex classes ' +
+                            'and triggers changed since then in earlier ' +
+                            'runs are run, along with changed test classes'),
+        },
+        'full_run': {
+            'description': ('If True, run all matching test classes even ' +
+                            'if changed_since is set.  Defaults to False'),
+        },
+        'full_run_every': {
+            'description': ('Run all matching test classes after this many ' +
+                            'runs limited by changed_since.  Defaults to 10'),
+        },
+        'collect_coverage': {
+            'description': ('If True, store which classes and triggers each ' +
+                            'test class covered for use by changed_since.  ' +
+                            'Defaults to True if changed_since is set'),
+        },
     }
 
     def _init_options(self, kwargs):
@@ -1073,8 +1263,31 @@ class RunApexTests(BaseSalesforceToolingApiTask):
                 self.options['managed'] = False
         if 'junit_output' not in self.options:
             self.options['junit_output'] = 'test_results.xml'
+        shard_orgs = self.options.get('shard_orgs') or []
+        if not isinstance(shard_orgs, list):
+            shard_orgs = [
+                name.strip() for name in shard_orgs.split(',') if name.strip()
+            ]
+        self.options['shard_orgs'] = shard_orgs
+        if not self.options.get('test_order'):
+            self.options['test_order'] = 'slowest'
+        if self.options['test_order'] not in TEST_ORDERS:
+            raise TaskOptionsError('test_order must be one of: {}'.format(
+                ', '.join(TEST_ORDERS)))
+        self.options['full_run'] = self.options.get('full_run') in [
+            True, 'True', 'true']
+        self.options['full_run_every'] = int(
+            self.options.get('full_run_every') or 10)
+        if self.options.get('collect_coverage') is None:
+            self.options['collect_coverage'] = bool(
+                self.options.get('changed_since'))
+        else:
+            self.options['collect_coverage'] = self.options[
+                'collect_coverage'] in [True, 'True', 'true']
 
         self.counts = {}
+        self.history = None
+        self.coverage = None
 
     def _init_class(self):
         self.classes_by_id = {}
@@ -1146,23 +1359,70 @@ class RunApexTests(BaseSalesforceToolingApiTask):
         self.logger.info('Found {} test classes'.format(result['totalSize']))
         return result
 
+    def _select_test_classes(self):
+        """ Returns the test class records to run and whether they are all
+        the matching test classes
+        """
+        records = self._get_test_classes()['records']
+        changed_since = self.options.get('changed_since')
+        if not changed_since or not records:
+            return records, True
+        if self.options['full_run']:
+            self.logger.info('Running all test classes on request')
+            return records, True
+        coverage = self._get_coverage_store()
+        if coverage.runs_since_full >= self.options['full_run_every']:
+            self.logger.info(
+                'Running all test classes after {} runs of impacted tests'
+                .format(coverage.runs_since_full))
+            return records, True
+
+        changed = get_apex_names(
+            get_changed_files(changed_since, self.project_config.repo_root))
+        test_names = set(test_class['Name'] for test_class in records)
+        # Changed test classes are run as they are, the rest are looked up
+        # in the coverage of earlier runs
+        impacted = coverage.get_impacted_tests(changed - test_names)
+        if impacted is None:
+            self.logger.info(
+                'No coverage known for some of the changed classes and ' +
+                'triggers, running all test classes')
+            return records, True
+        impacted.update(changed & test_names)
+        records = [
+            test_class for test_class in records
+            if test_class['Name'] in impacted
+        ]
+        self.logger.info(
+            '{} changed classes and triggers since {} impact {} test classes'
+            .format(len(changed), changed_since, len(records)))
+        return records, False
+
+    def _get_new_results(self, class_ids):
+        """ Adds the results of the test classes which finished since the
+        last poll, noting failures as they are found """
+        for i in range(0, len(class_ids), 100):
+            result = self.tooling.query_all("SELECT StackTrace, Message, " +
+                "ApexLogId, AsyncApexJobId, MethodName, Outcome, " +
+                "ApexClassId, TestTimestamp FROM ApexTestResult " +
+                "WHERE AsyncApexJobId = '{}' ".format(self.job_id) +
+                "AND ApexClassId IN ('{}')".format("','".join(
+                    str(class_id) for class_id in class_ids[i:i + 100])))
+            for test_result in result['records']:
+                class_name = self.classes_by_id[test_result['ApexClassId']]
+                self.results_by_class_name[class_name][test_result[
+                    'MethodName']] = test_result
+                self.counts[test_result['Outcome']] += 1
+                self._debug_get_results(test_result)
+                if test_result['Outcome'] in ['Fail', 'CompileFail']:
+                    # Only a progress notice, the summary has the details
+                    self.logger.info('{}: {}.{} (details in summary)'.format(
+                        test_result['Outcome'],
+                        class_name,
+                        test_result['MethodName'],
+                    ))
+
     def _get_test_results(self):
-        result = self.tooling.query_all("SELECT StackTrace, Message, " +
-            "ApexLogId, AsyncApexJobId, MethodName, Outcome, ApexClassId, " +
-            "TestTimestamp FROM ApexTestResult " +
-            "WHERE AsyncApexJobId = '{}'".format(self.job_id))
-        self.counts = {
-            'Pass': 0,
-            'Fail': 0,
-            'CompileFail': 0,
-            'Skip': 0,
-        }
-        for test_result in result['records']:
-            class_name = self.classes_by_id[test_result['ApexClassId']]
-            self.results_by_class_name[class_name][test_result[
-                'MethodName']] = test_result
-            self.counts[test_result['Outcome']] += 1
-            self._debug_get_results(test_result)
         self._debug_get_logs()
         test_results = []
         class_names = self.results_by_class_name.keys()
@@ -1174,31 +1434,36 @@ class RunApexTests(BaseSalesforceToolingApiTask):
             if duration:
                 message += '({}s)'.format(duration)
             self.logger.info(message)
-            method_names = self.results_by_class_name[class_name].keys()
-            method_names.sort()
-            for method_name in method_names:
-                result = self.results_by_class_name[class_name][method_name]
+            # Release the raw records of each class once it is converted
+            methods = self.results_by_class_name.pop(class_name)
+            decoded_class_name = self._decode_to_unicode(class_name)
+            for method_name in sorted(methods):
+                result = methods[method_name]
                 message = '\t{}: {}'.format(result['Outcome'],
                     result['MethodName'])
                 duration = self._debug_get_duration_method(result)
                 if duration:
                     message += ' ({}s)'.format(duration)
                 self.logger.info(message)
-                test_results.append({
-                    'Children': result.get('children', None),
-                    'ClassName': self._decode_to_unicode(class_name),
-                    'Method': self._decode_to_unicode(result['MethodName']),
-                    'Message': self._decode_to_unicode(result['Message']),
-                    'Outcome': self._decode_to_unicode(result['Outcome']),
-                    'StackTrace': self._decode_to_unicode(
+                test_results.append(MethodResult(
+                    class_name=decoded_class_name,
+                    method=self._decode_to_unicode(result['MethodName']),
+                    outcome=self._decode_to_unicode(result['Outcome']),
+                    message=self._decode_to_unicode(result['Message']),
+                    stack_trace=self._decode_to_unicode(
                         result['StackTrace']),
-                    'Stats': result.get('stats', None),
-                    'TestTimestamp': result.get('TestTimestamp', None),
-                })
+                    stats=result.get('stats', None),
+                    children=result.get('children', None),
+                    timestamp=result.get('TestTimestamp', None),
+                ))
                 if result['Outcome'] in ['Fail', 'CompileFail']:
                     self.logger.info('\tMessage: {}'.format(result['Message']))
                     self.logger.info('\tStackTrace: {}'.format(
                         result['StackTrace']))
+        self._log_summary(test_results)
+        return test_results
+
+    def _log_summary(self, test_results):
         self.logger.info('-' * 80)
         self.logger.info('Pass: {}  Fail: {}  CompileFail: {}  Skip: {}'
                          .format(
@@ -1214,27 +1479,106 @@ class RunApexTests(BaseSalesforceToolingApiTask):
             self.logger.error('-' * 80)
             counter = 0
             for result in test_results:
-                if result['Outcome'] not in ['Fail', 'CompileFail']:
+                if not result.failed:
                     continue
                 counter += 1
                 self.logger.error('{}: {}.{} - {}'.format(counter,
-                    result['ClassName'], result['Method'], result['Outcome']))
-                self.logger.error('\tMessage: {}'.format(result['Message']))
+                    result.class_name, result.method, result.outcome))
+                self.logger.error('\tMessage: {}'.format(result.message))
                 self.logger.error('\tStackTrace: {}'.format(
-                    result['StackTrace']))
-        return test_results
+                    result.stack_trace))
 
     def _run_task(self):
-        result = self._get_test_classes()
-        if result['totalSize'] == 0:
+        if self.options['shard_orgs']:
+            return self._run_sharded()
+        records, full_run = self._select_test_classes()
+        if not records:
+            return
+        self._log_estimate([test_class['Name'] for test_class in records])
+        test_results = self._run_test_classes(records)
+        self._record_history(test_results)
+        self._record_coverage([self.coverage], full_run)
+        self._write_output(test_results)
+        self._raise_for_failures()
+
+    def _run_sharded(self):
+        records, full_run = self._select_test_classes()
+        if not records:
             return
-        for test_class in result['records']:
+        tasks = [self]
+        for org_name in self.options['shard_orgs']:
+            tasks.append(self._get_shard_task(org_name))
+        class_names = [test_class['Name'] for test_class in records]
+        shards = balance_shards(
+            class_names,
+            self._get_history().get_durations(),
+            len(tasks),
+        )
+        self._log_estimate(class_names, len(tasks))
+        jobs = []
+        for task, shard in zip(tasks, shards):
+            if not shard:
+                continue
+            self.logger.info('Running {} test classes in org {}'.format(
+                len(shard), task.org_config.org_id))
+            jobs.append((task, shard, records if task is self else None))
+
+        pool = ThreadPool(len(jobs))
+        try:
+            shard_results = pool.map(
+                lambda job: job[0]._run_shard(job[1], job[2]),
+                jobs,
+            )
+        finally:
+            pool.close()
+            pool.join()
+
+        # Merge the shards into a single set of results and counts
+        counts = {}
+        for task, shard, shard_records in jobs:
+            for outcome, count in task.counts.items():
+                counts[outcome] = counts.get(outcome, 0) + count
+        self.counts = counts
+        test_results = []
+        for results in shard_results:
+            test_results.extend(results)
+        test_results.sort(key=lambda result: (result.class_name, result.method))
+        self.logger.info('Combined results of {} orgs'.format(len(jobs)))
+        self._log_summary(test_results)
+        self._record_history(test_results)
+        self._record_coverage([job[0].coverage for job in jobs], full_run)
+        self._write_output(test_results)
+        self._raise_for_failures()
+
+    def _get_shard_task(self, org_name):
+        org_config = self.project_config.keychain.get_org(org_name)
+        config = copy.deepcopy(self.task_config.config)
+        config['options'] = dict(self.options, shard_orgs=[])
+        return self.__class__(self.project_config, TaskConfig(config), org_config)
+
+    def _run_shard(self, class_names, records=None):
+        """ Runs the named test classes in this task's org """
+        if records is None:
+            records = self._get_test_classes()['records']
+        class_names = set(class_names)
+        records = [
+            test_class for test_class in records
+            if test_class['Name'] in class_names
+        ]
+        return self._run_test_classes(records)
+
+    def _run_test_classes(self, records):
+        for test_class in records:
             self.classes_by_id[test_class['Id']] = test_class['Name']
             self.classes_by_name[test_class['Name']] = test_class['Id']
             self.results_by_class_name[test_class['Name']] = {}
         self._debug_create_trace_flag()
         self.logger.info('Queuing tests for execution...')
-        ids = self.classes_by_id.keys()
+        class_names = self._get_history().order_classes(
+            sorted(self.classes_by_name),
+            self.options['test_order'],
+        )
+        ids = [self.classes_by_name[name] for name in class_names]
         result = self.tooling._call_salesforce(
             method='POST',
             url=self.tooling.base_url + 'runTestsAsynchronous',
@@ -1248,64 +1592,136 @@ class RunApexTests(BaseSalesforceToolingApiTask):
         self.job_id = result.json()
         self._wait_for_tests()
         test_results = self._get_test_results()
-        self._write_output(test_results)
+        if self.options['collect_coverage']:
+            self.coverage = self._get_coverage()
+        return test_results
+
+    def _get_coverage(self):
+        """ Returns the classes and triggers covered by each test class """
+        coverage = {}
+        class_ids = self.classes_by_id.keys()
+        for i in range(0, len(class_ids), 100):
+            result = self.tooling.query_all(
+                'SELECT ApexTestClassId, ApexClassOrTrigger.Name ' +
+                'FROM ApexCodeCoverage WHERE ApexTestClassId IN ' +
+                "('{}')".format("','".join(
+                    str(class_id) for class_id in class_ids[i:i + 100])))
+            for record in result['records']:
+                class_name = self.classes_by_id[record['ApexTestClassId']]
+                coverage.setdefault(class_name, set()).add(
+                    record['ApexClassOrTrigger']['Name'])
+        for class_name in self.classes_by_name:
+            coverage.setdefault(class_name, set())
+        return coverage
+
+    def _raise_for_failures(self):
         if self.counts.get('Fail') or self.counts.get('CompileFail'):
-            total = self.counts.get('Fail') + self.counts.get('CompileFail')
             raise ApexTestException(
                 '{} tests failed and {} tests failed compilation'.format(
                     self.counts.get('Fail'), self.counts.get('CompileFail')
                 )
             )
 
+    def _get_history(self):
+        if self.history is None:
+            self.history = load_history(self.project_config)
+        return self.history
+
+    def _get_coverage_store(self):
+        coverage = ApexTestCoverage(os.path.join(
+            self.project_config.project_local_dir,
+            'apex_test_coverage.json',
+        ))
+        coverage.load()
+        return coverage
+
+    def _record_coverage(self, coverages, full_run):
+        """ Stores the coverage of the test classes which ran """
+        if not self.options['collect_coverage']:
+            return
+        merged = {}
+        for coverage in coverages:
+            if coverage:
+                merged.update(coverage)
+        self._get_coverage_store().update(merged, full_run)
+
+    def _log_estimate(self, class_names, shards=1):
+        estimate = self._get_history().predict_runtime(class_names, shards)
+        if estimate is not None:
+            self.logger.info(
+                'Estimated test time from earlier runs: {:.1f}s'.format(
+                    estimate))
+
+    def _record_history(self, test_results):
+        """ Stores the results in the test history for the current commit """
+        self._get_history().add_run(
+            self.project_config.repo_commit,
+            test_results,
+        )
+
     def _wait_for_tests(self):
+        """ Polls the queue items of the job until no tests are queued or
+        processing, fetching the results of each class as it finishes
+
+        Only the first poll returns every queue item.  Later polls only
+        return the items which were still pending, so the items missing
+        from a poll are the ones which finished since the one before.
+        """
         poll_interval = int(self.options.get('poll_interval', 1))
+        pending_statuses = ('Holding', 'Queued', 'Preparing', 'Processing')
+        self.counts = {
+            'Pass': 0,
+            'Fail': 0,
+            'CompileFail': 0,
+            'Skip': 0,
+        }
+        query = ("SELECT Id, Status, ApexClassId FROM ApexTestQueueItem " +
+                 "WHERE ParentJobId = '{}'".format(self.job_id))
+        total = None
+        pending = {}
         while True:
-            result = self.tooling.query_all(
-                "SELECT Id, Status, ApexClassId FROM ApexTestQueueItem " +
-                "WHERE ParentJobId = '{}'".format(self.job_id))
-            counts = {
-                'Aborted': 0,
-                'Completed': 0,
-                'Failed': 0,
-                'Holding': 0,
-                'Preparing': 0,
-                'Processing': 0,
-                'Queued': 0,
-            }
+            result = self.tooling.query_all(query)
+            counts = dict((status, 0) for status in pending_statuses)
+            still_pending = {}
+            finished = []
             for test_queue_item in result['records']:
-                counts[test_queue_item['Status']] += 1
-            self.logger.info('Completed: {}  Processing: {}  Queued: {}'
+                if test_queue_item['Status'] in pending_statuses:
+                    counts[test_queue_item['Status']] += 1
+                    still_pending[test_queue_item['Id']] = (
+                        test_queue_item['ApexClassId'])
+                elif total is None:
+                    finished.append(test_queue_item['ApexClassId'])
+            if total is None:
+                total = len(result['records'])
+                query += " AND Status IN ('{}')".format(
+                    "','".join(pending_statuses))
+            else:
+                finished = [
+                    class_id for item_id, class_id in pending.items()
+                    if item_id not in still_pending
+                ]
+            pending = still_pending
+            done = counts['Queued'] == 0 and counts['Processing'] == 0
+            if done:
+                # Holding and Preparing items are not waited for
+                finished.extend(pending.values())
+            self._get_new_results(finished)
+            # Later polls do not tell Completed, Failed and Aborted items
+            # apart, so they are counted together as finished
+            self.logger.info('Finished: {}  Processing: {}  Queued: {}'
                              .format(
-                                 counts['Completed'],
+                                 total - len(pending),
                                  counts['Processing'],
                                  counts['Queued'],
                              ))
-            if counts['Queued'] == 0 and counts['Processing'] == 0:
+            if done:
                 self.logger.info('Apex tests completed')
                 break
             time.sleep(poll_interval)
 
     def _write_output(self, test_results):
-        junit_output = self.options['junit_output']
-        with io.open(junit_output, mode='w', encoding='utf-8') as f:
-            f.write(u'<testsuite tests="{}">\n'.format(len(test_results)))
-            for result in test_results:
-                s = '  <testcase classname="{}" name="{}"'.format(
-                    result['ClassName'], result['Method'])
-                if ('Stats' in result and result['Stats']
-                        and 'duration' in result['Stats']):
-                    s += ' time="{}"'.format(result['Stats']['duration'])
-                if result['Outcome'] in ['Fail', 'CompileFail']:
-                    s += '>\n'
-                    s += '    <failure type="{}">{}</failure>\n'.format(
-                        cgi.escape(result['StackTrace']),
-                        cgi.escape(result['Message']),
-                    )
-                    s += '  </testcase>\n'
-                else:
-                    s += ' />\n'
-                f.write(unicode(s))
-            f.write(u'</testsuite>')
+        write_junit(test_results, self.options['junit_output'])
+
 
 run_apex_tests_debug_options = RunApexTests.task_options.copy()
 run_apex_tests_debug_options.update({
@@ -1315,18 +1731,27 @@ run_apex_tests_debug_options.update({
     'json_output': {
         'description': ('The path to the json output file.  Defaults to ' +
                        'test_results.json'),
-    }
+    },
+    'log_workers': {
+        'description': ('Number of debug logs to download and parse at ' +
+                        'once.  Defaults to {}'.format(DEFAULT_LOG_WORKERS)),
+    },
 })
 
 class RunApexTestsDebug(RunApexTests):
     """Run Apex tests and collect debug info"""
     api_version = '38.0'
     task_options = run_apex_tests_debug_options
+    # Logs are downloaded and parsed on a process pool if there are at least
+    # this many, otherwise on threads
+    min_pool_logs = 20
 
     def _init_options(self, kwargs):
         super(RunApexTestsDebug, self)._init_options(kwargs)
         if 'json_output' not in self.options:
             self.options['json_output'] = 'test_results.json'
+        self.options['log_workers'] = int(
+            self.options.get('log_workers') or DEFAULT_LOG_WORKERS)
 
     def _debug_init_class(self):
         self.classes_by_log_id = {}
@@ -1412,31 +1837,32 @@ class RunApexTestsDebug(RunApexTests):
             'from ApexLog where Id in {}'.format(log_ids))
         debug_log_dir = self.options.get('debug_log_dir')
         if debug_log_dir:
-            tempdir = None
             try:
                 os.makedirs(debug_log_dir)
             except OSError as e:
                 if e.errno != errno.EEXIST:
                     raise
-        else:
-            tempdir = tempfile.mkdtemp()
+        logs = []
         for log in result['records']:
             class_id = self.classes_by_log_id[log['Id']]
-            class_name = self.classes_by_id[class_id]
             self.logs_by_class_id[class_id] = log
-            body_url = '{}sobjects/ApexLog/{}/Body'.format(
-                self.tooling.base_url, log['Id'])
-            response = self.tooling.request.get(body_url,
-                headers=self.tooling.headers)
-            log_file = class_name + '.log'
-            if debug_log_dir:
-                log_file = os.path.join(debug_log_dir, log_file)
-            else:
-                log_file = os.path.join(tempdir, log_file)
-            with io.open(log_file, mode='w', encoding='utf-8') as f:
-                f.write(self._decode_to_unicode(response.content))
-            with io.open(log_file, mode='r', encoding='utf-8') as f:
-                method_stats = self._parse_log(class_name, f)
+            logs.append((log['Id'], self.classes_by_id[class_id]))
+        workers = min(self.options['log_workers'], len(logs))
+        if workers > 1 and len(logs) >= self.min_pool_logs:
+            # Parse on a process pool, each process downloads its own logs
+            pool = multiprocessing.Pool(workers)
+            jobs = [self._get_log_job(log) for log in logs]
+            get_log_stats = fetch_log
+        else:
+            pool = ThreadPool(max(workers, 1))
+            jobs = logs
+            get_log_stats = self._get_log_stats
+        try:
+            method_stats_by_log = pool.map(get_log_stats, jobs, 1)
+        finally:
+            pool.close()
+            pool.join()
+        for (log_id, class_name), method_stats in zip(logs, method_stats_by_log):
             # Add method stats to results_by_class_name
             for method, info in method_stats.items():
                 if method not in self.results_by_class_name[class_name]:
@@ -1446,167 +1872,39 @@ class RunApexTestsDebug(RunApexTests):
         # Delete the DebugLevel
         DebugLevel = self._get_tooling_object('DebugLevel')
         DebugLevel.delete(str(self.debug_level_id))
-        # Clean up tempdir logs
-        if tempdir:
-            shutil.rmtree(tempdir)
 
-    def _debug_get_results(self, result):
-        if result['ApexLogId']:
-            self.classes_by_log_id[result['ApexLogId']] = result['ApexClassId']
+    def _get_log_job(self, log):
+        log_id, class_name = log
+        url = '{}sobjects/ApexLog/{}/Body'.format(self.tooling.base_url, log_id)
+        log_file = None
+        debug_log_dir = self.options.get('debug_log_dir')
+        if debug_log_dir:
+            log_file = os.path.join(debug_log_dir, class_name + '.log')
+        return url, self.tooling.headers, class_name, log_file
 
-    def _log_time_delta(self, start, end):
+    def _get_log_stats(self, log):
+        """ Streams a log body into the parser, copying it to debug_log_dir
+        if set
         """
-        Returns microsecond difference between two debug log timestamps in the
-        format HH:MM:SS.micro.
-        """
-        dummy_date = datetime.date(2001, 1, 1)
-        dummy_date_next = datetime.date(2001, 1, 2)
-        # Split out the parts of the start and end string
-        start_parts = re.split(':|\.', start)
-        start_parts = [int(part) for part in start_parts]
-        start_parts[3] = start_parts[3] * 1000
-        t_start = datetime.time(*start_parts)
-        end_parts = re.split(':|\.', end)
-        end_parts = [int(part) for part in end_parts]
-        end_parts[3] = end_parts[3] * 1000
-        t_end = datetime.time(*end_parts)
-        # Combine with dummy date to do date math
-        d_start = datetime.datetime.combine(dummy_date, t_start)
-        # If end was on the next day, attach to next dummy day
-        if start_parts[0] > end_parts[0]:
-            d_end = datetime.datetime.combine(dummy_date_next, t_end)
-        else:
-            d_end = datetime.datetime.combine(dummy_date, t_end)
-        delta = d_end - d_start
-        return delta.total_seconds()
-
-    def _parse_log(self, class_name, f):
-        """Parse an Apex test log."""
-        class_name = self._decode_to_unicode(class_name)
-        methods = {}
-        for method, stats, children in self._parse_log_by_method(class_name,
-                f):
-            methods[method] = {'stats': stats, 'children': children}
-        return methods
-
-    def _parse_log_by_method(self, class_name, f):
-        """Parse an Apex test log by method."""
-        stats = {}
-        last_stats = {}
-        in_limits = False
-        in_cumulative_limits = False
-        in_testing_limits = False
-        unit = None
-        method = None
-        children = {}
-        parent = None
-        for line in f:
-            line = self._decode_to_unicode(line).strip()
-            if '|CODE_UNIT_STARTED|[EXTERNAL]|' in line:
-                unit, unit_type, unit_info = self._parse_unit_started(
-                    class_name, line)
-                if unit_type == 'test_method':
-                    method = self._decode_to_unicode(unit)
-                    method_unit_info = unit_info
-                    children = []
-                    stack = []
-                else:
-                    stack.append({
-                        'unit': unit,
-                        'unit_type': unit_type,
-                        'unit_info': unit_info,
-                        'stats': {},
-                        'children': [],
-                    })
-                continue
-            if '|CUMULATIVE_LIMIT_USAGE' in line and 'USAGE_END' not in line:
-                in_cumulative_limits = True
-                in_testing_limits = False
-                continue
-            if '|TESTING_LIMITS' in line:
-                in_testing_limits = True
-                in_cumulative_limits = False
-                continue
-            if '|LIMIT_USAGE_FOR_NS|(default)|' in line:
-                # Parse the start of the limits section
-                in_limits = True
-                continue
-            if in_limits and ':' not in line:
-                # Parse the end of the limits section
-                in_limits = False
-                in_cumulative_limits = False
-                in_testing_limits = False
-                continue
-            if in_limits:
-                # Parse the limit name, used, and allowed values
-                limit, value = line.split(': ')
-                if in_testing_limits:
-                    limit = 'TESTING_LIMITS: {}'.format(limit)
-                used, allowed = value.split(' out of ')
-                stats[limit] = {'used': used, 'allowed': allowed}
-                continue
-            if '|CODE_UNIT_FINISHED|{}.{}'.format(class_name, method) in line:
-                # Handle the finish of test methods
-                end_timestamp = line.split(' ')[0]
-                stats['duration'] = self._log_time_delta(
-                    method_unit_info['start_timestamp'], end_timestamp)
-                # Yield the stats for the method
-                yield method, stats, children
-                last_stats = stats.copy()
-                stats = {}
-                in_cumulative_limits = False
-                in_limits = False
-            elif '|CODE_UNIT_FINISHED|' in line:
-                # Handle all other code units finishing
-                end_timestamp = line.split(' ')[0]
-                stats['duration'] = self._log_time_delta(
-                    method_unit_info['start_timestamp'], end_timestamp)
-                try:
-                    child = stack.pop()
-                except:
-                    # Skip if there was no stack. This seems to have have
-                    # started in Spring 16 where the debug log will contain
-                    # CODE_UNIT_FINISHED lines which have no matching
-                    # CODE_UNIT_STARTED from earlier in the file.
-                    continue
-                child['stats'] = stats
-                if not stack:
-                    # Add the child to the main children list
-                    children.append(child)
-                else:
-                    # Add this child to its parent
-                    stack[-1]['children'].append(child)
-                stats = {}
-                in_cumulative_limits = False
-                in_limits = False
-            if '* MAXIMUM DEBUG LOG SIZE REACHED *' in line:
-                # If debug log size limit was reached, fail gracefully
-                break
+        url, headers, class_name, log_file = self._get_log_job(log)
+        session = get_session(self.org_config, self.options['log_workers'])
+        response, new_connection = session.get(
+            url,
+            headers=headers,
+            stream=True,
+        )
+        return read_log(response, class_name, log_file)
 
-    def _parse_unit_started(self, class_name, line):
-        unit = line.split('|')[-1]
-        unit_type = 'other'
-        unit_info = {}
-        if unit.startswith(class_name + '.'):
-            unit_type = 'test_method'
-            unit = unit.split('.')[-1]
-        elif 'trigger event' in unit:
-            unit_type = 'trigger'
-            unit, obj, event = re.match(
-                r'(.*) on (.*) trigger event (.*) for.*', unit).groups()
-            unit_info = {'event': event, 'object': obj}
-        # Add the start timestamp to unit_info
-        unit_info['start_timestamp'] = line.split(' ')[0]
-        return unit, unit_type, unit_info
+    def _debug_get_results(self, result):
+        if result['ApexLogId']:
+            self.classes_by_log_id[result['ApexLogId']] = result['ApexClassId']
 
     def _write_output(self, test_results):
         # Write the JUnit test report
         super(RunApexTestsDebug, self)._write_output(test_results)
 
         # Write the json file
-        json_output = self.options['json_output']
-        with io.open(json_output, mode='w', encoding='utf-8') as f:
-            f.write(unicode(json.dumps(test_results)))
+        write_json(test_results, self.options['json_output'])
 
 class SOQLQuery(BaseSalesforceBulkApiTask):
     name = 'SOQLQuery'
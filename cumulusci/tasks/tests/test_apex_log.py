@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import responses
+
+from cumulusci.tasks.apex_log import fetch_log
+from cumulusci.tasks.apex_log import get_duration
+from cumulusci.tasks.apex_log import parse_log
+from cumulusci.tasks.apex_log import parse_timestamp
+
+LOG = '''38.0 APEX_CODE,FINEST;APEX_PROFILING,INFO
+23:59:59.000 (1000)|CODE_UNIT_STARTED|[EXTERNAL]|01p|Test_TEST.testOne
+23:59:59.100 (1100)|CODE_UNIT_FINISHED|Orphan
+23:59:59.200 (1200)|CODE_UNIT_STARTED|[EXTERNAL]|01q|AccountTrigger on Account trigger event BeforeInsert for [new]
+23:59:59.300 (1300)|CODE_UNIT_STARTED|[EXTERNAL]|Validation:Account:new
+23:59:59.400 (1400)|CODE_UNIT_FINISHED|Validation:Account:new
+23:59:59.500 (1500)|CUMULATIVE_LIMIT_USAGE
+23:59:59.500 (1500)|LIMIT_USAGE_FOR_NS|(default)|
+  Number of SOQL queries: 1 out of 100
+
+23:59:59.500 (1500)|CUMULATIVE_LIMIT_USAGE_END
+
+23:59:59.600 (1600)|CODE_UNIT_FINISHED|AccountTrigger on Account trigger event BeforeInsert for [new]
+23:59:59.700 (1700)|USER_DEBUG|[3]|DEBUG|first line
+second line: with a colon
+23:59:59.800 (1800)|TESTING_LIMITS
+23:59:59.800 (1800)|LIMIT_USAGE_FOR_NS|(default)|
+  Number of SOQL queries: 2 out of 100
+
+00:00:00.500 (2500)|CODE_UNIT_FINISHED|Test_TEST.testOne
+00:00:01.000 (3000)|CODE_UNIT_STARTED|[EXTERNAL]|01p|Test_TEST.testTwo
+*********** MAXIMUM DEBUG LOG SIZE REACHED ***********
+00:00:02.000 (4000)|CODE_UNIT_FINISHED|Test_TEST.testTwo
+'''
+
+
+class TestTimestamps(unittest.TestCase):
+
+    def test_parse_timestamp(self):
+        self.assertEqual(parse_timestamp('01:02:03.004'), 3723004000000)
+
+    def test_get_duration(self):
+        self.assertEqual(get_duration(
+            parse_timestamp('12:00:00.100'),
+            parse_timestamp('12:00:01.600'),
+        ), 1.5)
+
+    def test_get_duration_next_day(self):
+        self.assertEqual(get_duration(
+            parse_timestamp('23:59:59.000'),
+            parse_timestamp('00:00:00.500'),
+        ), 1.5)
+
+
+class TestParseLog(unittest.TestCase):
+
+    def test_parse_log(self):
+        methods = parse_log('Test_TEST', LOG.splitlines())
+
+        self.assertEqual(list(methods), ['testOne'])
+        stats = methods['testOne']['stats']
+        self.assertEqual(stats, {
+            'duration': 1.5,
+            'TESTING_LIMITS: Number of SOQL queries': {
+                'used': '2',
+                'allowed': '100',
+            },
+        })
+        children = methods['testOne']['children']
+        self.assertEqual(len(children), 1)
+        trigger = children[0]
+        self.assertEqual(trigger['unit'], 'AccountTrigger')
+        self.assertEqual(trigger['unit_type'], 'trigger')
+        self.assertEqual(trigger['unit_info'], {
+            'event': 'BeforeInsert',
+            'object': 'Account',
+            'start_timestamp': '23:59:59.200',
+        })
+        # Durations of code units are measured from the start of the method
+        self.assertEqual(trigger['stats'], {
+            'duration': 0.6,
+            'Number of SOQL queries': {'used': '1', 'allowed': '100'},
+        })
+        validation = trigger['children'][0]
+        self.assertEqual(validation['unit'], 'Validation:Account:new')
+        self.assertEqual(validation['unit_type'], 'other')
+        self.assertEqual(validation['stats'], {'duration': 0.4})
+
+    def test_parse_log_file_lines(self):
+        # Lines read from a file keep their line endings
+        self.assertEqual(
+            parse_log('Test_TEST', LOG.splitlines(True)),
+            parse_log('Test_TEST', LOG.splitlines()),
+        )
+
+
+class TestFetchLog(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    @responses.activate
+    def test_fetch_log(self):
+        url = 'https://example.com/services/data/v38.0/tooling/sobjects/ApexLog/1/Body'
+        responses.add(responses.GET, url, body=LOG)
+        log_file = os.path.join(self.tempdir, 'Test_TEST.log')
+
+        methods = fetch_log((url, {}, 'Test_TEST', log_file))
+
+        self.assertEqual(methods, parse_log('Test_TEST', LOG.splitlines()))
+        with open(log_file, 'r') as f:
+            self.assertEqual(f.read(), LOG)
@@ -0,0 +1,130 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from cumulusci.core.config import BaseGlobalConfig
+from cumulusci.core.config import BaseProjectConfig
+from cumulusci.core.config import TaskConfig
+from cumulusci.core.exceptions import ApexTestException
+from cumulusci.core.exceptions import TaskOptionsError
+from cumulusci.tasks.apex_regressions import CompareApexTestRuns
+from cumulusci.tasks.apex_regressions import Regression
+from cumulusci.tasks.apex_regressions import find_regressions
+from cumulusci.tasks.apex_regressions import get_history_measures
+from cumulusci.tasks.apex_regressions import get_results_measures
+from cumulusci.tasks.apex_results import MethodResult
+from cumulusci.tasks.apex_tests import load_history
+
+
+def make_result(class_name, method, duration, queries):
+    return {
+        'ClassName': class_name,
+        'Method': method,
+        'Outcome': 'Pass',
+        'Stats': {
+            'duration': duration,
+            'Number of SOQL queries': {'used': str(queries), 'allowed': '100'},
+        },
+    }
+
+
+class TestFindRegressions(unittest.TestCase):
+
+    def test_get_measures(self):
+        results = [make_result('A_TEST', 'one', 1.5, 3)]
+        measures = {('A_TEST', 'one'): {
+            'duration': 1.5,
+            'Number of SOQL queries': 3,
+        }}
+        self.assertEqual(get_results_measures(results), measures)
+        self.assertEqual(get_history_measures({'classes': {'A_TEST': {
+            'duration': 1.5,
+            'methods': {'one': {
+                'duration': 1.5,
+                'limits': {'Number of SOQL queries': 3},
+                'outcome': 'Pass',
+            }},
+        }}}), measures)
+
+    def test_find_regressions(self):
+        base = {
+            ('A_TEST', 'one'): {'duration': 1.0, 'queries': 10, 'rows': 0},
+            ('A_TEST', 'two'): {'duration': 0.01, 'queries': 5},
+            ('A_TEST', 'removed'): {'duration': 1.0},
+        }
+        compare = {
+            ('A_TEST', 'one'): {'duration': 1.1, 'queries': 11, 'rows': 2},
+            ('A_TEST', 'two'): {'duration': 0.05, 'queries': 4},
+            ('A_TEST', 'new'): {'duration': 9.0},
+        }
+        self.assertEqual(find_regressions(base, compare), [
+            Regression('A_TEST', 'one', 'queries', 10, 11),
+            Regression('A_TEST', 'one', 'rows', 0, 2),
+        ])
+        self.assertEqual(
+            find_regressions(base, compare, duration_threshold=5,
+                             limit_threshold=10, limits=['queries']),
+            [Regression('A_TEST', 'one', 'duration', 1.0, 1.1)],
+        )
+
+    def test_str(self):
+        self.assertEqual(
+            str(Regression('A_TEST', 'one', 'queries', 10, 15)),
+            'A_TEST.one: queries 10 -> 15 (+50.0%)',
+        )
+        self.assertEqual(
+            str(Regression('A_TEST', 'one', 'rows', 0, 2)),
+            'A_TEST.one: rows 0 -> 2 (new)',
+        )
+
+
+class TestCompareApexTestRuns(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        project_local_dir = patch.object(
+            BaseProjectConfig, 'project_local_dir', self.tempdir)
+        project_local_dir.start()
+        self.addCleanup(project_local_dir.stop)
+        self.project_config = BaseProjectConfig(BaseGlobalConfig())
+        self.results_path = os.path.join(self.tempdir, 'test_results.json')
+        with open(self.results_path, 'w') as f:
+            json.dump([make_result('A_TEST', 'one', 1.0, 12)], f)
+        history = load_history(self.project_config)
+        stats = make_result('A_TEST', 'one', 1.0, 10)['Stats']
+        history.add_run('abc123', [MethodResult(
+            'A_TEST', 'one', 'Pass', None, None, stats, None, None)])
+
+    def _run_task(self, **options):
+        options.setdefault('compare', self.results_path)
+        task = CompareApexTestRuns(
+            self.project_config, TaskConfig({'options': options}))
+        return task()
+
+    def test_run_task(self):
+        return_values = self._run_task(base='abc')
+        self.assertEqual(return_values['regressions'], [{
+            'class_name': 'A_TEST',
+            'method': 'one',
+            'measure': 'Number of SOQL queries',
+            'base': 10,
+            'value': 12,
+        }])
+
+    def test_run_task_no_regressions(self):
+        return_values = self._run_task(
+            base=self.results_path, fail_on_regression='True')
+        self.assertEqual(return_values['regressions'], [])
+
+    def test_run_task_fail_on_regression(self):
+        with self.assertRaises(ApexTestException):
+            self._run_task(base='abc123', fail_on_regression='True')
+
+    def test_run_task_unknown_base(self):
+        with self.assertRaises(TaskOptionsError):
+            self._run_task(base='def456')
@@ -0,0 +1,59 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from cumulusci.tasks.apex_results import MethodResult
+from cumulusci.tasks.apex_results import write_json
+from cumulusci.tasks.apex_results import write_junit
+
+
+class TestWriters(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.results = [
+            MethodResult(u'A_TEST', u'one', u'Pass', None, None,
+                         {'duration': 1.5}, None, None),
+            MethodResult(u'B_TEST', u'two', u'Fail', u'a < b', u'line 1',
+                         None, [], u'2017-01-01T00:00:00.000+0000'),
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_slots(self):
+        with self.assertRaises(AttributeError):
+            self.results[0].extra = True
+        self.assertEqual(self.results[0].duration, 1.5)
+        self.assertIsNone(self.results[1].duration)
+        self.assertTrue(self.results[1].failed)
+
+    def test_write_junit(self):
+        path = os.path.join(self.tempdir, 'results.xml')
+        write_junit(self.results, path)
+        with open(path, 'r') as f:
+            self.assertEqual(f.read(), (
+                '<testsuite tests="2">\n'
+                '  <testcase classname="A_TEST" name="one" time="1.5" />\n'
+                '  <testcase classname="B_TEST" name="two">\n'
+                '    <failure type="line 1">a &lt; b</failure>\n'
+                '  </testcase>\n'
+                '</testsuite>'
+            ))
+
+    def test_write_json(self):
+        path = os.path.join(self.tempdir, 'results.json')
+        write_json(self.results, path)
+        with open(path, 'r') as f:
+            content = f.read()
+        expected = [result.as_dict() for result in self.results]
+        self.assertEqual(content, json.dumps(expected))
+        self.assertEqual(json.loads(content)[1]['Message'], u'a < b')
+
+    def test_write_json_empty(self):
+        path = os.path.join(self.tempdir, 'results.json')
+        write_json([], path)
+        with open(path, 'r') as f:
+            self.assertEqual(json.load(f), [])
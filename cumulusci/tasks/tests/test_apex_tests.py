@@ -0,0 +1,175 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from cumulusci.tasks.apex_results import MethodResult
+from cumulusci.tasks.apex_tests import ApexTestCoverage
+from cumulusci.tasks.apex_tests import ApexTestHistory
+from cumulusci.tasks.apex_tests import balance_shards
+from cumulusci.tasks.apex_tests import get_apex_names
+
+
+class TestBalanceShards(unittest.TestCase):
+
+    def test_longest_first(self):
+        durations = {'A': 10, 'B': 7, 'C': 6, 'D': 5, 'E': 2}
+        shards = balance_shards(sorted(durations), durations, 2)
+        self.assertEqual(shards, [['A', 'D'], ['B', 'C', 'E']])
+
+    def test_unknown_durations_use_average(self):
+        shards = balance_shards(['A', 'B', 'C'], {'A': 4, 'B': 2}, 2)
+        self.assertEqual(shards, [['A'], ['C', 'B']])
+
+    def test_no_durations(self):
+        shards = balance_shards(['D', 'C', 'B', 'A'], {}, 3)
+        self.assertEqual(shards, [['A', 'D'], ['B'], ['C']])
+
+    def test_more_shards_than_classes(self):
+        shards = balance_shards(['A'], {}, 3)
+        self.assertEqual(shards, [['A'], [], []])
+
+
+class TestApexTestHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'history.json')
+        self.history = ApexTestHistory(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _result(self, class_name, method, outcome='Pass', duration=None):
+        stats = None
+        if duration is not None:
+            stats = {
+                'duration': duration,
+                'Number of SOQL queries': {'used': '3', 'allowed': '100'},
+            }
+        return MethodResult(
+            class_name, method, outcome, None, None, stats, None, None)
+
+    def test_load_missing(self):
+        self.assertEqual(self.history.load(), [])
+
+    def test_load_invalid(self):
+        with open(self.path, 'w') as f:
+            f.write('{')
+        self.assertEqual(self.history.load(), [])
+
+    def test_add_run(self):
+        self.history.add_run('abc', [
+            self._result('A', 'one', duration=1.5),
+            self._result('A', 'two', 'Fail', duration=0.5),
+            self._result('B', 'one'),
+        ])
+        history = ApexTestHistory(self.path)
+        history.load()
+        run = history.get_run('abc')
+        self.assertEqual(run['classes']['A']['duration'], 2.0)
+        self.assertEqual(run['classes']['A']['methods']['two'], {
+            'duration': 0.5,
+            'limits': {'Number of SOQL queries': 3},
+            'outcome': 'Fail',
+        })
+        self.assertEqual(run['classes']['B'], {
+            'methods': {'one': {'outcome': 'Pass'}},
+        })
+
+    def test_add_run_replaces_commit(self):
+        self.history.max_runs = 2
+        self.history.add_run('abc', [self._result('A', 'one', duration=1)])
+        self.history.add_run('def', [self._result('A', 'one', duration=2)])
+        self.history.add_run('abc', [self._result('A', 'one', duration=3)])
+        self.assertEqual(
+            [run['commit'] for run in self.history.runs], ['abc', 'def'])
+        self.history.add_run('ghi', [self._result('A', 'one', duration=4)])
+        self.assertEqual(
+            [run['commit'] for run in self.history.runs], ['ghi', 'abc'])
+
+    def test_newest_durations_and_outcomes(self):
+        self.history.add_run('abc', [
+            self._result('A', 'one', 'Fail', duration=5),
+            self._result('B', 'one', 'Fail', duration=2),
+        ])
+        self.history.add_run('def', [
+            self._result('A', 'one', duration=3),
+            self._result('C', 'one', 'CompileFail'),
+        ])
+        self.assertEqual(self.history.get_durations(), {'A': 3, 'B': 2})
+        self.assertEqual(self.history.get_failing(), set(['B', 'C']))
+
+    def test_order_classes(self):
+        self.history.add_run('abc', [
+            self._result('A', 'one', duration=1),
+            self._result('B', 'one', 'Fail', duration=2),
+            self._result('C', 'one', duration=4),
+        ])
+        names = ['A', 'B', 'C', 'D']
+        self.assertEqual(
+            self.history.order_classes(names), ['C', 'D', 'B', 'A'])
+        self.assertEqual(
+            self.history.order_classes(names, 'failing'),
+            ['B', 'C', 'D', 'A'],
+        )
+        self.assertEqual(
+            self.history.order_classes(['C', 'A'], 'none'), ['C', 'A'])
+
+    def test_predict_runtime(self):
+        self.assertIsNone(self.history.predict_runtime(['A']))
+        self.history.add_run('abc', [
+            self._result('A', 'one', duration=4),
+            self._result('B', 'one', duration=2),
+        ])
+        self.assertEqual(self.history.predict_runtime(['A', 'B', 'C']), 9)
+        self.assertEqual(self.history.predict_runtime(['A', 'B', 'C'], 2), 5)
+
+
+class TestApexTestCoverage(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'coverage.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_update(self):
+        coverage = ApexTestCoverage(self.path)
+        coverage.load()
+        coverage.update({
+            'A_TEST': set(['A', 'Shared']),
+            'B_TEST': set(['B', 'Shared']),
+        }, True)
+        coverage.update({'A_TEST': set(['A'])}, False)
+        coverage = ApexTestCoverage(self.path)
+        coverage.load()
+        self.assertEqual(coverage.covered_by, {
+            'A': set(['A_TEST']),
+            'B': set(['B_TEST']),
+            'Shared': set(['B_TEST']),
+        })
+        self.assertEqual(coverage.runs_since_full, 1)
+
+    def test_get_impacted_tests(self):
+        coverage = ApexTestCoverage(self.path)
+        coverage.covered_by = {
+            'A': set(['A_TEST']),
+            'B': set(['B_TEST', 'A_TEST']),
+        }
+        self.assertEqual(
+            coverage.get_impacted_tests(['A', 'B']), set(['A_TEST', 'B_TEST']))
+        self.assertEqual(coverage.get_impacted_tests([]), set())
+        self.assertIsNone(coverage.get_impacted_tests(['A', 'C']))
+
+
+class TestGetApexNames(unittest.TestCase):
+
+    def test_get_apex_names(self):
+        self.assertEqual(get_apex_names([
+            'src/classes/A.cls',
+            'src/classes/A.cls-meta.xml',
+            'src/triggers/B.trigger',
+            'src/objects/C__c.object',
+        ]), set(['A', 'B']))
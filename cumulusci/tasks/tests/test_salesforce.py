@@ -1,3 +1,6 @@
+import os
+import shutil
+import tempfile
 import unittest
 
 from mock import MagicMock
@@ -9,8 +12,11 @@ from cumulusci.core.config import BaseProjectConfig
 from cumulusci.core.config import ConnectedAppOAuthConfig
 from cumulusci.core.config import OrgConfig
 from cumulusci.core.config import TaskConfig
+from cumulusci.core.exceptions import TaskOptionsError
 from cumulusci.core.keychain import BaseProjectKeychain
+from cumulusci.tasks.apex_tests import ApexTestCoverage
 from cumulusci.tasks.salesforce import BaseSalesforceToolingApiTask
+from cumulusci.tasks.salesforce import DeployBundles
 from cumulusci.tasks.salesforce import RunApexTests
 from cumulusci.tasks.salesforce import RunApexTestsDebug
 
@@ -45,6 +51,82 @@ class TestBaseSalesforceToolingApiTask(unittest.TestCase):
         self.assertEqual(obj.base_url, url)
 
 
+@patch('cumulusci.tasks.salesforce.BaseSalesforceTask._update_credentials',
+    MagicMock(return_value=None))
+class TestDeployBundles(unittest.TestCase):
+
+    def setUp(self):
+        self.project_config = BaseProjectConfig(BaseGlobalConfig())
+        self.project_config.config['project'] = {
+            'package': {'api_version': 38.0}}
+        self.org_config = OrgConfig({
+            'instance_url': 'example.com',
+            'access_token': 'abc123',
+        })
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        for name in ['a', 'b', 'c']:
+            os.makedirs(os.path.join(self.tempdir, name))
+
+    def _get_task(self, dependencies):
+        return DeployBundles(self.project_config, TaskConfig({'options': {
+            'path': self.tempdir,
+            'concurrency': 2,
+            'dependencies': dependencies,
+        }}), self.org_config)
+
+    @patch('cumulusci.tasks.salesforce.MetadataApiDriver')
+    def test_run_bundles_after_later_dependency(self, driver_class):
+        task = self._get_task('{"a": ["c"]}')
+        task._get_api = MagicMock(side_effect=lambda path: path)
+        task._run_bundles(self.tempdir, 'Deploying bundle')
+
+        driver = driver_class.return_value
+        self.assertEqual(
+            [(call[1]['name'], call[1]['depends_on'])
+             for call in driver.add.call_args_list],
+            [('c', []), ('a', ['c']), ('b', [])],
+        )
+
+    @patch('cumulusci.tasks.salesforce.MetadataApiDriver')
+    def test_run_bundles_through_skipped_bundle(self, driver_class):
+        task = self._get_task({'b': ['a'], 'c': ['b']})
+        task._get_api = MagicMock(
+            side_effect=lambda path: None if path.endswith('b') else path)
+        task._run_bundles(self.tempdir, 'Deploying bundle')
+
+        driver = driver_class.return_value
+        self.assertEqual(
+            [(call[1]['name'], call[1]['depends_on'])
+             for call in driver.add.call_args_list],
+            [('a', []), ('c', ['a'])],
+        )
+
+    def test_results_output_per_bundle(self):
+        task = self._get_task({})
+        task.options['results_output'] = 'results.json'
+        self.assertEqual(
+            task._get_results_output(os.path.join(self.tempdir, 'a')),
+            'results.a.json',
+        )
+
+    def test_dependencies_unknown_bundle(self):
+        task = self._get_task({'a': ['d']})
+        with self.assertRaises(TaskOptionsError):
+            task._run_bundles(self.tempdir, 'Deploying bundle')
+
+    def test_dependencies_cycle(self):
+        task = self._get_task({'a': ['c'], 'c': ['b'], 'b': ['a']})
+        with self.assertRaises(TaskOptionsError):
+            task._run_bundles(self.tempdir, 'Deploying bundle')
+
+    def test_dependencies_invalid(self):
+        with self.assertRaises(TaskOptionsError):
+            self._get_task('a: c')
+        with self.assertRaises(TaskOptionsError):
+            self._get_task('["a"]')
+
+
 @patch('cumulusci.tasks.salesforce.BaseSalesforceTask._update_credentials',
     MagicMock(return_value=None))
 class TestRunApexTests(unittest.TestCase):
@@ -73,6 +155,15 @@ class TestRunApexTests(unittest.TestCase):
         })
         self.base_tooling_url = 'https://{}/services/data/v{}/tooling/'.format(
             self.org_config.instance_url, self.api_version)
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        project_local_dir = patch.object(
+            BaseProjectConfig, 'project_local_dir', self.tempdir)
+        project_local_dir.start()
+        self.addCleanup(project_local_dir.stop)
+        repo_commit = patch.object(BaseProjectConfig, 'repo_commit', 'abc123')
+        repo_commit.start()
+        self.addCleanup(repo_commit.stop)
 
     def _mock_apex_class_query(self):
         url = (self.base_tooling_url + 'query/?q=SELECT+Id%2C+Name+' +
@@ -90,7 +181,8 @@ class TestRunApexTests(unittest.TestCase):
         url = (self.base_tooling_url + 'query/?q=SELECT+StackTrace%2C+' +
             'Message%2C+ApexLogId%2C+AsyncApexJobId%2C+MethodName%2C+' +
             'Outcome%2C+ApexClassId%2C+TestTimestamp+FROM+ApexTestResult+' +
-            'WHERE+AsyncApexJobId+%3D+%27JOB_ID1234567%27')
+            'WHERE+AsyncApexJobId+%3D+%27JOB_ID1234567%27+AND+ApexClassId+' +
+            'IN+%28%271%27%29')
         expected_response = {
             'done': True,
             'records': [{
@@ -114,7 +206,7 @@ class TestRunApexTests(unittest.TestCase):
             'JOB_ID1234567%27')
         expected_response = {
             'done': True,
-            'records': [{'Status': 'Completed'}],
+            'records': [{'Id': 1, 'Status': 'Completed', 'ApexClassId': 1}],
         }
         responses.add(responses.GET, url, match_querystring=True,
             json=expected_response)
@@ -134,6 +226,17 @@ class TestRunApexTests(unittest.TestCase):
             self.project_config, self.task_config, self.org_config)
         task()
         self.assertEqual(len(responses.calls), 4)
+        run = task.history.get_run('abc123')
+        self.assertEqual(
+            run['classes']['TestClass_TEST']['methods']['TestMethod'],
+            {'outcome': 'Pass'},
+        )
+
+    def test_invalid_test_order(self):
+        self.task_config.config['options']['test_order'] = 'random'
+        with self.assertRaises(TaskOptionsError):
+            RunApexTests(
+                self.project_config, self.task_config, self.org_config)
 
 
 @patch('cumulusci.tasks.salesforce.BaseSalesforceTask._update_credentials',
@@ -222,3 +325,305 @@ class TestRunApexTestsDebug(TestRunApexTests):
             self.project_config, self.task_config, self.org_config)
         task()
         self.assertEqual(len(responses.calls), 13)
+
+    @responses.activate
+    def test_get_log_stats(self):
+        log = '\n'.join([
+            '36.0 APEX_CODE,FINEST',
+            '12:00:00.100 (100)|CODE_UNIT_STARTED|[EXTERNAL]|01p|TestClass_TEST.TestMethod',
+            '12:00:01.600 (1600)|CODE_UNIT_FINISHED|TestClass_TEST.TestMethod',
+            '12:00:01.700 (1700)|EXECUTION_FINISHED',
+        ])
+        responses.add(
+            responses.GET,
+            self.base_tooling_url + 'sobjects/ApexLog/07L1/Body',
+            body=log,
+        )
+        debug_log_dir = os.path.join(self.tempdir, 'logs')
+        os.makedirs(debug_log_dir)
+        self.task_config.config['options']['debug_log_dir'] = debug_log_dir
+        task = RunApexTestsDebug(
+            self.project_config, self.task_config, self.org_config)
+
+        method_stats = task._get_log_stats(('07L1', 'TestClass_TEST'))
+
+        self.assertEqual(method_stats['TestMethod']['stats']['duration'], 1.5)
+        with open(os.path.join(debug_log_dir, 'TestClass_TEST.log')) as f:
+            self.assertEqual(f.read(), log + '\n')
+
+
+@patch('cumulusci.tasks.salesforce.BaseSalesforceTask._update_credentials',
+    MagicMock(return_value=None))
+class TestRunApexTestsScheduling(unittest.TestCase):
+
+    def setUp(self):
+        self.api_version = 38.0
+        self.global_config = BaseGlobalConfig(
+            {'project': {'api_version': self.api_version}})
+        self.project_config = BaseProjectConfig(self.global_config)
+        self.project_config.config['project'] = {'package': {
+            'api_version': self.api_version}}
+        keychain = BaseProjectKeychain(self.project_config, '')
+        keychain.set_connected_app(ConnectedAppOAuthConfig())
+        self.project_config.set_keychain(keychain)
+        self.org_config = OrgConfig({
+            'id': 'foo/1',
+            'instance_url': 'example.com',
+            'access_token': 'abc123',
+        })
+        self.base_tooling_url = 'https://{}/services/data/v{}/tooling/'.format(
+            self.org_config.instance_url, self.api_version)
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        project_local_dir = patch.object(
+            BaseProjectConfig, 'project_local_dir', self.tempdir)
+        project_local_dir.start()
+        self.addCleanup(project_local_dir.stop)
+        repo_commit = patch.object(BaseProjectConfig, 'repo_commit', 'abc123')
+        repo_commit.start()
+        self.addCleanup(repo_commit.stop)
+
+    def _mock_shard(self, base_url, classes, job_id, outcome):
+        responses.add(
+            responses.GET,
+            base_url + 'query/?q=SELECT+Id%2C+Name+FROM+ApexClass+WHERE+' +
+            'NamespacePrefix+%3D+null+AND+%28Name+LIKE+%27%25_TEST%27%29',
+            match_querystring=True,
+            json={
+                'done': True,
+                'records': [
+                    {'Id': class_id, 'Name': name}
+                    for class_id, name in classes
+                ],
+                'totalSize': len(classes),
+            },
+        )
+        responses.add(
+            responses.POST,
+            base_url + 'runTestsAsynchronous',
+            json=job_id,
+        )
+        responses.add(
+            responses.GET,
+            base_url + 'query/?q=SELECT+Id%2C+Status%2C+ApexClassId+FROM+' +
+            'ApexTestQueueItem+WHERE+ParentJobId+%3D+%27' + job_id + '%27',
+            match_querystring=True,
+            json={'done': True, 'records': [
+                {'Id': class_id, 'Status': 'Completed', 'ApexClassId': class_id}
+                for class_id, name in classes
+            ]},
+        )
+        responses.add(
+            responses.GET,
+            base_url + 'query/?q=SELECT+StackTrace%2C+Message%2C+ApexLogId' +
+            '%2C+AsyncApexJobId%2C+MethodName%2C+Outcome%2C+ApexClassId%2C+' +
+            'TestTimestamp+FROM+ApexTestResult+WHERE+AsyncApexJobId+%3D+%27' +
+            job_id + '%27+AND+ApexClassId+IN+%28%27' + '%27%2C%27'.join(
+                str(class_id) for class_id, name in classes) + '%27%29',
+            match_querystring=True,
+            json={'done': True, 'records': [{
+                'ApexClassId': classes[0][0],
+                'ApexLogId': None,
+                'Message': None,
+                'MethodName': 'TestMethod',
+                'Outcome': outcome,
+                'StackTrace': None,
+            }]},
+        )
+
+    @responses.activate
+    def test_run_task_sharded(self):
+        shard_org_config = OrgConfig({
+            'id': 'bar/2',
+            'instance_url': 'example2.com',
+            'access_token': 'def456',
+        })
+        self.project_config.keychain.set_org('shard', shard_org_config)
+        shard_tooling_url = 'https://{}/services/data/v{}/tooling/'.format(
+            shard_org_config.instance_url, self.api_version)
+        classes = [(1, 'Other_TEST'), (2, 'TestClass_TEST')]
+        self._mock_shard(self.base_tooling_url, classes, 'JOB1', 'Pass')
+        self._mock_shard(shard_tooling_url, [(3, 'TestClass_TEST'),
+            (4, 'Other_TEST')], 'JOB2', 'Pass')
+        task_config = TaskConfig({'options': {
+            'junit_output': os.path.join(self.tempdir, 'results_junit.xml'),
+            'poll_interval': 1,
+            'shard_orgs': 'shard',
+            'test_name_match': '%_TEST',
+        }})
+
+        task = RunApexTests(self.project_config, task_config, self.org_config)
+        task()
+
+        run_bodies = [
+            call.request.body for call in responses.calls
+            if call.request.url.endswith('runTestsAsynchronous')
+        ]
+        self.assertItemsEqual(
+            run_bodies, ['{"classids": "1"}', '{"classids": "3"}'])
+        self.assertEqual(task.counts['Pass'], 2)
+        with open(task.options['junit_output'], 'r') as f:
+            junit = f.read()
+        self.assertIn('<testsuite tests="2">', junit)
+        self.assertLess(
+            junit.index('classname="Other_TEST"'),
+            junit.index('classname="TestClass_TEST"'),
+        )
+
+    def _mock_coverage(self, class_id, names):
+        responses.add(
+            responses.GET,
+            self.base_tooling_url + 'query/?q=SELECT+ApexTestClassId%2C+' +
+            'ApexClassOrTrigger.Name+FROM+ApexCodeCoverage+WHERE+' +
+            'ApexTestClassId+IN+%28%27{}%27%29'.format(class_id),
+            match_querystring=True,
+            json={'done': True, 'records': [
+                {
+                    'ApexTestClassId': class_id,
+                    'ApexClassOrTrigger': {'Name': name},
+                }
+                for name in names
+            ]},
+        )
+
+    def _get_changed_since_task(self, changed_files, **options):
+        coverage = ApexTestCoverage(
+            os.path.join(self.tempdir, 'apex_test_coverage.json'))
+        coverage.covered_by = {
+            'Bar': set(['Other_TEST']),
+            'Foo': set(['TestClass_TEST']),
+        }
+        coverage.save()
+        task_options = {
+            'changed_since': 'master',
+            'junit_output': os.path.join(self.tempdir, 'results_junit.xml'),
+            'poll_interval': 1,
+            'test_name_match': '%_TEST',
+        }
+        task_options.update(options)
+        patcher = patch(
+            'cumulusci.tasks.salesforce.get_changed_files',
+            MagicMock(return_value=changed_files),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return RunApexTests(
+            self.project_config,
+            TaskConfig({'options': task_options}),
+            self.org_config,
+        )
+
+    def _get_run_bodies(self):
+        return [
+            call.request.body for call in responses.calls
+            if call.request.url.endswith('runTestsAsynchronous')
+        ]
+
+    @responses.activate
+    def test_run_task_changed_since(self):
+        self._mock_shard(self.base_tooling_url, [(2, 'TestClass_TEST'),
+            (1, 'Other_TEST')], 'JOB1', 'Pass')
+        self._mock_coverage(2, ['Foo', 'Baz'])
+        task = self._get_changed_since_task(
+            ['src/classes/Foo.cls', 'src/classes/Foo.cls-meta.xml'])
+        task()
+
+        self.assertEqual(self._get_run_bodies(), ['{"classids": "2"}'])
+        coverage = task._get_coverage_store()
+        self.assertEqual(coverage.covered_by, {
+            'Bar': set(['Other_TEST']),
+            'Baz': set(['TestClass_TEST']),
+            'Foo': set(['TestClass_TEST']),
+        })
+        self.assertEqual(coverage.runs_since_full, 1)
+
+    @responses.activate
+    def test_run_task_changed_since_no_impact(self):
+        self._mock_shard(self.base_tooling_url, [(2, 'TestClass_TEST'),
+            (1, 'Other_TEST')], 'JOB1', 'Pass')
+        task = self._get_changed_since_task(['README.md'])
+        task()
+
+        self.assertEqual(self._get_run_bodies(), [])
+
+    @responses.activate
+    def test_run_task_changed_since_unknown_coverage(self):
+        self._mock_shard(self.base_tooling_url, [(2, 'TestClass_TEST')],
+            'JOB1', 'Pass')
+        self._mock_coverage(2, ['Foo'])
+        task = self._get_changed_since_task(['src/triggers/New.trigger'])
+        task()
+
+        self.assertEqual(self._get_run_bodies(), ['{"classids": "2"}'])
+        self.assertEqual(task._get_coverage_store().runs_since_full, 0)
+
+    @responses.activate
+    def test_run_task_changed_since_full_run_every(self):
+        self._mock_shard(self.base_tooling_url, [(2, 'TestClass_TEST')],
+            'JOB1', 'Pass')
+        self._mock_coverage(2, ['Foo'])
+        task = self._get_changed_since_task(
+            ['src/classes/Bar.cls'], full_run_every=1)
+        coverage = task._get_coverage_store()
+        coverage.runs_since_full = 1
+        coverage.save()
+        task()
+
+        self.assertEqual(self._get_run_bodies(), ['{"classids": "2"}'])
+        self.assertEqual(task._get_coverage_store().covered_by, {
+            'Bar': set(['Other_TEST']),
+            'Foo': set(['TestClass_TEST']),
+        })
+
+    @responses.activate
+    def test_wait_for_tests_streams_results(self):
+        queue_query = (self.base_tooling_url + 'query/?q=SELECT+Id%2C+' +
+            'Status%2C+ApexClassId+FROM+ApexTestQueueItem+WHERE+ParentJobId' +
+            '+%3D+%27JOB1%27')
+        responses.add(responses.GET, queue_query, match_querystring=True,
+            json={'done': True, 'records': [
+                {'Id': '7091', 'Status': 'Completed', 'ApexClassId': 1},
+                {'Id': '7092', 'Status': 'Processing', 'ApexClassId': 2},
+            ]})
+        responses.add(
+            responses.GET,
+            queue_query + '+AND+Status+IN+%28%27Holding%27%2C%27Queued%27' +
+            '%2C%27Preparing%27%2C%27Processing%27%29',
+            match_querystring=True,
+            json={'done': True, 'records': []},
+        )
+        for class_id, outcome in [(1, 'Pass'), (2, 'Fail')]:
+            responses.add(
+                responses.GET,
+                self.base_tooling_url + 'query/?q=SELECT+StackTrace%2C+' +
+                'Message%2C+ApexLogId%2C+AsyncApexJobId%2C+MethodName%2C+' +
+                'Outcome%2C+ApexClassId%2C+TestTimestamp+FROM+' +
+                'ApexTestResult+WHERE+AsyncApexJobId+%3D+%27JOB1%27+AND+' +
+                'ApexClassId+IN+%28%27{}%27%29'.format(class_id),
+                match_querystring=True,
+                json={'done': True, 'records': [{
+                    'ApexClassId': class_id,
+                    'ApexLogId': None,
+                    'Message': None,
+                    'MethodName': 'TestMethod',
+                    'Outcome': outcome,
+                    'StackTrace': None,
+                }]},
+            )
+        task = RunApexTests(self.project_config, TaskConfig({'options': {
+            'poll_interval': 0,
+            'test_name_match': '%_TEST',
+        }}), self.org_config)
+        task._init_task()
+        task.job_id = 'JOB1'
+        task.classes_by_id = {1: 'Other_TEST', 2: 'TestClass_TEST'}
+        task.results_by_class_name = {'Other_TEST': {}, 'TestClass_TEST': {}}
+
+        task._wait_for_tests()
+
+        self.assertEqual(len(responses.calls), 4)
+        self.assertEqual(task.counts['Pass'], 1)
+        self.assertEqual(task.counts['Fail'], 1)
+        self.assertEqual(
+            task.results_by_class_name['TestClass_TEST']['TestMethod']
+            ['Outcome'], 'Fail')
@@ -0,0 +1,59 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from cumulusci.utils import extract_zip
+
+
+class TestExtractZip(unittest.TestCase):
+
+    def setUp(self):
+        self.target = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.target)
+
+    def _create_zip(self, members):
+        zip_content = io.BytesIO()
+        zip_file = zipfile.ZipFile(zip_content, 'w')
+        for name, content in members:
+            zip_file.writestr(name, content)
+        zip_file.close()
+        zip_content.seek(0)
+        return zipfile.ZipFile(zip_content)
+
+    def _read(self, *path):
+        with open(os.path.join(self.target, *path), 'rb') as f:
+            return f.read()
+
+    def test_extract_all(self):
+        zip_file = self._create_zip([
+            ('package.xml', 'package'),
+            ('classes/Test.cls', 'class'),
+        ])
+        extract_zip(zip_file, self.target)
+        self.assertEquals(self._read('package.xml'), 'package')
+        self.assertEquals(self._read('classes', 'Test.cls'), 'class')
+
+    def test_extract_subfolder(self):
+        zip_file = self._create_zip([
+            ('unpackaged/', ''),
+            ('unpackaged/package.xml', 'package'),
+            ('unpackaged/classes/Test.cls', 'class'),
+            ('other/package.xml', 'other'),
+        ])
+        extract_zip(zip_file, self.target, 'unpackaged')
+        self.assertEquals(self._read('package.xml'), 'package')
+        self.assertEquals(self._read('classes', 'Test.cls'), 'class')
+        self.assertFalse(os.path.exists(os.path.join(self.target, 'other')))
+
+    def test_skip_outside_target(self):
+        zip_file = self._create_zip([
+            ('../escaped.txt', 'escaped'),
+            ('package.xml', 'package'),
+        ])
+        extract_zip(zip_file, self.target)
+        self.assertEquals(os.listdir(self.target), ['package.xml'])
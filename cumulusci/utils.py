@@ -1,13 +1,17 @@
 import fnmatch
 import os
 import re
+import shutil
 import StringIO
+import tempfile
 import zipfile
 
 import requests
 
 from xml.etree.ElementTree import ElementTree
 
+from cumulusci.core.manifest import PackageManifest
+
 CUMULUSCI_PATH = os.path.realpath(
     os.path.join(
         os.path.dirname(
@@ -76,19 +80,58 @@ def removeXmlElement(name,directory,file_pattern,logger=None):
 
             tree.write(filepath, encoding="UTF-8", default_namespace='http://soap.sforce.com/2006/04/metadata')
 
+ZIP_SPOOL_SIZE = 10 * 1024 * 1024
+
 def download_extract_zip(url, target, subfolder=None):
-    resp = requests.get(url)
-    zip_content = StringIO.StringIO(resp.content)
+    resp = requests.get(url, stream=True)
+    zip_content = tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_SIZE)
+    for chunk in resp.iter_content(64 * 1024):
+        zip_content.write(chunk)
+    zip_content.seek(0)
     zip_file = zipfile.ZipFile(zip_content)
 
+    extract_zip(zip_file, target, subfolder)
+
+def extract_zip(zip_src, target, subfolder=None):
+    """ Extracts a zip file's members into target one at a time
+
+    If subfolder is provided, only members under subfolder are extracted
+    and the subfolder prefix is stripped from their paths.  Each member is
+    streamed to disk so memory use doesn't grow with the size of the zip.
+    """
+    prefix = ''
     if subfolder:
-        zip_file = zip_subfolder(zip_file, subfolder)
-   
-    #pwd = os.getcwd()
-    #os.chdir(target) 
-    zip_file.extractall(target)
+        prefix = subfolder
+        if not prefix.endswith('/'):
+            prefix = prefix + '/'
+
+    for name in zip_src.namelist():
+        if not name.startswith(prefix):
+            continue
+        rel_name = name[len(prefix):]
+        if not rel_name:
+            continue
+
+        rel_path = os.path.normpath(rel_name)
+        if os.path.isabs(rel_path) or rel_path.split(os.sep)[0] == '..':
+            # Skip members that would be written outside of target
+            continue
+        path = os.path.join(target, rel_path)
+
+        if name.endswith('/'):
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            continue
 
-    #os.chdir(pwd)
+        parent = os.path.dirname(path)
+        if parent and not os.path.isdir(parent):
+            os.makedirs(parent)
+        src = zip_src.open(name)
+        try:
+            with open(path, 'wb') as f:
+                shutil.copyfileobj(src, f)
+        finally:
+            src.close()
 
 def zip_subfolder(zip_src, path):
     if not path.endswith('/'):
@@ -134,32 +177,5 @@ def doc_task(task_name, task_config, project_config=None, org_config=None):
     return '\n'.join(doc)
 
 def package_xml_from_dict(items, api_version, package_name=None):
-        lines = []
-
-        # Print header
-        lines.append(u'<?xml version="1.0" encoding="UTF-8"?>')
-        lines.append(u'<Package xmlns="http://soap.sforce.com/2006/04/metadata">')
-
-        # Include package name if specified
-        if package_name:
-            lines.append('    <fullName>{}</fullName'.format(package_name))
-
-        # Print types sections
-        md_types = items.keys()
-        md_types.sort()
-        for md_type in md_types:
-            members = items[md_type]
-            members.sort()
-            lines.append('    <types>')
-            for member in members:
-                lines.append('        <members>{}</members>'.format(member))
-            lines.append('        <name>{}</name>'.format(md_type))
-            lines.append('    </types>')
-
-        # Print footer
-        lines.append(u'    <version>{0}</version>'.format(
-            api_version
-        ))
-        lines.append(u'</Package>')
-
-        return u'\n'.join(lines)
+    manifest = PackageManifest(items, api_version, package_name)
+    return manifest.render()